@@ -11,11 +11,15 @@ import numpy as np
 import pywt
 from dwt_tiled_separable_parallel import *
 import os
+import matplotlib as mpl
+mpl.use('agg')
 import matplotlib.pyplot as plt
 import os, os.path
-import matplotlib.image as mpimg
 import pywt.data
-from PIL import Image
+from dwt_dataset_store import *
+from dwt_vectorized_separable import *
+from dwt_workspace import *
+import dwt_trace
 
 # Data set specifications (750 images total):
 # Square .jpg images ranging from 100x100 to 1000x1000 in set of 25 per 100 pixel increments (250 total)
@@ -24,63 +28,10 @@ from PIL import Image
 #file path assuming images are stored in same directory as project
 projdir = os.getcwd()
 
-#create list to hold rgb_images
-imgs = []
-
-#Load every image into python
-for i in range(30):
-    
-    #decide which type of image (square, rect wide, rect tall) to load and load image into RGB components
-    if(i<10):
-        #square
-        #get directory dimension value
-        dimdir = str(np.int32((i+1)*100))
-        
-        #load rgb matrix into list
-        path = projdir+'/images/square/square'+dimdir+'/'
-        valid_images = [".jpg"]
-        for f in os.listdir(path):
-            ext = os.path.splitext(f)[1]
-            #ignore non-image files
-            if ext.lower() not in valid_images:
-                continue
-            #append image list
-            cur_img =mpimg.imread(os.path.join(path,f))
-            imgs.append(cur_img)
-        
-    if 10 <= i and i < 20:
-        #rect wide         
-        #get directory dimension value
-        dimdir = str(np.int32((i+1-10)*100))
-                        
-        #load rgb matrix into list
-        path = projdir+'/images/rect_wide/rect'+dimdir+'/'
-        valid_images = [".jpg"]
-        for f in os.listdir(path):
-            ext = os.path.splitext(f)[1]
-            #ignore non-image files
-            if ext.lower() not in valid_images:
-                continue
-            #append image list
-            cur_img =mpimg.imread(os.path.join(path,f))
-            imgs.append(cur_img)
-        
-    if i >= 20:
-        #rect tall
-        #get directory dimension value
-        dimdir = str(np.int32((i+1-20)*100))
-                        
-        #load rgb matrix into list
-        path = projdir+'/images/rect_tall/rect'+dimdir+'/'
-        valid_images = [".jpg"]
-        for f in os.listdir(path):
-            ext = os.path.splitext(f)[1]
-            #ignore non-image files
-            if ext.lower() not in valid_images:
-                continue
-            #append image list
-            cur_img =mpimg.imread(os.path.join(path,f))
-            imgs.append(cur_img)
+#the images are decoded once into a memory-mapped store (rebuilt when the files in images change) and handed out as
+#views of it, so neither decoding nor a list of decoded images is needed (see dwt_dataset_store.py)
+imgdir = os.path.join(projdir, 'images')
+store = DatasetStore(imgdir)
 
 # Define the coefficients for the CDF9/7 filters
 factor = 1
@@ -129,18 +80,25 @@ temp_til = 0
 #analysis with varying block width
 BLOCK_WIDTH = 32
 
-#for each image in our grand list
-for i in range(750):
+#CPU engine and its buffers, reused across the images of the same shape
+dwt_cpu = DWT_vectorized_separable()
+cpu_workspace = DWT_workspace()
+
+#for each image in our data set, in the order square, rect wide, rect tall and by increasing size
+for i, (shape_class, size_dir, img_path, img) in enumerate(store.iter_images()):
+    #start of the trace event covering the whole image (only recorded when tracing is on, e.g. DWT_TRACE=trace.json)
+    image_start = time.perf_counter_ns()
     
     #decompose image into RGB
-    # normalize every image by dividing by 255
-    rgb_cpu = imgs[i].astype(np.float32)/255
-    rsig = np.ascontiguousarray(rgb_cpu[:,:,0], dtype=np.float32)
-    gsig = np.ascontiguousarray(rgb_cpu[:,:,1], dtype=np.float32)
-    bsig = np.ascontiguousarray(rgb_cpu[:,:,2], dtype=np.float32)
+    #the CUDA kernels upload contiguous float32 planes, so the channels are split and normalized by 255 in a single
+    #conversion pass (instead of a float32 copy of the image, its division by 255 and three contiguous channel copies)
+    with dwt_trace.span('split_channels', 'convert', shape=img.shape):
+        planes = np.empty((3,) + img.shape[:2], dtype=np.float32)
+        np.multiply(np.moveaxis(img, -1, 0), np.float32(1/255), out=planes)
+        rsig, gsig, bsig = planes
     
     #get matrix size
-    size = rgb_cpu.shape[0]*rgb_cpu.shape[1]
+    size = img.shape[0]*img.shape[1]
     
     """
     1. Test serial with r,g,b components of image.
@@ -154,7 +112,7 @@ for i in range(750):
     bcA, bcH, bcV, bcD, serial_time_b = run_DWT(bsig, wav, False, mode='zero')
     
     #concatenate serial execution times and average to get a final value for execution time across 2D dwts per matrix size
-    serial_time = serial_time_r + serial_time_g + serial_time_b
+    serial_time = (serial_time_r + serial_time_g + serial_time_b).total_time
     temp_s = temp_s + serial_time
     if(np.mod((i+1),25)==0):
         #append arrays holding serial times and size results (separate squares and rectangles)
@@ -193,9 +151,9 @@ for i in range(750):
     bh_cAt, bh_cHt, bh_cVt, bh_cDt, kernel_time_tb = dwt_tiled.dwt_gpu_tiled_separable(bsig, filters, BLOCK_WIDTH)
     
     #concatenate kernel execution times and average to get a final value for execution time across 2D dwts per matrix size
-    temp_naive = temp_naive + kernel_time_r + kernel_time_g + kernel_time_b
-    temp_o = temp_o + kernel_time_or + kernel_time_og + kernel_time_ob
-    temp_til = temp_til + kernel_time_tr + kernel_time_tg + kernel_time_tb
+    temp_naive = temp_naive + (kernel_time_r + kernel_time_g + kernel_time_b).total_time
+    temp_o = temp_o + (kernel_time_or + kernel_time_og + kernel_time_ob).total_time
+    temp_til = temp_til + (kernel_time_tr + kernel_time_tg + kernel_time_tb).total_time
     if(np.mod((i+1),25)==0):
         #append arrays holding kernel times and size results (separate squares and rectangles)
         if(rsig.shape[0] == rsig.shape[1]):
@@ -214,6 +172,10 @@ for i in range(750):
         temp_o = 0
         temp_til = 0
 
+    #CPU engine reading the interleaved uint8 image in place: no channel copies and the 1/255 normalization is folded
+    #into the row pass
+    rgb_cA, rgb_cH, rgb_cV, rgb_cD, cpu_time = dwt_cpu.dwt_cpu_batched(img, filters, layout='HWC', workspace=cpu_workspace)
+
     #print outputs and timing results
     print('\nnaive same as serial rc_A: {}'.format(np.allclose(rcA, rh_cA, atol=5e-7)))
     print('naive same as serial rc_H: {}'.format(np.allclose(rcH, rh_cH, atol=5e-7)))
@@ -253,11 +215,16 @@ for i in range(750):
     print('tiled same as serial bc_H: {}'.format(np.allclose(bcH, bh_cHt, atol=5e-7)))
     print('tiled same as serial bc_V: {}'.format(np.allclose(bcV, bh_cVt, atol=5e-7)))
     print('tiled same as serial bc_D: {}'.format(np.allclose(bcD, bh_cDt, atol=5e-7)))
+    print('cpu HWC same as serial c_A: {}'.format(all(np.allclose(c, rgb_cA[k], atol=5e-6) for k, c in enumerate((rcA, gcA, bcA)))))
+    print('cpu HWC same as serial c_H: {}'.format(all(np.allclose(c, rgb_cH[k], atol=5e-6) for k, c in enumerate((rcH, gcH, bcH)))))
+    print('cpu HWC same as serial c_V: {}'.format(all(np.allclose(c, rgb_cV[k], atol=5e-6) for k, c in enumerate((rcV, gcV, bcV)))))
+    print('cpu HWC same as serial c_D: {}'.format(all(np.allclose(c, rgb_cD[k], atol=5e-6) for k, c in enumerate((rcD, gcD, bcD)))))
     
     print('Serial time: {}'.format(serial_time))
-    print('Naive time: {}'.format(kernel_time_r + kernel_time_g + kernel_time_b))
-    print('nonseparable time: {}'.format(kernel_time_or + kernel_time_og + kernel_time_ob))
-    print('Tiled time: {}'.format(kernel_time_tr + kernel_time_tg + kernel_time_tb))
+    print('Naive time: {}'.format((kernel_time_r + kernel_time_g + kernel_time_b).total_time))
+    print('nonseparable time: {}'.format((kernel_time_or + kernel_time_og + kernel_time_ob).total_time))
+    print('Tiled time: {}'.format((kernel_time_tr + kernel_time_tg + kernel_time_tb).total_time))
+    print('CPU HWC time: {}'.format(cpu_time.total_time))
     
     #output images to display
     if i == 99:
@@ -277,7 +244,10 @@ for i in range(750):
         approx_img[:,:,1] = approx_imgg
         approx_img[:,:,2] = approx_imgb
         plt.imsave("Results/approximation_image.png",approx_img)
-        plt.imsave("Results/original_image.png",imgs[i])
+        plt.imsave("Results/original_image.png",img)
+
+    if dwt_trace.tracer is not None:
+        dwt_trace.tracer.add('image', 'benchmark', image_start, time.perf_counter_ns(), {'path': img_path})
     
 #save timing results
 plt.figure()
@@ -124,15 +124,15 @@ for L in np.arange(1, L_max + 1, 1):
             and np.allclose(cV_i, h_cVo_i, atol=5e-7) and np.allclose(cD_i, h_cDo_i, atol=5e-7):
         raise Exception('Tiled parallel outputs not same as serial')
 
-    print('\nSerial time: {}'.format(serial_time_i))
-    print('Parallel time: {}'.format(kernel_time_i))
-    print('Tiled parallel time: {}'.format(kernel_time_tiled_i))
-    print('Non-separable parallel time: {}'.format(kernel_time_o_i))
-
-    vec_serial_time.append(serial_time_i)
-    vec_kernel_time.append(kernel_time_i)
-    vec_kernel_time_tiled.append(kernel_time_tiled_i)
-    vec_kernel_time_nonseparable.append(kernel_time_o_i)
+    print('\nSerial time: {}'.format(serial_time_i.total_time))
+    print('Parallel time: {}'.format(kernel_time_i.total_time))
+    print('Tiled parallel time: {}'.format(kernel_time_tiled_i.total_time))
+    print('Non-separable parallel time: {}'.format(kernel_time_o_i.total_time))
+
+    vec_serial_time.append(serial_time_i.total_time)
+    vec_kernel_time.append(kernel_time_i.total_time)
+    vec_kernel_time_tiled.append(kernel_time_tiled_i.total_time)
+    vec_kernel_time_nonseparable.append(kernel_time_o_i.total_time)
 
 # Plotting and saving the figures
 plt.figure()
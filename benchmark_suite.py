@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+#Parametrized benchmark of the DWT engines (engine x shape x dtype x threads) with JSON results and a regression check.
+
+import argparse
+import json
+import numpy as np
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import dwt_trace
+from dwt_benchmark import DTYPES, cdf97_filters, make_input, parse_shape, run_case
+from dwt_metrics import registry
+from dwt_serial import gen_wavelet, run_DWT
+
+# Version of the layout of the result files
+RESULTS_VERSION = 1
+
+# Engines the suite knows about, the CUDA ones are only imported when selected
+CPU_ENGINES = ('serial', 'vectorized', 'tiled', 'multiprocess', 'streaming', 'fft', 'nonseparable', 'lifting')
+GPU_ENGINES = ('gpu_naive', 'gpu_tiled', 'gpu_nonseparable')
+ENGINES = CPU_ENGINES + GPU_ENGINES
+
+# Engines taking a thread (or process) count, the others are run once per case with threads = 1
+THREADED_ENGINES = ('tiled', 'multiprocess')
+
+# Relative slowdown of the compared statistic above which a case is flagged as a regression
+DEFAULT_TOLERANCE = 0.10
+
+# Block width of the CUDA kernels
+BLOCK_WIDTH = 32
+
+# Modules timed by the import check, the CUDA engines included, and the dependencies only the engines using them import
+IMPORT_MODULES = ('dwt_serial', 'dwt_vectorized_separable', 'dwt_vectorized_inverse', 'dwt_tiled_cpu',
+                  'dwt_multiprocess_cpu', 'dwt_streaming', 'dwt_fft', 'dwt_nonseparable_cpu', 'dwt_lifting',
+                  'dwt_multilevel', 'dwt_image_loader', 'dwt_dataset_store', 'dwt_dispatch',
+                  'dwt_naive_separable_parallel', 'dwt_tiled_separable_parallel', 'dwt_nonseparable_parallel')
+LAZY_DEPENDENCIES = ('pycuda', 'matplotlib', 'PIL', 'pywt')
+
+# Seconds the import of IMPORT_MODULES may take in a fresh interpreter
+DEFAULT_IMPORT_BUDGET = 1.0
+
+# Run by a fresh interpreter: time the imports and list the lazy dependencies they loaded
+_IMPORT_SCRIPT = '''
+import importlib, json, sys, time
+start = time.perf_counter()
+for name in {modules!r}:
+    importlib.import_module(name)
+print(json.dumps({{'seconds': time.perf_counter() - start,
+                  'loaded': [name for name in {lazy!r} if name in sys.modules]}}))
+'''
+
+
+def make_engine(name, threads=1):
+    """
+    Build an engine of the suite
+
+    :param: name: one of ENGINES
+    :param: threads: number of threads (tiled) or processes (multiprocess), ignored by the other engines
+
+    :return: run: function (h_input, filters, workspace) -> DWT_timing of one call
+    :return: close: function releasing the resources of the engine (threads, processes), or None
+    """
+    if name == 'serial':
+        wav = gen_wavelet()
+        return lambda h_input, filters, workspace: run_DWT(h_input, wav)[4], None
+    if name == 'vectorized':
+        from dwt_vectorized_separable import DWT_vectorized_separable
+        engine = DWT_vectorized_separable().dwt_cpu_vectorized_separable
+    elif name == 'tiled':
+        from dwt_tiled_cpu import DWT_tiled_cpu
+        engine = DWT_tiled_cpu(n_threads=threads).dwt_cpu_tiled
+    elif name == 'multiprocess':
+        from dwt_multiprocess_cpu import DWT_multiprocess_cpu
+        dwt_multiprocess = DWT_multiprocess_cpu(n_processes=threads)
+        return (lambda h_input, filters, workspace: dwt_multiprocess.dwt_cpu_multiprocess(
+            h_input, filters, workspace=workspace)[4], dwt_multiprocess.close)
+    elif name == 'streaming':
+        from dwt_streaming import DWT_streaming
+        engine = DWT_streaming().dwt_cpu_streaming
+    elif name == 'fft':
+        from dwt_fft import DWT_fft_separable
+        engine = DWT_fft_separable().dwt_cpu_fft
+    elif name == 'nonseparable':
+        from dwt_nonseparable_cpu import DWT_nonseparable_cpu, filter_bank
+        dwt_nonseparable = DWT_nonseparable_cpu()
+
+        # A separable bank would be routed to the separable engine, so a small non-separable term is added to time
+        # the polyphase path itself
+        def run(h_input, filters, workspace):
+            bank = filter_bank(filters) + np.float32(1e-3) * np.eye(filters.shape[1], dtype=np.float32)
+            return dwt_nonseparable.dwt_cpu_nonseparable(h_input, bank, workspace=workspace)[4]
+        return run, None
+    elif name == 'lifting':
+        from dwt_lifting import DWT_lifting
+        engine = DWT_lifting().dwt_cpu_lifting
+    elif name == 'gpu_naive':
+        from dwt_naive_separable_parallel import DWT_naive_separable
+        engine = DWT_naive_separable().dwt_gpu_naive_separable
+    elif name == 'gpu_tiled':
+        from dwt_tiled_separable_parallel import DWT_tiled_separable
+        engine = DWT_tiled_separable().dwt_gpu_tiled_separable
+    elif name == 'gpu_nonseparable':
+        from dwt_nonseparable_parallel import DWT_nonseparable
+        engine = DWT_nonseparable().dwt_gpu_nonseparable
+    else:
+        raise ValueError("Unknown engine '{}', expected one of {}".format(name, ENGINES))
+    return lambda h_input, filters, workspace: engine(h_input, filters, BLOCK_WIDTH, workspace=workspace)[4], None
+
+
+def case_key(result):
+    """
+    :return: (engine, shape, dtype, threads) identifying a case across result files
+    """
+    return result['engine'], tuple(result['shape']), result['dtype'], result['threads']
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(engines=CPU_ENGINES, shapes=((512, 512), (1024, 1024)), dtypes=('float32',), threads=(1,), warmup=2,
+              trials=10, filters=None, verbose=True):
+    """
+    Run every combination of engine, shape, dtype and thread count
+
+    :param: engines: names from ENGINES
+    :param: shapes: list of (M, N)
+    :param: dtypes: names from DTYPES
+    :param: threads: thread counts, only applied to THREADED_ENGINES
+    :param: warmup: number of untimed calls per case
+    :param: trials: number of timed calls per case
+    :param: filters: filter stack of shape (4, maskwidth) (CDF9/7 if not given)
+    :param: verbose: print each case as it completes
+
+    :return: results in the layout written by save_results
+    """
+    if filters is None:
+        filters = cdf97_filters()
+    results = []
+    for name in engines:
+        for n_threads in (threads if name in THREADED_ENGINES else (1,)):
+            run, close = make_engine(name, n_threads)
+            try:
+                for shape in shapes:
+                    for dtype in dtypes:
+                        result = {'engine': name, 'shape': list(shape), 'dtype': dtype, 'threads': n_threads}
+                        with dwt_trace.span('case', 'benchmark', **result):
+                            result.update(run_case(run, make_input(shape, dtype), filters, warmup, trials))
+                        result['mpix_per_s'] = shape[0] * shape[1] / result['median_s'] * 1e-6
+                        results.append(result)
+                        if verbose:
+                            print('{:<16} {:>11} {:<8} threads {:<3} median {:.6f} s  p95 {:.6f} s  min {:.6f} s  '
+                                  '{:.1f} Mpix/s'.format(name, '{}x{}'.format(*shape), dtype, n_threads,
+                                                          result['median_s'], result['p95_s'], result['min_s'],
+                                                          result['mpix_per_s']))
+            finally:
+                if close is not None:
+                    close()
+
+    return {'version': RESULTS_VERSION,
+            'meta': {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'git': _git_revision(),
+                     'python': sys.version.split()[0], 'numpy': np.__version__, 'platform': platform.platform(),
+                     'cpu_count': os.cpu_count()},
+            'config': {'warmup': warmup, 'trials': trials, 'maskwidth': int(filters.shape[1])},
+            'results': results}
+
+
+def save_results(results, path):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=1)
+
+
+def load_results(path):
+    with open(path) as f:
+        results = json.load(f)
+    if results.get('version') != RESULTS_VERSION:
+        raise ValueError('{} holds results of version {}, expected {}'.format(path, results.get('version'),
+                                                                              RESULTS_VERSION))
+    return results
+
+
+def compare_results(baseline, current, tolerance=DEFAULT_TOLERANCE, stat='median_s'):
+    """
+    Compare the cases of two result sets
+
+    :param: baseline: results of the reference run
+    :param: current: results of the run being checked
+    :param: tolerance: relative slowdown above which a case is a regression (and speedup of the same ratio above which
+            it is an improvement)
+    :param: stat: statistic compared, 'median_s', 'p95_s' or 'min_s'
+
+    :return: list of (key, baseline time, current time, current / baseline, status) with status 'regression',
+             'improvement', 'ok', 'new' (only in current) or 'missing' (only in baseline)
+    """
+    base = {case_key(result): result[stat] for result in baseline['results']}
+    cur = {case_key(result): result[stat] for result in current['results']}
+    rows = []
+    for key in list(base) + [key for key in cur if key not in base]:
+        if key not in cur:
+            rows.append((key, base[key], None, None, 'missing'))
+        elif key not in base:
+            rows.append((key, None, cur[key], None, 'new'))
+        else:
+            ratio = cur[key] / base[key]
+            if ratio > 1 + tolerance:
+                status = 'regression'
+            elif ratio < 1 / (1 + tolerance):
+                status = 'improvement'
+            else:
+                status = 'ok'
+            rows.append((key, base[key], cur[key], ratio, status))
+    return rows
+
+
+def print_comparison(rows):
+    for (name, shape, dtype, n_threads), base, cur, ratio, status in rows:
+        print('{:<16} {:>11} {:<8} threads {:<3} {:>12} {:>12} {:>8} {}'.format(
+            name, '{}x{}'.format(*shape), dtype, n_threads, '-' if base is None else '{:.6f}'.format(base),
+            '-' if cur is None else '{:.6f}'.format(cur), '-' if ratio is None else '{:.3f}'.format(ratio), status))
+
+
+def measure_imports(modules=IMPORT_MODULES, trials=3):
+    """
+    Time the import of the modules in fresh interpreters, as a process without a GPU starting up
+
+    :param: modules: names of the modules imported
+    :param: trials: number of interpreters, the median time is kept
+
+    :return: {'seconds': median import time, 'loaded': LAZY_DEPENDENCIES imported by the modules}
+    """
+    script = _IMPORT_SCRIPT.format(modules=tuple(modules), lazy=LAZY_DEPENDENCIES)
+    runs = [json.loads(subprocess.check_output([sys.executable, '-c', script],
+                                               cwd=os.path.dirname(os.path.abspath(__file__))))
+            for _ in range(trials)]
+    return {'seconds': float(np.median([run['seconds'] for run in runs])),
+            'loaded': sorted({name for run in runs for name in run['loaded']})}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark of the DWT engines')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='run the benchmark and write the results to JSON')
+    run_parser.add_argument('--engines', nargs='+', choices=ENGINES, default=list(CPU_ENGINES))
+    run_parser.add_argument('--shapes', nargs='+', type=parse_shape, default=[(512, 512), (1024, 1024)])
+    run_parser.add_argument('--dtypes', nargs='+', choices=DTYPES, default=['float32'])
+    run_parser.add_argument('--threads', nargs='+', type=int, default=[1, os.cpu_count() or 1])
+    run_parser.add_argument('--warmup', type=int, default=2)
+    run_parser.add_argument('--trials', type=int, default=10)
+    run_parser.add_argument('--out', default='benchmark_results.json')
+    run_parser.add_argument('--trace', help='also write a Chrome trace of the run to this file')
+    run_parser.add_argument('--metrics', help='also write the totals of the metrics registry to this file (.json for '
+                                              'JSON, else Prometheus text)')
+
+    compare_parser = commands.add_parser('compare', help='flag the regressions of a result file against a baseline')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    compare_parser.add_argument('--stat', choices=('median_s', 'p95_s', 'min_s'), default='median_s')
+
+    imports_parser = commands.add_parser('imports', help='check the import time of the engines and that they import '
+                                                         'no optional dependency')
+    imports_parser.add_argument('--budget', type=float, default=DEFAULT_IMPORT_BUDGET, help='seconds')
+    imports_parser.add_argument('--trials', type=int, default=3)
+
+    args = parser.parse_args(argv)
+    if args.command == 'imports':
+        res = measure_imports(trials=args.trials)
+        print('Import of {} modules: {:.3f} s (budget {:.3f} s), optional dependencies loaded: {}'.format(
+            len(IMPORT_MODULES), res['seconds'], args.budget, ', '.join(res['loaded']) or 'none'))
+        return 1 if res['seconds'] > args.budget or res['loaded'] else 0
+    if args.command == 'run':
+        if args.trace:
+            dwt_trace.start_tracing()
+        results = run_suite(args.engines, args.shapes, args.dtypes, sorted(set(args.threads)), args.warmup,
+                            args.trials)
+        save_results(results, args.out)
+        print('Results written to {}'.format(args.out))
+        if args.trace:
+            dwt_trace.stop_tracing(args.trace)
+            print('Trace written to {}'.format(args.trace))
+        if args.metrics:
+            registry.dump(args.metrics)
+            print('Metrics written to {}'.format(args.metrics))
+        return 0
+
+    rows = compare_results(load_results(args.baseline), load_results(args.current), args.tolerance, args.stat)
+    print_comparison(rows)
+    regressions = sum(row[4] == 'regression' for row in rows)
+    print('{} regression(s) above {:.0%}'.format(regressions, args.tolerance))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+#Autotuner of the tile, strip and block parameters of the DWT engines, the winners are saved to a local tuning file.
+
+import argparse
+import itertools
+import json
+import math
+import numpy as np
+import os
+import tempfile
+import time
+
+# Tuning file, can be overridden with the DWT_TUNING_FILE variable
+DEFAULT_TUNING_FILE = os.path.join(os.path.expanduser('~'), '.cache', 'dwt_tuning.json')
+
+# Version of the layout of the tuning file, entries of another version are ignored
+TUNING_VERSION = 1
+
+# Block width of the CUDA kernels when none is given and none is tuned
+DEFAULT_BLOCK_WIDTH = 16
+
+# Engines with tunable parameters (named as in benchmark_suite.py)
+TUNABLE_ENGINES = ('tiled', 'multiprocess', 'gpu_naive', 'gpu_tiled', 'gpu_nonseparable')
+
+
+def shape_bucket(shape):
+    """
+    :param: shape: (M, N) of an image
+    :return: (M, N) with each dimension rounded to the nearest power of two, so that the shapes of a bucket share
+             their tuned parameters
+    """
+    return tuple(1 << max(0, int(round(math.log2(max(dim, 1))))) for dim in shape[:2])
+
+
+def tuning_key(engine, shape, dtype):
+    """
+    :return: key of the (engine, shape bucket, dtype) entry of the tuning file, e.g. 'tiled:1024x2048:float32', or
+             of the entry of the engine alone if shape is None
+    """
+    if shape is None:
+        return engine
+    return '{}:{}x{}:{}'.format(engine, *shape_bucket(shape), np.dtype(dtype).name)
+
+
+class DWT_tuning:
+    def __init__(self, path=None):
+        """
+        Tuned parameters of the engines for each (engine, shape bucket, dtype), kept in a JSON file
+
+        The file is read on the first lookup, so a process only sees the entries saved before it first ran an engine
+        (see reload)
+
+        :param: path: tuning file, None for the default and False for no file (nothing is tuned)
+        """
+        if path is None:
+            path = os.environ.get('DWT_TUNING_FILE', DEFAULT_TUNING_FILE)
+        self.path = path
+        self.entries = None
+
+    def reload(self):
+        """
+        Read the tuning file again, a missing or unreadable file holds no entries
+        """
+        self.entries = {}
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                tuning = json.load(f)
+        except (OSError, ValueError):
+            return
+        if tuning.get('version') == TUNING_VERSION:
+            self.entries = tuning.get('entries', {})
+
+    def lookup(self, engine, shape, dtype):
+        """
+        :return: the tuned keyword parameters of an engine for an input of this shape and dtype ({} if not tuned), or
+                 the parameters not tied to a shape if shape is None
+        """
+        if self.entries is None:
+            self.reload()
+        entry = self.entries.get(tuning_key(engine, shape, dtype))
+        return entry['params'] if entry is not None else {}
+
+    def store(self, engine, shape, dtype, params, seconds):
+        """
+        Set the parameters of an (engine, shape bucket, dtype), or of the engine alone if shape is None, call save to
+        write them
+
+        :param: params: keyword parameters of the engine
+        :param: seconds: median total time they were measured at
+        """
+        if self.entries is None:
+            self.reload()
+        self.entries[tuning_key(engine, shape, dtype)] = {'params': params, 'seconds': seconds,
+                                                          'shape': None if shape is None else list(shape[:2]),
+                                                          'cpu_count': os.cpu_count(),
+                                                          'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+    def save(self):
+        """
+        Write the tuning file atomically, so concurrent processes never read a partial file
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'version': TUNING_VERSION, 'entries': self.entries}, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+_default_tuning = None
+
+
+def default_tuning():
+    """
+    :return: the process-wide tuning the engines read their parameters from
+    """
+    global _default_tuning
+    if _default_tuning is None:
+        _default_tuning = DWT_tuning()
+    return _default_tuning
+
+
+def set_default_tuning(tuning):
+    """
+    Replace the process-wide tuning, e.g. DWT_tuning(path) for another file or DWT_tuning(False) to turn it off
+    """
+    global _default_tuning
+    _default_tuning = tuning
+
+
+def tuned_params(engine, shape, dtype):
+    """
+    :return: the tuned keyword parameters of an engine for an input of this shape and dtype ({} if not tuned)
+    """
+    return default_tuning().lookup(engine, shape, dtype)
+
+
+def candidates(engine, shape, maskwidth=10):
+    """
+    Configurations tried by autotune
+
+    :param: engine: one of TUNABLE_ENGINES
+    :param: shape: (M, N) of the input
+    :param: maskwidth: filter length
+
+    :return: list of keyword parameters of the engine
+    """
+    # Output rows, as in dwt_coeff_len
+    dim_R = (shape[0] + maskwidth - 1) // 2
+    n_cpus = os.cpu_count() or 1
+    threads = sorted({1, n_cpus} | {n for n in (2, 4, 8, 16) if n < n_cpus})
+    if engine == 'tiled':
+        rows = [n for n in (16, 32, 64, 128, 256) if n < dim_R] + [dim_R]
+        return [{'tile_rows': n, 'n_threads': t} for n, t in itertools.product(rows, threads)]
+    if engine == 'multiprocess':
+        # From one strip per process to eight
+        return [{'strip_rows': n} for n in sorted({max(1, -(-dim_R // (n_cpus * k))) for k in (1, 2, 4, 8)})]
+    if engine in ('gpu_naive', 'gpu_nonseparable'):
+        return [{'BLOCK_WIDTH': width} for width in (8, 16, 32)]
+    if engine == 'gpu_tiled':
+        # The output tile (BLOCK_WIDTH - maskwidth)//2 + 1 must hold at least one sample
+        return [{'BLOCK_WIDTH': width} for width in (8, 16, 32) if width >= maskwidth]
+    raise ValueError("Unknown engine '{}', expected one of {}".format(engine, TUNABLE_ENGINES))
+
+
+def make_tuned_engine(engine, params):
+    """
+    Build an engine with explicit parameters
+
+    :return: run: function (h_input, filters, workspace) -> DWT_timing of one call
+    :return: close: function releasing the resources of the engine, or None
+    """
+    if engine == 'tiled':
+        from dwt_tiled_cpu import DWT_tiled_cpu
+        dwt_tiled = DWT_tiled_cpu(**params)
+        return (lambda h_input, filters, workspace: dwt_tiled.dwt_cpu_tiled(h_input, filters, workspace=workspace)[4],
+                None)
+    if engine == 'multiprocess':
+        from dwt_multiprocess_cpu import DWT_multiprocess_cpu
+        dwt_multiprocess = DWT_multiprocess_cpu(**params)
+        return (lambda h_input, filters, workspace: dwt_multiprocess.dwt_cpu_multiprocess(
+            h_input, filters, workspace=workspace)[4], dwt_multiprocess.close)
+    if engine == 'gpu_naive':
+        from dwt_naive_separable_parallel import DWT_naive_separable
+        gpu_engine = DWT_naive_separable().dwt_gpu_naive_separable
+    elif engine == 'gpu_tiled':
+        from dwt_tiled_separable_parallel import DWT_tiled_separable
+        gpu_engine = DWT_tiled_separable().dwt_gpu_tiled_separable
+    elif engine == 'gpu_nonseparable':
+        from dwt_nonseparable_parallel import DWT_nonseparable
+        gpu_engine = DWT_nonseparable().dwt_gpu_nonseparable
+    else:
+        raise ValueError("Unknown engine '{}', expected one of {}".format(engine, TUNABLE_ENGINES))
+    return lambda h_input, filters, workspace: gpu_engine(h_input, filters, workspace=workspace, **params)[4], None
+
+
+def autotune(engine, shape, dtype='float32', filters=None, warmup=1, trials=5, tuning=None, save=True, verbose=False):
+    """
+    Time every candidate configuration of an engine on a random input and keep the fastest
+
+    :param: engine: one of TUNABLE_ENGINES
+    :param: shape: (M, N) of the input, the result applies to its whole shape bucket
+    :param: dtype: 'float32', 'uint8' or 'uint16'
+    :param: filters: filter stack of shape (4, maskwidth) (CDF9/7 if not given)
+    :param: warmup: number of untimed calls per candidate
+    :param: trials: number of timed calls per candidate, compared on the median
+    :param: tuning: DWT_tuning the winner is stored in (the process-wide one if not given)
+    :param: save: write the tuning file
+    :param: verbose: print each candidate
+
+    :return: best: keyword parameters of the fastest candidate
+    :return: results: list of (params, median seconds) of every candidate
+    """
+    from dwt_benchmark import cdf97_filters, make_input, run_case
+
+    if filters is None:
+        filters = cdf97_filters()
+    if tuning is None:
+        tuning = default_tuning()
+    h_input = make_input(tuple(shape), dtype)
+
+    results = []
+    for params in candidates(engine, shape, filters.shape[1]):
+        run, close = make_tuned_engine(engine, params)
+        try:
+            seconds = run_case(run, h_input, filters, warmup, trials)['median_s']
+        finally:
+            if close is not None:
+                close()
+        results.append((params, seconds))
+        if verbose:
+            print('{:<16} {:>11} {:<8} {:<40} median {:.6f} s'.format(engine, '{}x{}'.format(*shape), dtype,
+                                                                      json.dumps(params, sort_keys=True), seconds))
+
+    best, seconds = min(results, key=lambda result: result[1])
+    tuning.store(engine, shape, dtype, best, seconds)
+    if save:
+        tuning.save()
+    return best, results
+
+
+def main(argv=None):
+    from dwt_benchmark import DTYPES, parse_shape
+
+    parser = argparse.ArgumentParser(description='Autotuner of the DWT engines')
+    parser.add_argument('--engines', nargs='+', choices=TUNABLE_ENGINES, default=['tiled', 'multiprocess'])
+    parser.add_argument('--shapes', nargs='+', type=parse_shape, default=[(512, 512), (1024, 1024)])
+    parser.add_argument('--dtypes', nargs='+', choices=DTYPES, default=['float32'])
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--trials', type=int, default=5)
+    parser.add_argument('--file', help='tuning file (DWT_TUNING_FILE or {} if not given)'.format(DEFAULT_TUNING_FILE))
+    parser.add_argument('--show', action='store_true', help='print the entries of the tuning file and exit')
+    args = parser.parse_args(argv)
+
+    tuning = DWT_tuning(args.file)
+    if args.show:
+        tuning.reload()
+        for key in sorted(tuning.entries):
+            entry = tuning.entries[key]
+            print('{:<40} {:<40} {:.6f} s'.format(key, json.dumps(entry['params'], sort_keys=True), entry['seconds']))
+        return 0
+
+    for engine in args.engines:
+        for shape in args.shapes:
+            for dtype in args.dtypes:
+                best, _ = autotune(engine, shape, dtype, warmup=args.warmup, trials=args.trials, tuning=tuning,
+                                   verbose=True)
+                print('{} -> {}'.format(tuning_key(engine, shape, dtype), json.dumps(best, sort_keys=True)))
+    print('Tuning written to {}'.format(tuning.path))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
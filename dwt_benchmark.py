@@ -0,0 +1,81 @@
+import argparse
+import numpy as np
+
+import dwt_trace
+from dwt_serial import gen_wavelet
+from dwt_timing import PHASES
+from dwt_workspace import DWT_workspace
+
+# Input dtypes of the benchmarks
+DTYPES = ('float32', 'uint8', 'uint16')
+
+
+def cdf97_filters():
+    """
+    :return: CDF9/7 filter stack of shape (4, 10) (an_lo, an_hi, syn_lo, syn_hi), same as the benchmark scripts
+    """
+    return np.array(gen_wavelet().filter_bank, dtype=np.float32)
+
+
+def parse_shape(text):
+    """
+    :param: text: shape written as 'MxN', e.g. '1024x768'
+    :return: (M, N)
+    """
+    try:
+        dim_M, dim_N = (int(dim) for dim in text.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError("Expected a shape written as 'MxN', got '{}'".format(text))
+    return dim_M, dim_N
+
+
+def make_input(shape, dtype, seed=0):
+    """
+    Random image of a given shape and dtype, the same for every engine of a case
+
+    :param: shape: (M, N)
+    :param: dtype: 'float32' (values in [0, 1)), 'uint8' or 'uint16' (full range)
+    """
+    rng = np.random.default_rng(seed)
+    if dtype == 'float32':
+        return rng.random(shape, dtype=np.float32)
+    return rng.integers(0, np.iinfo(dtype).max, size=shape, endpoint=True, dtype=dtype)
+
+
+def summarize(samples_ns):
+    """
+    :param: samples_ns: total time of each trial in nanoseconds
+    :return: {'median_s', 'p95_s', 'min_s'} in seconds
+    """
+    samples = np.asarray(samples_ns, dtype=np.float64) * 1e-9
+    return {'median_s': float(np.median(samples)), 'p95_s': float(np.percentile(samples, 95)),
+            'min_s': float(samples.min())}
+
+
+def run_case(run, h_input, filters, warmup=2, trials=10):
+    """
+    Time one engine on one input
+
+    The warmup calls fill the workspace (and the module cache of the CUDA engines), so the trials measure the steady
+    state of repeated calls of the same shape
+
+    :param: run: function (h_input, filters, workspace) -> DWT_timing of one call, e.g. from
+            benchmark_suite.make_engine
+    :param: h_input: input image
+    :param: filters: filter stack of shape (4, maskwidth)
+    :param: warmup: number of untimed calls
+    :param: trials: number of timed calls
+
+    :return: statistics of the total time (see summarize), with the median of each phase in 'phases_s'
+    """
+    workspace = DWT_workspace()
+    with dwt_trace.span('warmup', 'benchmark', calls=warmup):
+        for _ in range(warmup):
+            run(h_input, filters, workspace)
+    with dwt_trace.span('trials', 'benchmark', calls=trials):
+        timings = [run(h_input, filters, workspace) for _ in range(trials)]
+
+    result = summarize([timing.total_ns for timing in timings])
+    result['phases_s'] = {phase: float(np.median([timing.ns[phase] for timing in timings])) * 1e-9
+                          for phase in PHASES}
+    return result
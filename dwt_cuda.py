@@ -0,0 +1,40 @@
+import importlib.util
+
+# CUDA context of the process, created by the first call of a CUDA engine
+_context = None
+
+# Whether pycuda sees a device, checked once
+_available = None
+
+
+def cuda_available():
+    """
+    :return: whether pycuda is installed and the driver finds at least one device, checked on the first call without
+             creating a context
+    """
+    global _available
+    if _available is None:
+        _available = False
+        if importlib.util.find_spec('pycuda') is not None:
+            # Without a driver or a device, cuInit itself fails, with an error type that depends on the pycuda version
+            try:
+                import pycuda.driver as cuda
+                cuda.init()
+                _available = cuda.Device.count() > 0
+            except Exception:
+                _available = False
+    return _available
+
+
+def cuda_context():
+    """
+    Import pycuda and create the CUDA context on first use, so that importing the CUDA engines is cheap and works on
+    machines without a GPU
+
+    :return: the context of the process, released when the interpreter exits
+    """
+    global _context
+    if _context is None:
+        import pycuda.autoinit
+        _context = pycuda.autoinit.context
+    return _context
@@ -0,0 +1,168 @@
+import hashlib
+import json
+import numpy as np
+import os
+import tempfile
+
+from dwt_image_loader import iter_images, list_images
+
+# Directory of the decoded data set stores, can be overridden with the DWT_DATASET_CACHE_DIR variable
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'dwt_dataset')
+
+# Version of the store layout, stores written with another version are rebuilt
+STORE_VERSION = 2
+
+
+def _source_stats(root, entries):
+    """
+    :return: {path relative to root: [mtime_ns, size]} of the source files, used to detect changes of the data set
+    """
+    stats = {}
+    for _, _, path in entries:
+        st = os.stat(path)
+        stats[os.path.relpath(path, root)] = [st.st_mtime_ns, st.st_size]
+    return stats
+
+
+class DatasetStore:
+    def __init__(self, root='images', cache_dir=None, n_threads=None):
+        """
+        Decoded copy of the image data set in one memory-mappable uint8 file
+
+        The pixels of every image are stored back to back in <hash>.<content hash>.u8 and the index <hash>.json names
+        that file and holds one entry of (shape class, size bucket, filename, offset, shape) per image. The store is
+        rebuilt (decoding on a thread pool with iter_images) whenever a source file is added, removed or modified,
+        otherwise opening it only maps the file, and the images are handed out as read-only views of the mapping
+        without any copy
+
+        :param: root: directory holding the square, rect_wide and rect_tall directories
+        :param: cache_dir: directory of the stores, DEFAULT_CACHE_DIR (or DWT_DATASET_CACHE_DIR) if not given
+        :param: n_threads: number of decoding threads used to build the store
+        """
+        if cache_dir is None:
+            cache_dir = os.environ.get('DWT_DATASET_CACHE_DIR', DEFAULT_CACHE_DIR)
+
+        self.root = root
+        self.n_threads = n_threads
+        self.cache_dir = cache_dir
+        self.name = hashlib.sha1(os.path.abspath(root).encode('utf-8')).hexdigest()
+        self.index_path = os.path.join(cache_dir, self.name + '.json')
+        self.data_path = None
+
+        self.entries = []
+        self.data = None
+        self.rebuilt = False
+        self.refresh()
+
+    def refresh(self):
+        """
+        Rebuild the store if the source files changed since it was written, then map it
+
+        :return: whether the store was rebuilt
+        """
+        sources = _source_stats(self.root, list_images(self.root))
+        index = self._read_index()
+        self.rebuilt = index is None or index['sources'] != sources
+        if self.rebuilt:
+            index = self._build(sources)
+
+        self.entries = index['entries']
+        self.data_path = os.path.join(self.cache_dir, index['data'])
+        nbytes = sum(int(np.prod(entry['shape'])) for entry in self.entries)
+        self.data = np.memmap(self.data_path, dtype=np.uint8, mode='r') if nbytes > 0 else np.empty(0, np.uint8)
+        return self.rebuilt
+
+    def _read_index(self):
+        """
+        :return: the index of the store, or None if there is no valid store
+        """
+        if not os.path.exists(self.index_path):
+            return None
+        with open(self.index_path) as f:
+            try:
+                index = json.load(f)
+            except ValueError:
+                return None
+        if index.get('version') != STORE_VERSION or not os.path.exists(os.path.join(self.cache_dir, index['data'])):
+            return None
+        return index
+
+    def _build(self, sources):
+        """
+        Decode every image into a new data file named after its content, then replace the index naming it
+        """
+        cache_dir = self.cache_dir
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        old_index = self._read_index()
+
+        tmp_data = tmp_index = None
+        try:
+            entries = []
+            offset = 0
+            digest = hashlib.sha1()
+            fd, tmp_data = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                for shape_class, size, path, image in iter_images(self.root, n_threads=self.n_threads):
+                    image = np.ascontiguousarray(image, dtype=np.uint8)
+                    # Bytes of the image without a copy, shared by the write and the hash
+                    buf = memoryview(image).cast('B')
+                    f.write(buf)
+                    digest.update(buf)
+                    entries.append({'shape_class': shape_class, 'size': size, 'filename': os.path.basename(path),
+                                    'offset': offset, 'shape': list(image.shape)})
+                    offset += image.nbytes
+
+            data = '{}.{}.u8'.format(self.name, digest.hexdigest()[:16])
+            index = {'version': STORE_VERSION, 'root': os.path.abspath(self.root), 'sources': sources, 'data': data,
+                     'entries': entries}
+            fd, tmp_index = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(index, f)
+
+            # The new data file never overwrites the one named by the current index with other bytes, so the replace
+            # of the index is the single commit point: an interrupted build leaves the old index with its own data, at
+            # worst next to an unreferenced file
+            os.replace(tmp_data, os.path.join(cache_dir, data))
+            os.replace(tmp_index, self.index_path)
+        except BaseException:
+            # A corrupt image, a full disk or an interrupt must not leave temporary files in the cache dir
+            for tmp_path in (tmp_data, tmp_index):
+                if tmp_path is not None and os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            raise
+        if old_index is not None and old_index['data'] != data:
+            os.remove(os.path.join(cache_dir, old_index['data']))
+        return index
+
+    def image(self, entry):
+        """
+        :param: entry: entry of the index
+        :return: read-only uint8 view of the image of shape (M, N, 3) in the mapped store
+        """
+        count = int(np.prod(entry['shape']))
+        return self.data[entry['offset']:entry['offset'] + count].reshape(entry['shape'])
+
+    def select(self, shape_class=None, size=None):
+        """
+        Entries of the index of one shape class and/or size bucket, in the order of list_images
+
+        :param: shape_class: 'square', 'rect_wide' or 'rect_tall', all classes if not given
+        :param: size: size bucket (100 ... 1000), all sizes if not given
+
+        :return: list of entries
+        """
+        return [entry for entry in self.entries
+                if (shape_class is None or entry['shape_class'] == shape_class)
+                and (size is None or entry['size'] == size)]
+
+    def iter_images(self, shape_class=None, size=None):
+        """
+        Same as dwt_image_loader.iter_images, but handing out views of the store instead of decoding
+
+        :return: generator of (shape class, size, path, image)
+        """
+        for entry in self.select(shape_class, size):
+            dirname = '{}{}'.format('square' if entry['shape_class'] == 'square' else 'rect', entry['size'])
+            path = os.path.join(self.root, entry['shape_class'], dirname, entry['filename'])
+            yield entry['shape_class'], entry['size'], path, self.image(entry)
@@ -0,0 +1,288 @@
+#!/usr/bin/env python
+#Single dwt2 entry point choosing the cheapest available engine from a calibrated cost model.
+
+import argparse
+import numpy as np
+import os
+
+from dwt_autotune import default_tuning
+from dwt_cuda import cuda_available, cuda_context
+from dwt_vectorized_separable import input_scale
+
+# Backends of dwt2, the CUDA one is only available when pycuda is installed and finds a device
+BACKENDS = ('pywt', 'vectorized', 'threaded', 'multiprocess', 'cuda')
+
+# Backends spreading the work of one image across the CPUs
+PARALLEL_BACKENDS = ('threaded', 'multiprocess')
+
+# Backends supporting the boundary modes other than zero padding
+MODE_BACKENDS = ('pywt', 'vectorized')
+
+# Cost of a call before calibration: fixed seconds per plane and seconds per pixel on one CPU, measured on a desktop
+# CPU with the CDF9/7 filters. The per-pixel cost of the parallel backends is divided by their speedup
+DEFAULT_COSTS = {
+    'pywt': {'overhead_s': 60e-6, 'pixel_s': 35e-9},
+    'vectorized': {'overhead_s': 700e-6, 'pixel_s': 22e-9},
+    'threaded': {'overhead_s': 900e-6, 'pixel_s': 24e-9},
+    'multiprocess': {'overhead_s': 3e-3, 'pixel_s': 28e-9},
+    'cuda': {'overhead_s': 2e-3, 'pixel_s': 3e-9},
+}
+
+# Fraction of each additional CPU the parallel backends turn into speedup before calibration
+PARALLEL_EFFICIENCY = 0.8
+
+# Shapes the backends are timed at by calibrate, the two points of the fit of the fixed and per-pixel costs
+CALIBRATION_SHAPES = ((128, 128), (1024, 1024))
+
+_engines = {}
+_cuda_available = None
+
+
+def available_backends():
+    """
+    :return: the backends that can run here, checking for a CUDA device without creating a context
+    """
+    global _cuda_available
+    if _cuda_available is None:
+        _cuda_available = cuda_available()
+    return tuple(backend for backend in BACKENDS if backend != 'cuda' or _cuda_available)
+
+
+def backend_costs(backend):
+    """
+    :return: {'overhead_s', 'pixel_s'} of a backend, calibrated on this machine if calibrate has been run
+    """
+    costs = default_tuning().lookup('dwt2:' + backend, None, None)
+    if costs:
+        return costs
+    costs = dict(DEFAULT_COSTS[backend])
+    if backend in PARALLEL_BACKENDS:
+        costs['pixel_s'] /= 1 + PARALLEL_EFFICIENCY * ((os.cpu_count() or 1) - 1)
+    return costs
+
+
+def estimate_cost(backend, shape, channels=1):
+    """
+    Estimated seconds of a transform
+
+    :param: backend: one of BACKENDS
+    :param: shape: (M, N) of the image
+    :param: channels: number of channels, only the vectorized backend transforms them in one call
+
+    :return: fixed cost of each call plus the per-pixel cost of every sample
+    """
+    costs = backend_costs(backend)
+    calls = 1 if backend == 'vectorized' else channels
+    return calls * costs['overhead_s'] + shape[0] * shape[1] * channels * costs['pixel_s']
+
+
+def choose_backend(shape, channels=1, mode='zero', backends=None):
+    """
+    :param: shape: (M, N) of the image
+    :param: channels: number of channels
+    :param: mode: boundary mode, only MODE_BACKENDS support the modes other than zero padding
+    :param: backends: candidate backends (the available ones if not given)
+
+    :return: the backend with the lowest estimated cost
+    """
+    if backends is None:
+        backends = available_backends()
+    if mode != 'zero':
+        backends = [backend for backend in backends if backend in MODE_BACKENDS]
+    return min(backends, key=lambda backend: estimate_cost(backend, shape, channels))
+
+
+def wavelet_filters(wavelet):
+    """
+    :param: wavelet: pywt.Wavelet, name of a pywavelets wavelet, or filter stack of shape (4, maskwidth)
+            (an_lo, an_hi, syn_lo, syn_hi)
+
+    :return: filter stack of shape (4, maskwidth) as float32
+    """
+    if isinstance(wavelet, str):
+        import pywt
+        wavelet = pywt.Wavelet(wavelet)
+    if hasattr(wavelet, 'filter_bank'):
+        wavelet = wavelet.filter_bank
+    filters = np.asarray(wavelet, dtype=np.float32)
+    if filters.ndim != 2 or filters.shape[0] != 4:
+        raise ValueError('Expected a filter stack of shape (4, maskwidth), got shape {}'.format(filters.shape))
+    return filters
+
+
+def _open_cuda():
+    """
+    Create the CUDA context, the cuda backend is no longer available if that fails
+
+    :return: whether the context could be created
+    """
+    global _cuda_available
+    try:
+        cuda_context()
+    except Exception:
+        _cuda_available = False
+    return _cuda_available
+
+
+def _engine(backend):
+    """
+    Engine of a backend, built on first use and kept for the process (thread pool, worker processes, compiled kernels)
+    """
+    engine = _engines.get(backend)
+    if engine is None:
+        if backend == 'vectorized':
+            from dwt_vectorized_separable import DWT_vectorized_separable
+            engine = DWT_vectorized_separable()
+        elif backend == 'threaded':
+            from dwt_tiled_cpu import DWT_tiled_cpu
+            engine = DWT_tiled_cpu()
+        elif backend == 'multiprocess':
+            from dwt_multiprocess_cpu import DWT_multiprocess_cpu
+            engine = DWT_multiprocess_cpu()
+        elif backend == 'cuda':
+            from dwt_tiled_separable_parallel import DWT_tiled_separable
+            engine = DWT_tiled_separable()
+        _engines[backend] = engine
+    return engine
+
+
+def _dwt2_plane(backend, plane, filters, mode, workspace):
+    """
+    Transform of one (M, N) plane by a backend
+    """
+    if backend == 'pywt':
+        import pywt
+        from dwt_serial import run_DWT
+        # The other backends normalize unsigned integer images in their row pass
+        if plane.dtype.kind == 'u':
+            plane = np.multiply(plane, input_scale(plane.dtype), dtype=np.float32)
+        return run_DWT(plane, pywt.Wavelet('dwt2', [list(filt) for filt in filters.astype(np.float64)]), mode=mode)
+    if backend == 'threaded':
+        return _engine(backend).dwt_cpu_tiled(plane, filters, workspace=workspace)
+    if backend == 'multiprocess':
+        return _engine(backend).dwt_cpu_multiprocess(plane, filters, workspace=workspace)
+    if plane.dtype.kind == 'u':
+        plane = np.multiply(plane, input_scale(plane.dtype), dtype=np.float32)
+    return _engine(backend).dwt_gpu_tiled_separable(plane, filters, workspace=workspace)
+
+
+def dwt2(image, wavelet, backend='auto', mode='zero', workspace=None):
+    """
+    2D DWT of an image by the cheapest backend, or by a given one
+
+    All backends return the same coefficients (those of pywt.dwt2 up to float32 rounding), uint8 and uint16 images
+    being normalized to [0, 1]
+
+    :param: image: image of shape (M, N), or (M, N, P) for P channels
+    :param: wavelet: pywt.Wavelet, name of a pywavelets wavelet, or filter stack of shape (4, maskwidth)
+    :param: backend: 'auto' to choose from the cost model (see choose_backend), or one of BACKENDS
+    :param: mode: boundary mode, zero padding for every backend, the others of dwt_vectorized_separable.MODES for
+            pywt and vectorized
+    :param: workspace: optional DWT_workspace the buffers of the numpy backends are taken from, the coefficients are
+            then owned by the workspace
+
+    :return: cA, cH, cV, cD: 2D DWT coefficients of shape (R, C), or (P, R, C) for an image with channels
+    :return: timing: DWT_timing of the call, summed over the channels for the backends transforming them one by one
+    """
+    image = np.asarray(image)
+    if image.ndim not in (2, 3):
+        raise ValueError('Expected an image of shape (M, N) or (M, N, P), got shape {}'.format(image.shape))
+    channels = image.shape[2] if image.ndim == 3 else 1
+    filters = wavelet_filters(wavelet)
+
+    if backend == 'auto':
+        backend = choose_backend(image.shape, channels, mode)
+        # A device found by the driver can still fail to open, the next cheapest backend is then used
+        if backend == 'cuda' and not _open_cuda():
+            backend = choose_backend(image.shape, channels, mode)
+    elif backend not in available_backends():
+        raise ValueError("Unknown or unavailable backend '{}', expected one of {}".format(backend,
+                                                                                         available_backends()))
+    elif mode != 'zero' and backend not in MODE_BACKENDS:
+        raise ValueError("Backend '{}' only supports mode 'zero', got '{}'".format(backend, mode))
+
+    if backend == 'vectorized':
+        if image.ndim == 2:
+            return _engine(backend).dwt_cpu_vectorized_separable(image, filters, workspace=workspace, mode=mode)
+        return _engine(backend).dwt_cpu_batched(image, filters, layout='HWC', workspace=workspace, mode=mode)
+
+    if image.ndim == 2:
+        return _dwt2_plane(backend, image, filters, mode, workspace)
+    # The outputs of a workspace are overwritten by the next plane of the same shape, so each plane is copied out
+    coeffs = [[], [], [], []]
+    timings = []
+    for c in range(channels):
+        res = _dwt2_plane(backend, image[:, :, c], filters, mode, workspace)
+        for band, coeff in zip(coeffs, res[:4]):
+            band.append(np.array(coeff))
+        timings.append(res[4])
+    return np.stack(coeffs[0]), np.stack(coeffs[1]), np.stack(coeffs[2]), np.stack(coeffs[3]), sum(timings)
+
+
+def calibrate(backends=None, shapes=CALIBRATION_SHAPES, dtype='float32', warmup=1, trials=5, tuning=None, save=True,
+              verbose=False):
+    """
+    Time each backend at two shapes and fit the fixed and per-pixel costs of the cost model
+
+    :param: backends: backends to calibrate (the available ones if not given)
+    :param: shapes: the small and the large (M, N) the backends are timed at
+    :param: dtype: 'float32', 'uint8' or 'uint16'
+    :param: warmup: number of untimed calls per shape
+    :param: trials: number of timed calls per shape, compared on the median
+    :param: tuning: DWT_tuning the costs are stored in (the process-wide one if not given)
+    :param: save: write the tuning file
+    :param: verbose: print the costs of each backend
+
+    :return: {backend: {'overhead_s', 'pixel_s'}}
+    """
+    from dwt_benchmark import cdf97_filters, make_input, run_case
+
+    if backends is None:
+        backends = available_backends()
+    if tuning is None:
+        tuning = default_tuning()
+    filters = cdf97_filters()
+    small, large = shapes
+    small_px, large_px = small[0] * small[1], large[0] * large[1]
+
+    res = {}
+    for backend in backends:
+        def run(h_input, filters, workspace):
+            return dwt2(h_input, filters, backend, workspace=workspace)[4]
+        small_s = run_case(run, make_input(small, dtype), filters, warmup, trials)['median_s']
+        large_s = run_case(run, make_input(large, dtype), filters, warmup, trials)['median_s']
+        pixel_s = max(0.0, (large_s - small_s) / (large_px - small_px))
+        res[backend] = {'overhead_s': max(0.0, small_s - pixel_s * small_px), 'pixel_s': pixel_s}
+        tuning.store('dwt2:' + backend, None, None, res[backend], large_s)
+        if verbose:
+            print('{:<14} overhead {:.6f} s  {:.2f} ns/pixel'.format(backend, res[backend]['overhead_s'],
+                                                                     res[backend]['pixel_s'] * 1e9))
+    if save:
+        tuning.save()
+    return res
+
+
+def main(argv=None):
+    from dwt_benchmark import parse_shape
+
+    parser = argparse.ArgumentParser(description='Cost model of the dwt2 backends')
+    parser.add_argument('--calibrate', action='store_true', help='time the backends and save their costs')
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS)
+    parser.add_argument('--shapes', nargs='+', type=parse_shape, default=[(100, 100), (1080, 1920), (4096, 4096)])
+    parser.add_argument('--channels', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    if args.calibrate:
+        calibrate(args.backends, verbose=True)
+        print('Costs written to {}'.format(default_tuning().path))
+    backends = args.backends or available_backends()
+    for shape in args.shapes:
+        costs = ', '.join('{} {:.6f} s'.format(backend, estimate_cost(backend, shape, args.channels))
+                          for backend in backends)
+        print('{:>11} x{}: {} -> {}'.format('{}x{}'.format(*shape), args.channels, costs,
+                                            choose_backend(shape, args.channels, backends=backends)))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,239 @@
+import numpy as np
+import time
+
+from dwt_metrics import forward_multiply_adds, record, workspace_counts
+from dwt_timing import DWT_timing
+from dwt_vectorized_separable import analysis_pass, as_pass_input, dwt_coeff_len, input_scale
+from dwt_workspace import DWT_workspace, workspace_key
+
+# Smallest filter length for which the FFT path is faster than the direct taps, measured with measure_crossover on
+# symmetric filters, which the direct path folds as it does CDF9/7 (256 and 1024 rows of 1024 samples, 16 to 24 taps
+# over repeated runs, the upper end is kept; the 10 taps of CDF9/7 are about twice as fast with the direct path).
+# General filters crossed over at the same length, folding trades a multiply for an add and barely speeds up the
+# direct taps
+FFT_CROSSOVER_MASKWIDTH = 24
+
+# Shortest axis the FFT path is used on, below it the FFT setup costs more than the taps, measured with
+# measure_min_dim at the crossover (the FFT path was faster from 16 to 64 samples depending on the number of rows)
+MIN_FFT_DIM = 64
+
+
+def fft_block_len(maskwidth):
+    """
+    Length of the input blocks of the overlap-add, so that the FFT size block + maskwidth - 1 is a power of 2 about 8
+    times the filter length
+    """
+    nfft = 1 << int(np.ceil(np.log2(8 * maskwidth)))
+    return nfft - maskwidth + 1
+
+
+def fft_analysis_pass(x, filter_lo, filter_hi, axis, out_lo, out_hi):
+    """
+    Same output as analysis_pass, with the convolution computed by overlap-add FFTs
+
+    The input is cut into blocks along axis, each block is convolved with both filters in the frequency domain and
+    the tails of the blocks are added to the next block, which gives the full convolution y of length
+    dim + maskwidth - 1. Output c of analysis_pass is y[c * 2 + 1], so the odd samples are kept
+
+    :param: x: input array of any dimension
+    :param: filter_lo: LPF coefficients of shape (maskwidth,)
+    :param: filter_hi: HPF coefficients of shape (maskwidth,)
+    :param: axis: axis along which the convolution is performed
+    :param: out_lo: output of the LPF, same shape as x except dwt_coeff_len(x.shape[axis], maskwidth) along axis
+    :param: out_hi: output of the HPF, same shape as out_lo
+    """
+    maskwidth = filter_lo.shape[0]
+    dim_in = x.shape[axis]
+    dim_out = out_lo.shape[axis]
+
+    block = fft_block_len(maskwidth)
+    nfft = block + maskwidth - 1
+    n_blocks = -(-dim_in // block)
+
+    # Blocks along the last axis: (..., n_blocks, block), the last block is zero-padded
+    x = np.moveaxis(x, axis, -1)
+    blocks = np.zeros(x.shape[:-1] + (n_blocks * block,), dtype=np.float32)
+    blocks[..., :dim_in] = x
+    blocks = blocks.reshape(x.shape[:-1] + (n_blocks, block))
+
+    spectrum = np.fft.rfft(blocks, n=nfft, axis=-1)
+    for filt, out in ((filter_lo, out_lo), (filter_hi, out_hi)):
+        conv = np.fft.irfft(spectrum * np.fft.rfft(np.asarray(filt, dtype=np.float32), n=nfft), n=nfft, axis=-1)
+
+        # Overlap-add: the last maskwidth - 1 samples of each block belong to the start of the next one (one extra
+        # block holds the tail of the last one)
+        y = np.zeros(x.shape[:-1] + (n_blocks + 1, block), dtype=conv.dtype)
+        y[..., :n_blocks, :] = conv[..., :block]
+        y[..., 1:, :maskwidth - 1] += conv[..., block:]
+        y = y.reshape(x.shape[:-1] + ((n_blocks + 1) * block,))
+
+        np.copyto(np.moveaxis(out, axis, -1), y[..., 1:2 * dim_out:2], casting='unsafe')
+
+
+def _pass_times(x, maskwidth, symmetric, trials):
+    """
+    :return: best time of the direct and of the FFT row pass of x with random filters of a length, symmetric ones
+             (so that the direct pass runs the folded taps of fold_taps) or not
+    """
+    filt = np.random.rand(maskwidth).astype(np.float32)
+    if symmetric:
+        filt = filt + filt[::-1]
+    out_lo = np.empty((x.shape[0], dwt_coeff_len(x.shape[1], maskwidth)), dtype=np.float32)
+    out_hi = np.empty_like(out_lo)
+    times = []
+    for pass_fn in (analysis_pass, fft_analysis_pass):
+        # Untimed call, which plans the FFT size and touches the temporaries
+        pass_fn(x, filt, filt, 1, out_lo, out_hi)
+        best = np.inf
+        for _ in range(trials):
+            tic = time.perf_counter()
+            pass_fn(x, filt, filt, 1, out_lo, out_hi)
+            best = min(best, time.perf_counter() - tic)
+        times.append(best)
+    return times[0], times[1]
+
+
+def measure_crossover(maskwidths=(10, 16, 20, 24, 28, 32, 40, 48, 64, 96, 128), dim=1024, rows=256, trials=3,
+                      symmetric=True):
+    """
+    Time the direct and the FFT row pass for increasingly long filters
+
+    :param: maskwidths: filter lengths to try
+    :param: dim: number of samples per row
+    :param: rows: number of rows
+    :param: trials: number of runs of each pass, the fastest is kept
+    :param: symmetric: time symmetric filters, which the direct pass folds (see fold_taps), or general ones
+
+    :return: the smallest filter length from which on the FFT pass is always faster (None if it is not on the longest
+             one), and the list of (maskwidth, direct time, FFT time)
+    """
+    x = np.random.rand(rows, dim).astype(np.float32)
+    timings = []
+    crossover = None
+    for maskwidth in maskwidths:
+        direct_s, fft_s = _pass_times(x, maskwidth, symmetric, trials)
+        timings.append((maskwidth, direct_s, fft_s))
+        if fft_s >= direct_s:
+            crossover = None
+        elif crossover is None:
+            crossover = maskwidth
+    return crossover, timings
+
+
+def measure_min_dim(maskwidth, dims=(8, 16, 32, 64, 128, 256, 512, 1024, 2048), rows=256, trials=3,
+                    symmetric=True):
+    """
+    Time the direct and the FFT row pass of a filter length for increasingly long rows
+
+    :param: maskwidth: filter length, e.g. the crossover of measure_crossover
+    :param: dims: numbers of samples per row to try
+    :param: rows: number of rows
+    :param: trials: number of runs of each pass, the fastest is kept
+    :param: symmetric: time a symmetric filter, which the direct pass folds (see fold_taps), or a general one
+
+    :return: the shortest row from which on the FFT pass is always faster (None if it is not on the longest one), and
+             the list of (dim, direct time, FFT time)
+    """
+    timings = []
+    min_dim = None
+    for dim in dims:
+        direct_s, fft_s = _pass_times(np.random.rand(rows, dim).astype(np.float32), maskwidth, symmetric, trials)
+        timings.append((dim, direct_s, fft_s))
+        if fft_s >= direct_s:
+            min_dim = None
+        elif min_dim is None:
+            min_dim = dim
+    return min_dim, timings
+
+
+def use_fft(maskwidth, dim, crossover=FFT_CROSSOVER_MASKWIDTH):
+    """
+    Whether the FFT pass is expected to be faster than the direct taps for a filter length and axis length
+    """
+    return crossover is not None and maskwidth >= crossover and dim >= MIN_FFT_DIM
+
+
+class DWT_fft_separable:
+    def __init__(self, crossover=FFT_CROSSOVER_MASKWIDTH):
+        """
+        Separable 2D DWT on the CPU that picks the direct or the FFT convolution for each pass
+
+        :param: crossover: smallest filter length for which the FFT path is used, e.g. from measure_crossover on the
+                target machine (None to never use it)
+        """
+        self.crossover = crossover
+
+    def dwt_cpu_fft(self, h_input, filters, BLOCK_WIDTH=None, out=None, workspace=None, method='auto', scale=None):
+        """
+        Separable 2D DWT, same output as dwt_cpu_vectorized_separable (and run_DWT in zero-padding mode)
+
+        :param: h_input: input image of shape (M, N)
+        :param: filters: filter stack of shape (4, maskwidth) (an_lo, an_hi, syn_lo, syn_hi)
+        :param: BLOCK_WIDTH: unused, kept so that the call signature matches the CUDA kernels
+        :param: out: optional tuple of four float32 arrays (cA, cH, cV, cD) the coefficients are written into
+        :param: workspace: optional DWT_workspace the intermediate and output buffers are taken from
+        :param: method: 'auto' (selected per pass from the filter length and the axis length), 'direct' or 'fft'
+        :param: scale: factor applied to the input in the row pass, see input_scale (uint8 and uint16 images are
+                normalized to [0, 1] by default)
+
+        :return: h_cA, h_cH, h_cV, h_cD: 2D DWT coefficients of shape ((M + maskwidth - 1)//2,
+                 (N + maskwidth - 1)//2)
+        :return: timing: DWT_timing of the call (setup, alloc and compute)
+        """
+        timing = DWT_timing('fft')
+        if h_input.ndim != 2:
+            raise ValueError('Expected an image of shape (M, N), got shape {}'.format(h_input.shape))
+        if method not in ('auto', 'direct', 'fft'):
+            raise ValueError("Unknown method '{}', expected 'auto', 'direct' or 'fft'".format(method))
+
+        # Obtain the shape of the input matrix
+        dim_M, dim_N = h_input.shape
+        maskwidth = filters[0].shape[0]
+
+        # Without a workspace every buffer is allocated for this call only
+        if workspace is None:
+            workspace = DWT_workspace()
+        counts = workspace_counts(workspace)
+        key = workspace_key(h_input.shape, h_input.dtype, maskwidth)
+
+        # Obtain the filters for DWT
+        filters = workspace.filters(filters)
+        h_filter_lo = filters[0, :]
+        h_filter_hi = filters[1, :]
+
+        # Compute the size of the output of the wavelet transform
+        dim_R = dwt_coeff_len(dim_M, maskwidth)
+        dim_C = dwt_coeff_len(dim_N, maskwidth)
+
+        # The scale of the input is folded into the filters of the row pass
+        scale = input_scale(h_input.dtype, scale)
+        row_filter_lo = h_filter_lo * scale if scale != 1 else h_filter_lo
+        row_filter_hi = h_filter_hi * scale if scale != 1 else h_filter_hi
+
+        h_input = as_pass_input(h_input)
+        timing.mark('setup')
+        h_tmp_a1 = workspace.get(key, 'tmp_a1', (dim_M, dim_C))
+        h_tmp_a2 = workspace.get(key, 'tmp_a2', (dim_M, dim_C))
+        if out is None:
+            out = tuple(workspace.get(key, name, (dim_R, dim_C)) for name in ('cA', 'cH', 'cV', 'cD'))
+
+        def select(dim):
+            if method == 'auto':
+                return fft_analysis_pass if use_fft(maskwidth, dim, self.crossover) else analysis_pass
+            return fft_analysis_pass if method == 'fft' else analysis_pass
+        timing.mark('alloc')
+
+        # First pass: convolution along each row
+        select(dim_N)(h_input, row_filter_lo, row_filter_hi, 1, h_tmp_a1, h_tmp_a2)
+
+        # Second pass: convolution along each column of both subbands
+        col_pass = select(dim_M)
+        col_pass(h_tmp_a1, h_filter_lo, h_filter_hi, 0, out[0], out[1])
+        col_pass(h_tmp_a2, h_filter_lo, h_filter_hi, 0, out[2], out[3])
+        timing.mark('compute')
+
+        timing.stop()
+        record(timing, h_input.size, (h_input,), out,
+               forward_multiply_adds(dim_M, dim_R, dim_C, maskwidth), workspace, counts)
+
+        return out[0], out[1], out[2], out[3], timing
@@ -0,0 +1,111 @@
+import numpy as np
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from dwt_trace import span
+
+# Shape classes of the data set: (directory under the image root, prefix of the size directories)
+SHAPE_CLASSES = (('square', 'square'), ('rect_wide', 'rect'), ('rect_tall', 'rect'))
+
+# Size buckets of the data set (size directories square100 ... square1000, rect100 ... rect1000)
+IMAGE_SIZES = tuple(range(100, 1100, 100))
+
+# Extensions of the files that are decoded
+VALID_IMAGES = ('.jpg',)
+
+
+def list_images(root='images', shape_classes=None, sizes=IMAGE_SIZES):
+    """
+    List the images of the data set in the order of the benchmarks: every size of the square images, then of the wide
+    and of the tall rectangles, files sorted by name inside a size directory
+
+    :param: root: directory holding the square, rect_wide and rect_tall directories
+    :param: shape_classes: names of the shape classes to list (all of SHAPE_CLASSES if not given)
+    :param: sizes: size buckets to list
+
+    :return: list of (shape class, size, path)
+    """
+    entries = []
+    for shape_class, prefix in SHAPE_CLASSES:
+        if shape_classes is not None and shape_class not in shape_classes:
+            continue
+        for size in sizes:
+            path = os.path.join(root, shape_class, '{}{}'.format(prefix, size))
+            if not os.path.isdir(path):
+                continue
+            for f in sorted(os.listdir(path)):
+                # ignore non-image files
+                if os.path.splitext(f)[1].lower() not in VALID_IMAGES:
+                    continue
+                entries.append((shape_class, size, os.path.join(path, f)))
+    return entries
+
+
+def decode_image(path):
+    """
+    Decode an image file into an RGB uint8 array of shape (M, N, 3), PIL releases the GIL while decoding
+    """
+    from PIL import Image
+    with Image.open(path) as img:
+        return np.asarray(img.convert('RGB'))
+
+
+def _decode_traced(decode, path):
+    """
+    Decode one image on a thread of the pool, recorded as a trace event when tracing is on
+    """
+    with span('decode', 'loader', path=path):
+        return decode(path)
+
+
+def iter_images(root='images', shape_classes=None, sizes=IMAGE_SIZES, n_threads=None, prefetch=None,
+                decode=decode_image):
+    """
+    Generator over the decoded images of the data set, decoded ahead of the consumer by a thread pool
+
+    At most prefetch images are decoded or waiting in the queue at any time, the next one is submitted as soon as one
+    is handed out, so decoding overlaps with whatever the consumer does with the current image and the memory held
+    stays flat instead of growing with the data set
+
+    :param: root: directory holding the square, rect_wide and rect_tall directories
+    :param: shape_classes: names of the shape classes to load (all of SHAPE_CLASSES if not given)
+    :param: sizes: size buckets to load
+    :param: n_threads: number of decoding threads (defaults to the number of CPUs)
+    :param: prefetch: maximum number of images decoded ahead (defaults to 2 per thread)
+    :param: decode: function decoding a path into an array
+
+    :return: generator of (shape class, size, path, image), in the order of list_images
+    """
+    if n_threads is None:
+        n_threads = os.cpu_count() or 1
+    if prefetch is None:
+        prefetch = 2 * n_threads
+    prefetch = max(1, prefetch)
+
+    entries = iter(list_images(root, shape_classes, sizes))
+    pool = ThreadPoolExecutor(max_workers=n_threads)
+    pending = deque()
+
+    def submit():
+        entry = next(entries, None)
+        if entry is not None:
+            pending.append((entry, pool.submit(_decode_traced, decode, entry[2])))
+
+    try:
+        for _ in range(prefetch):
+            submit()
+        while pending:
+            entry, future = pending.popleft()
+            # Time the consumer waits for the decoding threads
+            with span('wait_decode', 'loader'):
+                image = future.result()
+            # Keep the queue full while the consumer works on this image
+            submit()
+            yield entry + (image,)
+            del image
+    finally:
+        # Stop decoding if the consumer leaves early
+        for _, future in pending:
+            future.cancel()
+        pool.shutdown(wait=True)
@@ -0,0 +1,290 @@
+import numpy as np
+
+from dwt_metrics import lifting_multiply_adds, record, workspace_counts
+from dwt_timing import DWT_timing
+from dwt_vectorized_separable import _axis_slice, dwt_coeff_len, input_scale
+from dwt_workspace import DWT_workspace, workspace_key
+
+# Lifting factorization of the CDF9/7 filter pair (predict, update, predict, update, scale)
+CDF97_ALPHA = np.float32(-1.586134342059924)
+CDF97_BETA = np.float32(-0.052980118572961)
+CDF97_GAMMA = np.float32(0.882911075530934)
+CDF97_DELTA = np.float32(0.443506852043971)
+CDF97_K = 1.230174104914001
+
+# Lifting steps of CDF9/7 as (coefficient, predict), predict steps update the odd samples and update steps the even ones
+CDF97_STEPS = ((CDF97_ALPHA, True), (CDF97_BETA, False), (CDF97_GAMMA, True), (CDF97_DELTA, False))
+
+# Number of zero samples placed in front of the signal: the approximation coefficient c sits on the even sample
+# c * 2 - 4 of the input, and the lifting steps spread a sample over at most 4 neighbours
+LIFTING_HALO = 8
+
+# Number of elements processed per lifting block, so that the scratch buffer stays in the L2 cache
+LIFTING_BLOCK_ELEMS = 1 << 16
+
+
+def _lift_step(target, source, coef, axis, scratch, sign, predict):
+    """
+    One lifting step performed in place: target += sign * coef * (sum of the two neighbours in source)
+
+    :param: target: polyphase component that is updated (view into the work buffer)
+    :param: source: the other polyphase component (view into the work buffer)
+    :param: coef: lifting coefficient
+    :param: axis: axis along which the lifting is performed
+    :param: scratch: buffer with the same shape as target
+    :param: sign: 1 for the forward transform, -1 for the inverse transform
+    :param: predict: True if target[i] uses source[i] and source[i + 1] (odd samples), False if target[i] uses
+            source[i - 1] and source[i] (even samples). Neighbours outside of the buffer are zero
+    """
+    nd = target.ndim
+    first = _axis_slice(nd, axis, slice(0, 1))
+    last = _axis_slice(nd, axis, slice(-1, None))
+    head = _axis_slice(nd, axis, slice(None, -1))
+    tail = _axis_slice(nd, axis, slice(1, None))
+
+    if predict:
+        np.add(source[head], source[tail], out=scratch[head])
+        scratch[last] = source[last]
+    else:
+        np.add(source[head], source[tail], out=scratch[tail])
+        scratch[first] = source[first]
+
+    np.multiply(scratch, sign * coef, out=scratch)
+    np.add(target, scratch, out=target)
+
+
+def lifting_scratch_shape(shape, axis):
+    """
+    Shape of the scratch buffer used by lifting_pass on a work buffer of the given shape
+    """
+    other = 1 - axis
+    return _block_shape(shape, axis, other, max(1, LIFTING_BLOCK_ELEMS // shape[axis]))
+
+
+def _zero_border(buf, row_start, row_stop, col_start, col_stop):
+    """
+    Zero every element of the work buffer outside of the rectangle [row_start, row_stop) x [col_start, col_stop)
+    """
+    buf[:row_start] = 0
+    buf[row_stop:] = 0
+    buf[row_start:row_stop, :col_start] = 0
+    buf[row_start:row_stop, col_stop:] = 0
+
+
+def lifting_pass(buf, axis, inverse=False, scratch=None):
+    """
+    CDF9/7 lifting along axis of the work buffer, performed in place (without the final scaling)
+
+    After the forward pass the even samples along axis hold the (unscaled) lowpass coefficients and the odd samples
+    hold the (unscaled) highpass coefficients. The inverse pass undoes the steps in reverse order
+
+    :param: buf: float32 work buffer with an even length along axis
+    :param: axis: axis along which the lifting is performed
+    :param: inverse: whether to run the inverse lifting steps
+    :param: scratch: optional float32 buffer of shape lifting_scratch_shape(buf.shape, axis)
+    """
+    steps = CDF97_STEPS
+    sign = 1
+    if inverse:
+        steps = steps[::-1]
+        sign = -1
+
+    # Process the buffer in blocks along the other axis to bound the size of the scratch buffer
+    other = 1 - axis
+    block = max(1, LIFTING_BLOCK_ELEMS // buf.shape[axis])
+    if scratch is None:
+        scratch = np.empty(_block_shape(buf.shape, axis, other, block), dtype=np.float32)
+
+    for b_start in range(0, buf.shape[other], block):
+        b_stop = min(b_start + block, buf.shape[other])
+        blk = buf[_axis_slice(buf.ndim, other, slice(b_start, b_stop))]
+        scr = scratch[_axis_slice(scratch.ndim, other, slice(0, b_stop - b_start))]
+
+        even = blk[_axis_slice(blk.ndim, axis, slice(0, None, 2))]
+        odd = blk[_axis_slice(blk.ndim, axis, slice(1, None, 2))]
+        for coef, predict in steps:
+            if predict:
+                _lift_step(odd, even, coef, axis, scr, sign, True)
+            else:
+                _lift_step(even, odd, coef, axis, scr, sign, False)
+
+
+def _block_shape(shape, axis, other, block):
+    """
+    Shape of one polyphase component of a block of the work buffer
+    """
+    res = list(shape)
+    res[axis] = shape[axis] // 2
+    res[other] = min(block, shape[other])
+    return tuple(res)
+
+
+def _lifting_filters():
+    """
+    Impulse responses of the forward lifting scheme, laid out like cdf97_an_lo and cdf97_an_hi in gen_wavelet
+
+    :return: an_lo, an_hi: analysis filters of shape (10,)
+    """
+    # Coefficient c of a unit impulse at input index i is an_lo[c * 2 + 1 - i], so the filters are read off
+    # coefficient c = 4 by shifting the impulse to i = 9 - k. Coefficient c sits at buffer index LIFTING_HALO - 4 + 2c
+    an_lo = np.zeros(10)
+    an_hi = np.zeros(10)
+    for k in range(10):
+        buf = np.zeros((1, 32), dtype=np.float32)
+        buf[0, LIFTING_HALO + 9 - k] = 1
+        lifting_pass(buf, 1)
+        an_lo[k] = buf[0, LIFTING_HALO + 4] / CDF97_K
+        an_hi[k] = buf[0, LIFTING_HALO + 5] * CDF97_K
+    return an_lo, an_hi
+
+
+class DWT_lifting:
+    def __init__(self):
+        # The lifting scheme is specific to CDF9/7, so the filters passed in are checked against its impulse response
+        self.an_lo, self.an_hi = _lifting_filters()
+        self.maskwidth = 10
+
+        # Scale applied to each subband when it is read out of the work buffer (lowpass: 1/K, highpass: K per axis)
+        self.scale_a = np.float32(1 / CDF97_K ** 2)
+        self.scale_hv = np.float32(1)
+        self.scale_d = np.float32(CDF97_K ** 2)
+
+    def _check_filters(self, filters):
+        filters = np.asarray(filters)
+        if filters.shape[1] != self.maskwidth or not (np.allclose(filters[0], self.an_lo, atol=1e-6) and
+                                                      np.allclose(filters[1], self.an_hi, atol=1e-6)):
+            raise ValueError('The lifting scheme only supports the CDF9/7 filters defined in gen_wavelet')
+
+    def dwt_cpu_lifting(self, h_input, filters, BLOCK_WIDTH=None, out=None, workspace=None, scale=None):
+        """
+        Separable 2D DWT on the CPU using the lifting factorization of CDF9/7, updated in place in a single work buffer
+
+        :param: h_input: input image of shape (M, N)
+        :param: filters: filter stack of shape (4, 10) (an_lo, an_hi, syn_lo, syn_hi), must be the CDF9/7 filters
+        :param: BLOCK_WIDTH: unused, kept so that the call signature matches the CUDA kernels
+        :param: out: optional tuple of four float32 arrays (cA, cH, cV, cD) the coefficients are written into
+        :param: workspace: optional DWT_workspace the work buffer and outputs are taken from
+        :param: scale: factor applied to the input, see input_scale (uint8 and uint16 images are normalized to [0, 1]
+                by default), folded into the final scaling of the subbands
+
+        :return: h_cA, h_cH, h_cV, h_cD: 2D DWT coefficients of shape ((M + 9)//2, (N + 9)//2), same as run_DWT
+        :return: timing: DWT_timing of the call, the copy of the input into the work buffer is transfer_in
+        """
+        timing = DWT_timing('lifting')
+        self._check_filters(filters)
+
+        # Obtain the shape of the input matrix and of the output
+        dim_M = h_input.shape[0]
+        dim_N = h_input.shape[1]
+        dim_R = dwt_coeff_len(dim_M, self.maskwidth)
+        dim_C = dwt_coeff_len(dim_N, self.maskwidth)
+
+        # Without a workspace every buffer is allocated for this call only
+        if workspace is None:
+            workspace = DWT_workspace()
+        counts = workspace_counts(workspace)
+        key = workspace_key(h_input.shape, h_input.dtype, self.maskwidth)
+        timing.mark('setup')
+
+        # Work buffer with the zero halo around the input (only the buffer itself is ever written)
+        buf_shape = (2 * (dim_R + 4), 2 * (dim_C + 4))
+        buf = workspace.get(key, 'lifting_buf', buf_shape)
+        row_scratch = workspace.get(key, 'lifting_row_scratch', lifting_scratch_shape((dim_M, buf_shape[1]), 1))
+        col_scratch = workspace.get(key, 'lifting_col_scratch', lifting_scratch_shape(buf_shape, 0))
+        if out is None:
+            h_cA = workspace.get(key, 'cA', (dim_R, dim_C))
+            h_cH = workspace.get(key, 'cH', (dim_R, dim_C))
+            h_cV = workspace.get(key, 'cV', (dim_R, dim_C))
+            h_cD = workspace.get(key, 'cD', (dim_R, dim_C))
+        else:
+            h_cA, h_cH, h_cV, h_cD = out
+        timing.mark('alloc')
+
+        # The lifting steps are linear, so the scale of the input is applied with the scaling of the subbands
+        scale = input_scale(h_input.dtype, scale)
+
+        _zero_border(buf, LIFTING_HALO, LIFTING_HALO + dim_M, LIFTING_HALO, LIFTING_HALO + dim_N)
+        buf[LIFTING_HALO:LIFTING_HALO + dim_M, LIFTING_HALO:LIFTING_HALO + dim_N] = h_input
+        timing.mark('transfer_in')
+
+        # Lifting along each row (only rows holding data, the halo rows stay zero), then along each column
+        lifting_pass(buf[LIFTING_HALO:LIFTING_HALO + dim_M], 1, scratch=row_scratch)
+        lifting_pass(buf, 0, scratch=col_scratch)
+
+        # Read the subbands out of the polyphase components and apply the scaling
+        start = LIFTING_HALO - 4
+        rows_lo = slice(start, start + 2 * dim_R, 2)
+        rows_hi = slice(start + 1, start + 2 * dim_R, 2)
+        cols_lo = slice(start, start + 2 * dim_C, 2)
+        cols_hi = slice(start + 1, start + 2 * dim_C, 2)
+        np.multiply(buf[rows_lo, cols_lo], self.scale_a * scale, out=h_cA)
+        np.multiply(buf[rows_hi, cols_lo], self.scale_hv * scale, out=h_cH)
+        np.multiply(buf[rows_lo, cols_hi], self.scale_hv * scale, out=h_cV)
+        np.multiply(buf[rows_hi, cols_hi], self.scale_d * scale, out=h_cD)
+        timing.mark('compute')
+
+        timing.stop()
+        record(timing, h_input.size, (h_input,), (h_cA, h_cH, h_cV, h_cD),
+               lifting_multiply_adds(dim_M, dim_R, dim_C, len(CDF97_STEPS)), workspace, counts)
+
+        return h_cA, h_cH, h_cV, h_cD, timing
+
+    def idwt_cpu_lifting(self, h_cA, h_cH, h_cV, h_cD, filters=None, workspace=None):
+        """
+        Inverse 2D DWT on the CPU using the inverse lifting steps, same output as run_iDWT
+
+        :params: h_cA, h_cH, h_cV, h_cD: 2D DWT coefficients of shape (R, C)
+        :param: filters: optional filter stack of shape (4, 10), checked against CDF9/7 if given
+        :param: workspace: optional DWT_workspace the work buffer and output are taken from
+
+        :return: rec_sig: reconstructed image of shape (2R - 8, 2C - 8)
+        :return: timing: DWT_timing of the call, placing the subbands into the work buffer is transfer_in and the copy
+                 of the reconstruction out of it transfer_out
+        """
+        timing = DWT_timing('lifting_inverse')
+        if filters is not None:
+            self._check_filters(filters)
+
+        dim_R, dim_C = h_cA.shape
+        dim_M = 2 * dim_R - self.maskwidth + 2
+        dim_N = 2 * dim_C - self.maskwidth + 2
+
+        # Without a workspace every buffer is allocated for this call only
+        if workspace is None:
+            workspace = DWT_workspace()
+        counts = workspace_counts(workspace)
+        key = workspace_key(h_cA.shape, h_cA.dtype, self.maskwidth)
+        timing.mark('setup')
+
+        buf_shape = (2 * (dim_R + 4), 2 * (dim_C + 4))
+        buf = workspace.get(key, 'lifting_inv_buf', buf_shape)
+        row_scratch = workspace.get(key, 'lifting_inv_row_scratch', lifting_scratch_shape((dim_M, buf_shape[1]), 1))
+        col_scratch = workspace.get(key, 'lifting_inv_col_scratch', lifting_scratch_shape(buf_shape, 0))
+        rec_sig = workspace.get(key, 'lifting_rec', (dim_M, dim_N))
+        timing.mark('alloc')
+
+        # Place the subbands into the polyphase components, undoing the scaling
+        start = LIFTING_HALO - 4
+        _zero_border(buf, start, start + 2 * dim_R, start, start + 2 * dim_C)
+        rows_lo = slice(start, start + 2 * dim_R, 2)
+        rows_hi = slice(start + 1, start + 2 * dim_R, 2)
+        cols_lo = slice(start, start + 2 * dim_C, 2)
+        cols_hi = slice(start + 1, start + 2 * dim_C, 2)
+        np.divide(h_cA, self.scale_a, out=buf[rows_lo, cols_lo], casting='unsafe')
+        np.divide(h_cH, self.scale_hv, out=buf[rows_hi, cols_lo], casting='unsafe')
+        np.divide(h_cV, self.scale_hv, out=buf[rows_lo, cols_hi], casting='unsafe')
+        np.divide(h_cD, self.scale_d, out=buf[rows_hi, cols_hi], casting='unsafe')
+        timing.mark('transfer_in')
+
+        # Inverse lifting along each column, then along each row (only the rows that are kept)
+        lifting_pass(buf, 0, inverse=True, scratch=col_scratch)
+        lifting_pass(buf[LIFTING_HALO:LIFTING_HALO + dim_M], 1, inverse=True, scratch=row_scratch)
+        timing.mark('compute')
+        rec_sig[...] = buf[LIFTING_HALO:LIFTING_HALO + dim_M, LIFTING_HALO:LIFTING_HALO + dim_N]
+        timing.mark('transfer_out')
+
+        timing.stop()
+        record(timing, rec_sig.size, (h_cA, h_cH, h_cV, h_cD), (rec_sig,),
+               lifting_multiply_adds(dim_M, dim_R, dim_C, len(CDF97_STEPS)), workspace, counts)
+
+        return rec_sig, timing
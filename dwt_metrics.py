@@ -0,0 +1,157 @@
+import json
+import threading
+
+# Counters kept for each engine, with the name and help of their Prometheus metric
+METRICS = (
+    ('calls', 'dwt_calls_total', 'Number of transforms'),
+    ('pixels', 'dwt_pixels_total', 'Input samples transformed (pixels times channels or planes)'),
+    ('bytes_read', 'dwt_bytes_read_total', 'Bytes of the inputs of the transforms'),
+    ('bytes_written', 'dwt_bytes_written_total', 'Bytes of the outputs of the transforms'),
+    ('multiply_adds', 'dwt_multiply_adds_total', 'Estimated multiply-adds, from the filter length and output sizes'),
+    ('allocations', 'dwt_buffer_allocations_total', 'Buffers allocated by the workspace of the transforms'),
+    ('cache_hits', 'dwt_buffer_cache_hits_total', 'Buffers reused from the workspace of the transforms'),
+    ('seconds', 'dwt_seconds_total', 'Total time of the transforms in seconds'),
+)
+
+
+class DWT_metrics:
+    def __init__(self):
+        """
+        Running totals of the transforms of each engine, for capacity planning rather than single timings
+
+        The engines add to the process-wide registry at the end of every call, the counters are only ever reset
+        explicitly. Calls from several threads are counted under a lock
+        """
+        self.lock = threading.Lock()
+        self.totals = {}
+
+    def add(self, engine, **counts):
+        """
+        Add to the counters of an engine
+
+        :param: engine: name of the engine, e.g. 'vectorized'
+        :param: counts: increments, keyed by the names in METRICS
+        """
+        with self.lock:
+            totals = self.totals.get(engine)
+            if totals is None:
+                totals = self.totals[engine] = dict.fromkeys((name for name, _, _ in METRICS), 0)
+            for name, value in counts.items():
+                totals[name] += value
+
+    def snapshot(self):
+        """
+        :return: {engine: {metric: total}}, a copy that later calls do not change
+        """
+        with self.lock:
+            return {engine: dict(totals) for engine, totals in self.totals.items()}
+
+    def reset(self):
+        with self.lock:
+            self.totals.clear()
+
+    def to_prometheus(self):
+        """
+        :return: the counters in the Prometheus text exposition format, one labelled sample per engine
+        """
+        snapshot = self.snapshot()
+        lines = []
+        for name, metric, help_text in METRICS:
+            lines.append('# HELP {} {}'.format(metric, help_text))
+            lines.append('# TYPE {} counter'.format(metric))
+            for engine in sorted(snapshot):
+                lines.append('{}{{engine="{}"}} {}'.format(metric, engine, snapshot[engine][name]))
+        return '\n'.join(lines) + '\n'
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=1, sort_keys=True)
+
+    def dump(self, path, fmt=None):
+        """
+        Write the counters to a file
+
+        :param: path: output file
+        :param: fmt: 'prometheus' or 'json' (from the extension of path if not given, .json being JSON)
+        """
+        if fmt is None:
+            fmt = 'json' if path.endswith('.json') else 'prometheus'
+        if fmt not in ('prometheus', 'json'):
+            raise ValueError("Unknown format '{}', expected 'prometheus' or 'json'".format(fmt))
+        with open(path, 'w') as f:
+            f.write(self.to_json() if fmt == 'json' else self.to_prometheus())
+
+
+# Registry updated by every engine of the process
+registry = DWT_metrics()
+
+
+def workspace_counts(workspace):
+    """
+    :return: (hits, allocations) of a workspace so far, (0, 0) for None (the engine then creates a fresh one)
+    """
+    if workspace is None:
+        return 0, 0
+    return workspace.hits, workspace.allocations
+
+
+def forward_multiply_adds(dim_M, dim_R, dim_C, maskwidth, planes=1, separable=True):
+    """
+    Upper bound of the multiply-adds of a forward transform: every tap of every output is counted, including the halo
+    taps the engines skip at the borders
+
+    Separable: the row pass computes 2 outputs of maskwidth taps for each of the M x C intermediate samples and the
+    column pass 4 for each of the R x C coefficients. Non-separable: 4 outputs of maskwidth^2 taps per coefficient
+
+    :param: dim_M: number of input rows
+    :param: dim_R, dim_C: shape of one subband
+    :param: maskwidth: filter length
+    :param: planes: number of planes (channels, batch) transformed
+    :param: separable: whether the filters are applied as row and column passes
+    """
+    if separable:
+        return planes * maskwidth * (2 * dim_M * dim_C + 4 * dim_R * dim_C)
+    return planes * 4 * maskwidth * maskwidth * dim_R * dim_C
+
+
+def inverse_multiply_adds(dim_R, dim_C, dim_M, dim_N, maskwidth):
+    """
+    Upper bound of the multiply-adds of an inverse transform: each upsampled input contributes maskwidth / 2 taps to
+    every output sample, so the column pass costs maskwidth per sample of its two M x C outputs and the row pass
+    maskwidth per reconstructed sample, the taps falling outside the subbands at the borders included
+
+    :param: dim_R, dim_C: shape of one subband
+    :param: dim_M, dim_N: shape of the reconstruction
+    """
+    return maskwidth * (2 * dim_M * dim_C + dim_M * dim_N)
+
+
+def lifting_multiply_adds(dim_M, dim_R, dim_C, steps):
+    """
+    Estimated multiply-adds of a forward or inverse lifting transform: each predict or update step adds two weighted
+    neighbours to every other sample along the axis, so it costs one multiply-add per sample of the pass (the M x 2C
+    samples of the row pass and the 2R x 2C of the column pass), and each of the 4 R x C coefficients is scaled once.
+    The steps the engine also runs over its zero halo are not counted
+
+    :param: dim_M: number of rows of the image (the input of a forward, the reconstruction of an inverse transform)
+    :param: dim_R, dim_C: shape of one subband
+    :param: steps: number of predict and update steps (4 for CDF9/7)
+    """
+    return steps * (2 * dim_M * dim_C + 4 * dim_R * dim_C) + 4 * dim_R * dim_C
+
+
+def record(timing, pixels, inputs, outputs, multiply_adds, workspace=None, counts=(0, 0)):
+    """
+    Add one call of an engine to the process-wide registry, under the name of its timing record
+
+    :param: timing: DWT_timing of the call
+    :param: pixels: number of samples of the image (the input of a forward, the reconstruction of an inverse transform)
+    :param: inputs: arrays read by the call
+    :param: outputs: arrays written by the call
+    :param: multiply_adds: estimate from forward_multiply_adds, inverse_multiply_adds or lifting_multiply_adds
+    :param: workspace: workspace used by the call, if any
+    :param: counts: workspace_counts of the workspace given to the call, taken before it ran
+    """
+    hits, allocations = workspace_counts(workspace)
+    registry.add(timing.name, calls=1, pixels=pixels, bytes_read=sum(x.nbytes for x in inputs),
+                 bytes_written=sum(x.nbytes for x in outputs), multiply_adds=multiply_adds,
+                 allocations=allocations - counts[1], cache_hits=hits - counts[0], seconds=timing.total_time)
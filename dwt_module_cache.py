@@ -0,0 +1,133 @@
+import hashlib
+import os
+import tempfile
+
+# Directory of the on-disk cache of compiled kernels, can be overridden with the DWT_KERNEL_CACHE_DIR variable
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'dwt_kernels')
+
+
+class PyCUDACompiler:
+    """
+    Compiler interface used by KernelModuleCache, backed by nvcc through pycuda
+
+    Any object with the same three methods can replace it, e.g. a fake compiler in tests
+    """
+
+    def target(self):
+        """
+        :return: string identifying the architecture the binaries are built for, part of the on-disk cache key
+        """
+        import pycuda.driver as cuda
+        major, minor = cuda.Context.get_device().compute_capability()
+        return 'sm_{}{}'.format(major, minor)
+
+    def compile(self, source):
+        """
+        :param: source: CUDA source of the module
+        :return: cubin: compiled binary (bytes)
+        """
+        from pycuda import compiler
+        return compiler.compile(source)
+
+    def load(self, cubin):
+        """
+        :param: cubin: compiled binary (bytes)
+        :return: module: loaded module that provides get_function
+        """
+        import pycuda.driver as cuda
+        return cuda.module_from_buffer(cubin)
+
+
+class KernelModuleCache:
+    def __init__(self, compiler=None, cache_dir=None):
+        """
+        Cache of compiled kernel modules keyed by (kernel source hash, maskwidth, tile width), kept in memory and on disk
+
+        The kernel sources only have the maskwidth (%(M)s) and the output tile width (%(T)s) formatted in, the image
+        dimensions are kernel arguments, so steady-state calls never compile
+
+        :param: compiler: object with target(), compile(source) and load(cubin), defaults to PyCUDACompiler
+        :param: cache_dir: directory of the on-disk cache, None for the default and False to disable it
+        """
+        if compiler is None:
+            compiler = PyCUDACompiler()
+        if cache_dir is None:
+            cache_dir = os.environ.get('DWT_KERNEL_CACHE_DIR', DEFAULT_CACHE_DIR)
+
+        self.compiler = compiler
+        self.cache_dir = cache_dir
+        self.modules = {}
+
+        # hits: found in memory, disk_hits: loaded from disk without compiling, misses: compiled
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def stats(self):
+        """
+        :return: dictionary with the hit and miss counts
+        """
+        return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses}
+
+    def get_module(self, source, maskwidth, tile_width=None):
+        """
+        Return the compiled module for a kernel source, compiling it only if it is neither in memory nor on disk
+
+        :param: source: kernel source with %(M)s (and optionally %(T)s) placeholders
+        :param: maskwidth: length of the filter
+        :param: tile_width: width of the output tile for the tiled kernels, None otherwise
+
+        :return: module: loaded module that provides get_function
+        """
+        source_hash = hashlib.sha1(source.encode('utf-8')).hexdigest()
+        key = (source_hash, maskwidth, tile_width)
+
+        module = self.modules.get(key)
+        if module is not None:
+            self.hits += 1
+            return module
+
+        cubin = None
+        path = None
+        if self.cache_dir:
+            path = os.path.join(self.cache_dir, '{}_M{}_T{}_{}.cubin'.format(source_hash, maskwidth, tile_width,
+                                                                            self.compiler.target()))
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    cubin = f.read()
+                self.disk_hits += 1
+
+        if cubin is None:
+            self.misses += 1
+            cubin = self.compiler.compile(source % {'M': maskwidth, 'T': tile_width})
+            if path is not None:
+                self._write(path, cubin)
+
+        module = self.compiler.load(cubin)
+        self.modules[key] = module
+
+        return module
+
+    def _write(self, path, cubin):
+        """
+        Write a compiled binary to the disk cache atomically, so concurrent processes never read a partial file
+        """
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(cubin)
+        os.replace(tmp_path, path)
+
+
+_default_module_cache = None
+
+
+def default_module_cache():
+    """
+    :return: the process-wide module cache shared by the CUDA engines
+    """
+    global _default_module_cache
+    if _default_module_cache is None:
+        _default_module_cache = KernelModuleCache()
+    return _default_module_cache
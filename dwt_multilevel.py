@@ -0,0 +1,122 @@
+import numpy as np
+
+from dwt_vectorized_separable import DWT_vectorized_separable, dwt_coeff_len
+from dwt_vectorized_inverse import DWT_vectorized_inverse
+from dwt_workspace import workspace_key
+
+
+def wavedec2_shapes(shape, maskwidth, level):
+    """
+    Shape of the subbands at each decomposition level
+
+    :param: shape: shape (M, N) of the input image
+    :param: maskwidth: length of the filter (10 for CDF9/7)
+    :param: level: number of decomposition levels
+
+    :return: list of (R, C) shapes, from the first (finest) to the last (coarsest) level
+    """
+    if level < 1:
+        raise ValueError('The number of decomposition levels must be at least 1, got {}'.format(level))
+
+    shapes = []
+    dim_M, dim_N = shape
+    for _ in range(level):
+        dim_M = dwt_coeff_len(dim_M, maskwidth)
+        dim_N = dwt_coeff_len(dim_N, maskwidth)
+        shapes.append((dim_M, dim_N))
+    return shapes
+
+
+def alloc_coeff_buffer(shape, maskwidth, level):
+    """
+    Preallocate the single float32 buffer that holds the subbands of every level
+
+    :param: shape: shape (M, N) of the input image
+    :param: maskwidth: length of the filter (10 for CDF9/7)
+    :param: level: number of decomposition levels
+
+    :return: 1D float32 buffer large enough for 4 subbands per level
+    """
+    return np.empty(sum(4 * R * C for R, C in wavedec2_shapes(shape, maskwidth, level)), dtype=np.float32)
+
+
+class DWT_multilevel:
+    def __init__(self, dwt_engine=None, idwt_engine=None):
+        """
+        :param: dwt_engine: single level engine with the signature of the dwt_gpu_* / dwt_cpu_* methods, i.e.
+                dwt_engine(h_input, filters, BLOCK_WIDTH, out=(cA, cH, cV, cD), workspace=None). Defaults to the
+                vectorized CPU engine
+        :param: idwt_engine: single level inverse engine with the signature
+                idwt_engine(cA, cH, cV, cD, filters, workspace=None). Defaults to the vectorized CPU inverse engine
+        """
+        if dwt_engine is None:
+            dwt_engine = DWT_vectorized_separable().dwt_cpu_vectorized_separable
+        if idwt_engine is None:
+            idwt_engine = DWT_vectorized_inverse().idwt_cpu_vectorized
+        self.dwt_engine = dwt_engine
+        self.idwt_engine = idwt_engine
+
+    def wavedec2(self, h_input, filters, level, BLOCK_WIDTH=32, coeff_buffer=None, workspace=None):
+        """
+        Multi-level 2D DWT, the cA of each level is transformed again by the next level
+
+        The subbands of every level are views into one contiguous buffer laid out level by level as (cA, cH, cV, cD),
+        so the cA of a level is passed to the next level as is, without conversion or reallocation
+
+        :param: h_input: input image of shape (M, N)
+        :param: filters: filter stack of shape (4, maskwidth) (an_lo, an_hi, syn_lo, syn_hi)
+        :param: level: number of decomposition levels
+        :param: BLOCK_WIDTH: block width passed to the engine (unused by the CPU engines)
+        :param: coeff_buffer: optional buffer from alloc_coeff_buffer, reused across calls if given
+        :param: workspace: optional DWT_workspace passed to the engine for its intermediate buffers, also holds the
+                coefficient buffer if coeff_buffer is not given
+
+        :return: coeffs: [cA_n, (cH_n, cV_n, cD_n), ..., (cH_1, cV_1, cD_1)], same order as pywt.wavedec2
+        :return: level_timings: DWT_timing returned by the engine for each level, from the first to the last level
+        """
+        maskwidth = filters[0].shape[0]
+        shapes = wavedec2_shapes(h_input.shape, maskwidth, level)
+        if coeff_buffer is None and workspace is not None:
+            coeff_buffer = workspace.get(workspace_key(h_input.shape, h_input.dtype, maskwidth),
+                                         'coeff_buffer_{}'.format(level), (sum(4 * R * C for R, C in shapes),))
+        elif coeff_buffer is None:
+            coeff_buffer = alloc_coeff_buffer(h_input.shape, maskwidth, level)
+
+        details = []
+        level_timings = []
+        offset = 0
+        cA = h_input
+        for dim_R, dim_C in shapes:
+            size = dim_R * dim_C
+            out = tuple(coeff_buffer[offset + i * size:offset + (i + 1) * size].reshape(dim_R, dim_C) for i in range(4))
+            offset += 4 * size
+
+            cA, cH, cV, cD, level_timing = self.dwt_engine(cA, filters, BLOCK_WIDTH, out=out, workspace=workspace)
+            details.append((cH, cV, cD))
+            level_timings.append(level_timing)
+
+        coeffs = [cA] + details[::-1]
+
+        return coeffs, level_timings
+
+    def waverec2(self, coeffs, filters, workspace=None):
+        """
+        Multi-level inverse 2D DWT, same as pywt.waverec2 in zero-padding mode
+
+        :param: coeffs: [cA_n, (cH_n, cV_n, cD_n), ..., (cH_1, cV_1, cD_1)] as returned by wavedec2
+        :param: filters: filter stack of shape (4, maskwidth) (an_lo, an_hi, syn_lo, syn_hi)
+        :param: workspace: optional DWT_workspace passed to the inverse engine, the reconstruction is then owned by it
+
+        :return: rec_sig: reconstructed image
+        :return: level_timings: DWT_timing returned by the inverse engine for each level, from the last to the first
+                 level
+        """
+        level_timings = []
+        cA = coeffs[0]
+        for cH, cV, cD in coeffs[1:]:
+            # The reconstruction of a level can be one sample larger than the details of the next level
+            cA = cA[:cH.shape[0], :cH.shape[1]]
+            cA, level_timing = self.idwt_engine(cA, cH, cV, cD, filters, workspace=workspace)
+            level_timings.append(level_timing)
+
+        return cA, level_timings
@@ -0,0 +1,228 @@
+import numpy as np
+import os
+import time
+import weakref
+from multiprocessing import Pool, resource_tracker, shared_memory
+
+import dwt_trace
+from dwt_autotune import tuned_params
+from dwt_metrics import forward_multiply_adds, record, workspace_counts
+from dwt_tiled_cpu import tile_buffer_sizes, transform_tile
+from dwt_timing import DWT_timing
+from dwt_vectorized_separable import dwt_coeff_len, input_scale
+from dwt_workspace import DWT_workspace, workspace_key
+
+# Number of strips handed to each process, so that uneven strips balance out
+STRIPS_PER_PROCESS = 4
+
+# Shared memory segments (by role) and tile buffers attached by a worker process, reused across tasks
+_worker_segments = {}
+_worker_buffers = []
+
+
+def _attach(role, name, shape):
+    """
+    View of the shared memory segment called name in a worker, the segment stays attached until the parent replaces it
+    """
+    shm = _worker_segments.get(role)
+    if shm is None or shm.name != name:
+        if shm is not None:
+            shm.close()
+        shm = _worker_segments[role] = shared_memory.SharedMemory(name=name)
+    return np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+
+
+def _strip_buffers(sizes):
+    """
+    Tile buffers of a worker, grown when a larger strip comes in
+    """
+    if len(_worker_buffers) != len(sizes) or any(buf.size < size for buf, size in zip(_worker_buffers, sizes)):
+        _worker_buffers[:] = [np.empty(size, dtype=np.float32) for size in sizes]
+    return _worker_buffers
+
+
+def _transform_strip(names, input_shape, output_shape, filter_bytes, row_start, row_stop, scale, trace=False):
+    """
+    Task run by a worker: transform the output rows row_start ... row_stop - 1 in place in the shared memory
+
+    Only the segment names, shapes, filter bytes, row range and input scale are sent to the worker, the image data
+    never is
+
+    :return: DWT_tracer with the event of the strip if trace is set (the parent merges it into its trace), else None
+    """
+    start_ns = time.perf_counter_ns()
+    filters = np.frombuffer(filter_bytes, dtype=np.float32).reshape(2, -1)
+    maskwidth = filters.shape[1]
+    h_input = _attach('input', names[0], input_shape)
+    outs = tuple(_attach(role, name, output_shape) for role, name in zip(('cA', 'cH', 'cV', 'cD'), names[1:]))
+
+    dim_C = output_shape[1]
+    buffers = _strip_buffers(tile_buffer_sizes(row_stop - row_start, dim_C, maskwidth))
+    transform_tile(h_input, filters[0], filters[1], outs, row_start, row_stop, 0, dim_C, buffers, scale=scale)
+
+    if trace:
+        strip_trace = dwt_trace.DWT_tracer()
+        strip_trace.add('strip', 'multiprocess', start_ns, time.perf_counter_ns(), {'rows': [row_start, row_stop]})
+        return strip_trace
+
+
+def _release(pool, segments):
+    """
+    Stop the process pool and free the shared memory segments
+    """
+    if pool is not None:
+        pool.terminate()
+    for shm, _ in segments.values():
+        shm.close()
+        shm.unlink()
+    segments.clear()
+
+
+class DWT_multiprocess_cpu:
+    def __init__(self, n_processes=None, strip_rows=None):
+        """
+        Separable 2D DWT split into horizontal strips across a persistent pool of processes
+
+        The input and the four subbands live in multiprocessing.shared_memory segments that are kept across calls of
+        the same shape, and each strip is transformed in place by a worker with transform_tile, so the strips share
+        the (maskwidth - 2) halo rows of the input without copying them and the result is bit-identical to
+        dwt_cpu_vectorized_separable. Call close() (or use the engine as a context manager) to stop the workers
+
+        :param: n_processes: number of worker processes (defaults to the number of CPUs)
+        :param: strip_rows: output rows per strip (taken from the tuning file of dwt_autotune for the shape and dtype
+                of each input, or STRIPS_PER_PROCESS strips per process, if not given)
+        """
+        if n_processes is None:
+            n_processes = os.cpu_count() or 1
+        self.n_processes = n_processes
+        self.strip_rows = strip_rows
+
+        # The workers must share the resource tracker of this process, otherwise the tracker of each worker unlinks
+        # the segments it attached to when the worker exits
+        resource_tracker.ensure_running()
+        self.pool = Pool(processes=n_processes) if n_processes > 1 else None
+
+        # Shared memory segments by role: (SharedMemory, shape)
+        self.segments = {}
+        self._finalizer = weakref.finalize(self, _release, self.pool, self.segments)
+
+    def close(self):
+        """
+        Stop the worker processes and free the shared memory
+        """
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _segment(self, role, shape):
+        """
+        Shared memory array for role, only reallocated when the shape changes
+        """
+        shm, seg_shape = self.segments.get(role, (None, None))
+        if shm is None or seg_shape != shape:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+            shm = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * 4))
+            self.segments[role] = (shm, shape)
+        return np.ndarray(shape, dtype=np.float32, buffer=shm.buf), shm.name
+
+    def dwt_cpu_multiprocess(self, h_input, filters, BLOCK_WIDTH=None, out=None, workspace=None, scale=None):
+        """
+        Multiprocess separable 2D DWT on the CPU, same output as dwt_cpu_vectorized_separable
+
+        :param: h_input: input image of shape (M, N)
+        :param: filters: filter stack of shape (4, maskwidth) (an_lo, an_hi, syn_lo, syn_hi)
+        :param: BLOCK_WIDTH: unused, kept so that the call signature matches the CUDA kernels
+        :param: out: optional tuple of four float32 arrays (cA, cH, cV, cD) the coefficients are copied into
+        :param: workspace: optional DWT_workspace the output buffers are taken from
+        :param: scale: factor applied to the input in the row pass, see input_scale (uint8 and uint16 images are
+                normalized to [0, 1] by default)
+
+        :return: h_cA, h_cH, h_cV, h_cD: 2D DWT coefficients of shape ((M + maskwidth - 1)//2,
+                 (N + maskwidth - 1)//2)
+        :return: timing: DWT_timing of the call, the copies in and out of the shared memory are transfer_in and
+                 transfer_out
+        """
+        timing = DWT_timing('multiprocess')
+        if h_input.ndim != 2:
+            raise ValueError('Expected an image of shape (M, N), got shape {}'.format(h_input.shape))
+        if not self._finalizer.alive:
+            raise ValueError('The engine has been closed')
+
+        # Obtain the shape of the input matrix
+        dim_M, dim_N = h_input.shape
+        maskwidth = filters[0].shape[0]
+
+        # Without a workspace every buffer is allocated for this call only
+        if workspace is None:
+            workspace = DWT_workspace()
+        counts = workspace_counts(workspace)
+        key = workspace_key(h_input.shape, h_input.dtype, maskwidth)
+
+        # Obtain the analysis filters, sent to the workers as raw bytes
+        filters = workspace.filters(filters)
+        filter_bytes = np.ascontiguousarray(filters[:2]).tobytes()
+        scale = input_scale(h_input.dtype, scale)
+
+        # Compute the size of the output of the wavelet transform
+        dim_R = dwt_coeff_len(dim_M, maskwidth)
+        dim_C = dwt_coeff_len(dim_N, maskwidth)
+
+        # Split the outputs into horizontal strips
+        strip_rows = self.strip_rows
+        if strip_rows is None:
+            strip_rows = tuned_params('multiprocess', h_input.shape, h_input.dtype).get('strip_rows')
+        if strip_rows is None:
+            strip_rows = -(-dim_R // (self.n_processes * STRIPS_PER_PROCESS))
+        strip_rows = max(1, min(strip_rows, dim_R))
+        timing.mark('setup')
+
+        # The input and the subbands live in shared memory, the subbands are written there by the workers
+        s_input, input_name = self._segment('input', (dim_M, dim_N))
+        s_outs, out_names = zip(*(self._segment(role, (dim_R, dim_C)) for role in ('cA', 'cH', 'cV', 'cD')))
+        names = (input_name,) + out_names
+        trace = dwt_trace.tracer is not None
+        tasks = [(names, (dim_M, dim_N), (dim_R, dim_C), filter_bytes, row_start, min(row_start + strip_rows, dim_R),
+                  scale, trace)
+                 for row_start in range(0, dim_R, strip_rows)]
+
+        if self.pool is None:
+            buffers = [workspace.get(key, 'strip_buf{}'.format(i), (size,))
+                       for i, size in enumerate(tile_buffer_sizes(strip_rows, dim_C, maskwidth))]
+        timing.mark('alloc')
+
+        # Copy the input into shared memory (converted to float32 by the copy)
+        s_input[...] = h_input
+        timing.mark('transfer_in')
+
+        if self.pool is None:
+            for task in tasks:
+                transform_tile(s_input, filters[0], filters[1], s_outs, task[4], task[5], 0, dim_C, buffers,
+                               scale=scale)
+        else:
+            strip_traces = self.pool.starmap(_transform_strip, tasks)
+        timing.mark('compute')
+
+        # Copy the subbands out of the shared memory, which is overwritten by the next call
+        if out is None:
+            out = tuple(workspace.get(key, name, (dim_R, dim_C)) for name in ('cA', 'cH', 'cV', 'cD'))
+        timing.mark('alloc')
+        for dst, src in zip(out, s_outs):
+            dst[...] = src
+        timing.mark('transfer_out')
+
+        # The strips show up on the lanes of the worker processes
+        if trace and self.pool is not None and dwt_trace.tracer is not None:
+            for strip_trace in strip_traces:
+                dwt_trace.tracer.merge(strip_trace)
+
+        timing.stop()
+        record(timing, h_input.size, (h_input,), out,
+               forward_multiply_adds(dim_M, dim_R, dim_C, maskwidth), workspace, counts)
+
+        return out[0], out[1], out[2], out[3], timing
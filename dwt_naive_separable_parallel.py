@@ -1,22 +1,23 @@
-import matplotlib as mpl
-mpl.use('agg')
 import numpy as np
-from pycuda import compiler, gpuarray, tools
-import pycuda.driver as cuda
-import time
-import matplotlib.pyplot as plt
 
-# Initialize the device
-import pycuda.autoinit
-plt.ioff()
+from dwt_autotune import DEFAULT_BLOCK_WIDTH, tuned_params
+from dwt_cuda import cuda_context
+from dwt_module_cache import default_module_cache
+from dwt_metrics import forward_multiply_adds, record, workspace_counts
+from dwt_timing import DWT_timing
+from dwt_workspace import DWT_workspace, workspace_key
 
 class DWT_naive_separable:
-    def __init__(self):
+    def __init__(self, module_cache=None):
+        # Compiled kernels are shared across calls and image shapes through the module cache
+        if module_cache is None:
+            module_cache = default_module_cache()
+        self.module_cache = module_cache
 
         # Grid size should be (ceil((N + maskwidth - 1)/2), M) for input image shape (M, N) to avoid wasting threads
         # and to make indexing work
         self.dwt_forward1 = """
-        __global__ void w_kernel_forward1(float* input, float* tmp_a1, float* tmp_a2, float* filter_lo, float* filter_hi){
+        __global__ void w_kernel_forward1(float* input, float* tmp_a1, float* tmp_a2, float* filter_lo, float* filter_hi, int H, int W){
             // params:
             // float* input: input image of shape (M, N)
             // float* tmp_a1: subband 1 subject to second forward pass
@@ -31,11 +32,9 @@ class DWT_naive_separable:
             // Obtain the dimension of the problem
             // size of the mask, width and height of input image
             // int maskwidth: length of the filter (default is 10 for CDF9/7)
-            // int H: number of rows for input (height) (equals to M)
-            // int W: number of columns for input (width) (equals to N)
+            // int H: number of rows for input (height) (equals to M), passed at runtime
+            // int W: number of columns for input (width) (equals to N), passed at runtime
             int maskwidth = %(M)s;
-            int H = %(H)s;
-            int W = %(W)s;
 
             // Obtain half of the width
             int W_half = (W + maskwidth - 1)/2;
@@ -80,7 +79,7 @@ class DWT_naive_separable:
         # Grid size should be (ceil((N + maskwidth - 1)/2), ceil((M + maskwidth - 1)/2)) for input image shape (M, N)
         # to avoid wasting threads
         self.dwt_forward2 = """
-        __global__ void w_kernel_forward2(float* tmp_a1, float* tmp_a2, float* c_a, float* c_h, float* c_v, float* c_d, float* filter_lo, float* filter_hi){
+        __global__ void w_kernel_forward2(float* tmp_a1, float* tmp_a2, float* c_a, float* c_h, float* c_v, float* c_d, float* filter_lo, float* filter_hi, int H, int W){
             // params:
             // float* tmp_a1: subband 1 subject to second forward pass
             // float* tmp_a2: subband 2 subject to second forward pass
@@ -98,11 +97,9 @@ class DWT_naive_separable:
             // Obtain the dimension of the problem
             // size of the mask, width and height of input image
             // int maskwidth: length of the filter (default is 10 for CDF9/7)
-            // int H: number of rows for input (height) (equals to M)
-            // int W: number of columns for input (width) (equals to N)
+            // int H: number of rows for input (height) (equals to M), passed at runtime
+            // int W: number of columns for input (width) (equals to N), passed at runtime
             int maskwidth = %(M)s;
-            int H = %(H)s;
-            int W = %(W)s;
 
             // Obtain half of the height and width
             int H_half = (H + maskwidth - 1)/2;
@@ -150,20 +147,40 @@ class DWT_naive_separable:
         }
         """
 
-    def dwt_gpu_naive_separable(self, h_input, filters, BLOCK_WIDTH):
+    def dwt_gpu_naive_separable(self, h_input, filters, BLOCK_WIDTH=None, out=None, workspace=None):
+        # Every phase of the call is charged to the DWT_timing returned with the coefficients
+        timing = DWT_timing('gpu_naive')
+
+        # pycuda is only imported, and the CUDA context created, by the first call
+        cuda_context()
+        import pycuda.driver as cuda
+        from pycuda import gpuarray
+
         # Obtain the shape of the input matrix
         dim_M = h_input.shape[0]
         dim_N = h_input.shape[1]
         maskwidth = filters[0].shape[0]
 
+        # Without a block width, the tuned one of this shape and dtype (see dwt_autotune) or the default
+        if BLOCK_WIDTH is None:
+            tuned = tuned_params('gpu_naive', h_input.shape, h_input.dtype)
+            BLOCK_WIDTH = tuned.get('BLOCK_WIDTH', DEFAULT_BLOCK_WIDTH)
+
+        # Without a workspace every buffer is allocated for this call only
+        if workspace is None:
+            workspace = DWT_workspace()
+        counts = workspace_counts(workspace)
+        key = workspace_key(h_input.shape, h_input.dtype, maskwidth)
+
         # Obtain the filters for DWT
-        filters = filters.astype(np.float32)
+        filters = workspace.filters(filters)
         h_filter_lo = filters[0, :]
-        h_fitler_hi = filters[1, :]
+        h_filter_hi = filters[1, :]
 
-        # Compute the size of the output of the wavelet transform
-        dim_R = int(np.ceil(((dim_M + maskwidth - 1)/2)))
-        dim_C = int(np.ceil(((dim_N + maskwidth - 1)/2)))
+        # Compute the size of the output of the wavelet transform (integer division, same as H_half and W_half in the
+        # kernels)
+        dim_R = (dim_M + maskwidth - 1)//2
+        dim_C = (dim_N + maskwidth - 1)//2
 
         # Calculate the number of blocks
         # Note that final output has shape (R, C)
@@ -171,67 +188,66 @@ class DWT_naive_separable:
         BLOCK_Y1 = int(np.ceil(dim_M / float(BLOCK_WIDTH)))
         BLOCK_Y2 = int(np.ceil(dim_R / float(BLOCK_WIDTH)))
 
-        # Create the various empty arrays on host and type conversion for input
-        h_input = h_input.astype(np.float32)
-        h_tmp_a1 = np.zeros(shape=(dim_M, dim_C), dtype=np.float32)
-        h_tmp_a2 = np.zeros(shape=(dim_M, dim_C), dtype=np.float32)
-
-        h_cA = np.zeros(shape=(dim_R, dim_C), dtype=np.float32)
-        h_cH = np.zeros(shape=(dim_R, dim_C), dtype=np.float32)
-        h_cV = np.zeros(shape=(dim_R, dim_C), dtype=np.float32)
-        h_cD = np.zeros(shape=(dim_R, dim_C), dtype=np.float32)
-
-        # Transfer data to device
-        d_input = gpuarray.to_gpu(h_input)
-        d_tmp_a1 = gpuarray.to_gpu(h_tmp_a1)
-        d_tmp_a2 = gpuarray.to_gpu(h_tmp_a2)
-
-        d_cA = gpuarray.to_gpu(h_cA)
-        d_cH = gpuarray.to_gpu(h_cH)
-        d_cV = gpuarray.to_gpu(h_cV)
-        d_cD = gpuarray.to_gpu(h_cD)
-
-        d_filter_lo = gpuarray.to_gpu(h_filter_lo)
-        d_filter_hi = gpuarray.to_gpu(h_fitler_hi)
-
-        # Call kernel
-        dwt_forward1_naive_kernel = self.dwt_forward1 % {
-            'M': maskwidth,
-            'H': dim_M,
-            'W': dim_N
-        }
-
-        dwt_forward2_naive_kernel = self.dwt_forward2 % {
-            'M': maskwidth,
-            'H': dim_M,
-            'W': dim_N
-        }
-
-        # Call kernel function
-        prg_dwt_forward1_naive = compiler.SourceModule(dwt_forward1_naive_kernel)
-        prg_dwt_forward2_naive = compiler.SourceModule(dwt_forward2_naive_kernel)
+        # Type conversion for input
+        # (no copy if the input is already a contiguous float32 array, e.g. cA of a previous level)
+        h_input = np.ascontiguousarray(h_input, dtype=np.float32)
+        timing.mark('setup')
+
+        # Obtain the device arrays from the workspace, every element of the intermediate and output arrays is
+        # written by the kernels so they are neither zeroed nor uploaded
+        d_input = workspace.get(key, 'd_input', (dim_M, dim_N), alloc=gpuarray.empty)
+        d_tmp_a1 = workspace.get(key, 'd_tmp_a1', (dim_M, dim_C), alloc=gpuarray.empty)
+        d_tmp_a2 = workspace.get(key, 'd_tmp_a2', (dim_M, dim_C), alloc=gpuarray.empty)
+
+        d_cA = workspace.get(key, 'd_cA', (dim_R, dim_C), alloc=gpuarray.empty)
+        d_cH = workspace.get(key, 'd_cH', (dim_R, dim_C), alloc=gpuarray.empty)
+        d_cV = workspace.get(key, 'd_cV', (dim_R, dim_C), alloc=gpuarray.empty)
+        d_cD = workspace.get(key, 'd_cD', (dim_R, dim_C), alloc=gpuarray.empty)
+        timing.mark('alloc')
+
+        # Transfer data to device (the filters only once per distinct filter stack)
+        d_input.set(h_input)
+        d_filter_lo, d_filter_hi = workspace.memo(('d_filters', filters.tobytes()),
+                                                  lambda: (gpuarray.to_gpu(h_filter_lo), gpuarray.to_gpu(h_filter_hi)))
+        timing.mark('transfer_in')
+
+        # Obtain the compiled kernels from the module cache (only compiled once per maskwidth and tile width)
+        prg_dwt_forward1_naive = self.module_cache.get_module(self.dwt_forward1, maskwidth)
+        prg_dwt_forward2_naive = self.module_cache.get_module(self.dwt_forward2, maskwidth)
         dwt_forward1_naive = prg_dwt_forward1_naive.get_function("w_kernel_forward1")
         dwt_forward2_naive = prg_dwt_forward2_naive.get_function("w_kernel_forward2")
-        tic = cuda.Event()
-        toc = cuda.Event()
+        timing.mark('compile')
 
-        # Execute the kernels and record time taken for both kernels to complete their tasks
-        tic.record()
-        dwt_forward1_naive(d_input, d_tmp_a1, d_tmp_a2, d_filter_lo, d_filter_hi,
+        # Execute the kernels and wait for both kernels to complete their tasks
+        dwt_forward1_naive(d_input, d_tmp_a1, d_tmp_a2, d_filter_lo, d_filter_hi, np.int32(dim_M), np.int32(dim_N),
                            block=(BLOCK_WIDTH, BLOCK_WIDTH, 1), grid=(BLOCK_X, BLOCK_Y1, 1))
-        dwt_forward2_naive(d_tmp_a1, d_tmp_a2, d_cA, d_cH, d_cV, d_cD, d_filter_lo, d_filter_hi,
+        dwt_forward2_naive(d_tmp_a1, d_tmp_a2, d_cA, d_cH, d_cV, d_cD, d_filter_lo, d_filter_hi, np.int32(dim_M), np.int32(dim_N),
                            block=(BLOCK_WIDTH, BLOCK_WIDTH, 1), grid=(BLOCK_X, BLOCK_Y2, 1))
-        toc.record()
-        toc.synchronize()
+        cuda.Context.synchronize()
+        timing.mark('compute')
 
         # Obtain the outputs
-        kernel_time = tic.time_till(toc)*1e-3
-        h_cA = d_cA.get()
-        h_cH = d_cH.get()
-        h_cV = d_cV.get()
-        h_cD = d_cD.get()
-
-        return h_cA, h_cH, h_cV, h_cD, kernel_time
+        if out is None:
+            h_cA = workspace.get(key, 'cA', (dim_R, dim_C))
+            h_cH = workspace.get(key, 'cH', (dim_R, dim_C))
+            h_cV = workspace.get(key, 'cV', (dim_R, dim_C))
+            h_cD = workspace.get(key, 'cD', (dim_R, dim_C))
+        else:
+            h_cA, h_cH, h_cV, h_cD = out
+        timing.mark('alloc')
+
+        # Read the outputs back directly into the host arrays
+        d_cA.get(ary=h_cA)
+        d_cH.get(ary=h_cH)
+        d_cV.get(ary=h_cV)
+        d_cD.get(ary=h_cD)
+        timing.mark('transfer_out')
+
+        timing.stop()
+        record(timing, h_input.size, (h_input,), (h_cA, h_cH, h_cV, h_cD),
+               forward_multiply_adds(dim_M, dim_R, dim_C, maskwidth), workspace, counts)
+
+        return h_cA, h_cH, h_cV, h_cD, timing
 
 
 
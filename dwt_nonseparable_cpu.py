@@ -0,0 +1,178 @@
+import numpy as np
+
+from dwt_metrics import forward_multiply_adds, record, workspace_counts
+from dwt_timing import DWT_timing
+from dwt_vectorized_separable import DWT_vectorized_separable, _tap_range, dwt_coeff_len, input_scale
+from dwt_workspace import DWT_workspace, workspace_key
+
+# Relative tolerance of the rank-1 test of a 2D filter bank
+RANK1_RTOL = 1e-6
+
+
+def create2Dfilter(a, b, length=None):
+    """
+    2D filter whose rows are filtered by a and columns by b, i.e. result[j][i] = a[i] * b[j]
+
+    :param: a: horizontal 1D filter
+    :param: b: vertical 1D filter
+    :param: length: number of taps used from a and b (all of them if not given)
+
+    :return: float32 array of shape (length, length)
+    """
+    if length is None:
+        length = len(a)
+    return np.outer(np.asarray(b[:length], dtype=np.float32), np.asarray(a[:length], dtype=np.float32))
+
+
+def filter_bank(filters):
+    """
+    :param: filters: filter stack of shape (4, maskwidth) (an_lo, an_hi, syn_lo, syn_hi)
+    :return: bank of the four 2D analysis filters (LL, LH, HL, HH) of shape (4, maskwidth, maskwidth), LH being the
+             highpass along the columns and lowpass along the rows (the cH subband) as in DWT_nonseparable
+    """
+    h_filter_lo = filters[0]
+    h_filter_hi = filters[1]
+    return np.stack((create2Dfilter(h_filter_lo, h_filter_lo), create2Dfilter(h_filter_lo, h_filter_hi),
+                     create2Dfilter(h_filter_hi, h_filter_lo), create2Dfilter(h_filter_hi, h_filter_hi)))
+
+
+def separable_filters(bank, rtol=RANK1_RTOL):
+    """
+    Factor a 2D filter bank into the 1D lowpass and highpass filters it was built from, if it is separable
+
+    The lowpass is the leading singular vector of LL and the highpass is recovered from LH, so the signs of both are
+    consistent, then all four 2D filters are checked against the rank-1 bank rebuilt from them
+
+    :param: bank: bank of shape (4, maskwidth, maskwidth) (LL, LH, HL, HH)
+    :param: rtol: tolerance relative to the largest coefficient of the bank
+
+    :return: float32 stack (lo, hi) of shape (2, maskwidth), or None if the bank is not separable
+    """
+    bank = np.asarray(bank, dtype=np.float64)
+    scale = np.abs(bank).max()
+    if scale == 0:
+        return None
+
+    _, s, vt = np.linalg.svd(bank[0])
+    lo = vt[0] * np.sqrt(s[0])
+    if not np.any(lo):
+        return None
+    hi = bank[1].dot(lo) / lo.dot(lo)
+
+    rebuilt = np.stack((np.outer(lo, lo), np.outer(hi, lo), np.outer(lo, hi), np.outer(hi, hi)))
+    if np.abs(rebuilt - bank).max() > rtol * scale:
+        return None
+    return np.stack((lo, hi)).astype(np.float32)
+
+
+class DWT_nonseparable_cpu:
+    def __init__(self, separable_engine=None):
+        """
+        Non-separable 2D DWT on the CPU, the numpy counterpart of DWT_nonseparable
+
+        :param: separable_engine: engine the separable filter banks are routed to, with the signature of
+                dwt_cpu_vectorized_separable (defaults to it), including its scale argument
+        """
+        if separable_engine is None:
+            separable_engine = DWT_vectorized_separable().dwt_cpu_vectorized_separable
+        self.separable_engine = separable_engine
+
+    def dwt_cpu_nonseparable(self, h_input, filters, BLOCK_WIDTH=None, out=None, workspace=None, scale=None):
+        """
+        2D DWT with a bank of four 2D filters, evaluated directly only if the bank is not separable
+
+        A stack of 1D filters, or a bank that factors into one, is routed to the separable engine (about 4 * maskwidth
+        multiply-adds per output instead of 4 * maskwidth^2). Other banks are evaluated in polyphase form: the input is
+        split once into its four (even / odd row, even / odd column) phases and each of the maskwidth^2 taps updates
+        all four subbands from a contiguous slice of one phase
+
+        :param: h_input: input image of shape (M, N)
+        :param: filters: filter stack of shape (4, maskwidth) (an_lo, an_hi, syn_lo, syn_hi), or a 2D filter bank of
+                shape (4, maskwidth, maskwidth) (LL, LH, HL, HH)
+        :param: BLOCK_WIDTH: unused, kept so that the call signature matches the CUDA kernels
+        :param: out: optional tuple of four float32 arrays (cA, cH, cV, cD) the coefficients are written into
+        :param: workspace: optional DWT_workspace the intermediate and output buffers are taken from
+        :param: scale: factor applied to the input, see input_scale (uint8 and uint16 images are normalized to [0, 1]
+                by default), folded into the 2D filters
+
+        :return: h_cA, h_cH, h_cV, h_cD: 2D DWT coefficients of shape ((M + maskwidth - 1)//2,
+                 (N + maskwidth - 1)//2)
+        :return: timing: DWT_timing of the call (setup, alloc, transfer_in and compute), that of the separable engine
+                 for separable filters
+        """
+        timing = DWT_timing('nonseparable_cpu')
+        if h_input.ndim != 2:
+            raise ValueError('Expected an image of shape (M, N), got shape {}'.format(h_input.shape))
+
+        filters = np.asarray(filters)
+        if filters.ndim == 2:
+            return self.separable_engine(h_input, filters, BLOCK_WIDTH, out=out, workspace=workspace, scale=scale)
+
+        factors = separable_filters(filters)
+        if factors is not None:
+            return self.separable_engine(h_input, factors, BLOCK_WIDTH, out=out, workspace=workspace, scale=scale)
+
+        # Obtain the shape of the input matrix
+        dim_M, dim_N = h_input.shape
+        maskwidth = filters.shape[-1]
+
+        # Without a workspace every buffer is allocated for this call only
+        if workspace is None:
+            workspace = DWT_workspace()
+        counts = workspace_counts(workspace)
+        key = workspace_key(h_input.shape, h_input.dtype, maskwidth)
+        bank = workspace.filters(filters)
+        scale = input_scale(h_input.dtype, scale)
+        if scale != 1:
+            bank = bank * scale
+
+        # Compute the size of the output of the wavelet transform
+        dim_R = dwt_coeff_len(dim_M, maskwidth)
+        dim_C = dwt_coeff_len(dim_N, maskwidth)
+
+        timing.mark('setup')
+
+        phase_shape = ((dim_M + 1) // 2, (dim_N + 1) // 2)
+        phases = [[workspace.get(key, 'phase{}{}'.format(py, px), phase_shape) for px in (0, 1)] for py in (0, 1)]
+        scratch = workspace.get(key, 'scratch', (dim_R, dim_C))
+        if out is None:
+            out = tuple(workspace.get(key, name, (dim_R, dim_C)) for name in ('cA', 'cH', 'cV', 'cD'))
+        timing.mark('alloc')
+
+        # Split the input into its four polyphase components (converted to float32 by the copy) so that every tap
+        # reads contiguous rows
+        for py in (0, 1):
+            for px in (0, 1):
+                rows = (dim_M - py + 1) // 2
+                cols = (dim_N - px + 1) // 2
+                np.copyto(phases[py][px][:rows, :cols], h_input[py::2, px::2])
+        timing.mark('transfer_in')
+
+        for res in out:
+            res.fill(0)
+        # Same tap order as w_kern_forward: y along the columns, then x along the rows
+        for y in range(maskwidth):
+            r_lo, r_hi, r_start = _tap_range(y, maskwidth, dim_M, dim_R)
+            if r_hi <= r_lo:
+                continue
+            for x in range(maskwidth):
+                c_lo, c_hi, c_start = _tap_range(x, maskwidth, dim_N, dim_C)
+                if c_hi <= c_lo:
+                    continue
+
+                # flip the kernel
+                coefs = bank[:, maskwidth - 1 - y, maskwidth - 1 - x]
+                src = phases[r_start % 2][c_start % 2][r_start // 2:r_start // 2 + r_hi - r_lo,
+                                                       c_start // 2:c_start // 2 + c_hi - c_lo]
+                prod = scratch[r_lo:r_hi, c_lo:c_hi]
+                for res, coef in zip(out, coefs):
+                    if coef != 0:
+                        np.multiply(src, coef, out=prod)
+                        np.add(res[r_lo:r_hi, c_lo:c_hi], prod, out=res[r_lo:r_hi, c_lo:c_hi])
+        timing.mark('compute')
+
+        timing.stop()
+        record(timing, h_input.size, (h_input,), out,
+               forward_multiply_adds(dim_M, dim_R, dim_C, maskwidth, separable=False), workspace, counts)
+
+        return out[0], out[1], out[2], out[3], timing
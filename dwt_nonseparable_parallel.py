@@ -1,30 +1,26 @@
-import matplotlib as mpl
-mpl.use('agg')
 import numpy as np
-from pycuda import compiler, gpuarray, tools
-import pycuda.driver as cuda
-import time
-import matplotlib.pyplot as plt
-
-# Initialize the device
-import pycuda.autoinit
-plt.ioff()
-
-def create2Dfilter(a,b,length):
-        result = np.zeros((length,length), dtype=np.float32)
-        for i in range(length):
-            for j in range(length):
-                result[j][i]=a[i]*b[j]
-        return result
+
+from dwt_autotune import DEFAULT_BLOCK_WIDTH, tuned_params
+from dwt_cuda import cuda_context
+from dwt_module_cache import default_module_cache
+from dwt_metrics import forward_multiply_adds, record, workspace_counts
+from dwt_timing import DWT_timing
+from dwt_nonseparable_cpu import create2Dfilter
+from dwt_workspace import DWT_workspace, workspace_key
 
 class DWT_nonseparable:
-    def __init__(self):
+    def __init__(self, module_cache=None):
+        # Compiled kernels are shared across calls and image shapes through the module cache
+        if module_cache is None:
+            module_cache = default_module_cache()
+        self.module_cache = module_cache
+
         # Grid size should be (ceil((N + maskwidth - 1)/2), ceil((M + maskwidth - 1)/2)) for input image shape (M, N)
         # to avoid wasting threads
         
         self.dwt_forward_opt = """
        
-        __global__ void w_kern_forward(float* input, float* c_a, float* c_h, float* c_v, float* c_d, float* LL, float* LH, float* HL, float* HH) {
+        __global__ void w_kern_forward(float* input, float* c_a, float* c_h, float* c_v, float* c_d, float* LL, float* LH, float* HL, float* HH, int H, int W) {
             
             //define row and column indicies
             int Col = threadIdx.x + blockIdx.x*blockDim.x;
@@ -33,11 +29,9 @@ class DWT_nonseparable:
             // Obtain the dimension of the problem
             // size of the mask, width and height of input image
             // int maskwidth: length of the filter (default is 10 for CDF9/7)
-            // int H: number of rows for input (height) (equals to M)
-            // int W: number of columns for input (width) (equals to N)
+            // int H: number of rows for input (height) (equals to M), passed at runtime
+            // int W: number of columns for input (width) (equals to N), passed at runtime
             int maskwidth = %(M)s;
-            int H = %(H)s;
-            int W = %(W)s;
 
             // Obtain half of the width and height
             int W_half = (W + maskwidth - 1)/2;
@@ -45,9 +39,10 @@ class DWT_nonseparable:
 
             if (Row < H_half && Col < W_half) {
             
-                //get center for even length kernel: default is length 10 for CDF97
+                //get center for even length kernel: (maskwidth - 2) halo cells as in the separable kernels
+                //(equals maskwidth/2 + 3 for the length 10 of CDF97)
                 int c;
-                c = maskwidth/2 + 3;
+                c = maskwidth - 2;
                 
                 //perform zero padding
                 float res_a = 0, res_h = 0, res_v = 0, res_d = 0;
@@ -88,73 +83,102 @@ class DWT_nonseparable:
         }
         """
     
-    def dwt_gpu_nonseparable(self, h_input, filters, BLOCK_WIDTH):
-        
+    def dwt_gpu_nonseparable(self, h_input, filters, BLOCK_WIDTH=None, out=None, workspace=None):
+        # Every phase of the call is charged to the DWT_timing returned with the coefficients
+        timing = DWT_timing('gpu_nonseparable')
+
+        # pycuda is only imported, and the CUDA context created, by the first call
+        cuda_context()
+        import pycuda.driver as cuda
+        from pycuda import gpuarray
+
         # Obtain the shape of the input matrix
         dim_M = h_input.shape[0]
         dim_N = h_input.shape[1]
         maskwidth = filters[0].shape[0]
 
+        # Without a block width, the tuned one of this shape and dtype (see dwt_autotune) or the default
+        if BLOCK_WIDTH is None:
+            tuned = tuned_params('gpu_nonseparable', h_input.shape, h_input.dtype)
+            BLOCK_WIDTH = tuned.get('BLOCK_WIDTH', DEFAULT_BLOCK_WIDTH)
+
+        # Without a workspace every buffer is allocated for this call only
+        if workspace is None:
+            workspace = DWT_workspace()
+        counts = workspace_counts(workspace)
+        key = workspace_key(h_input.shape, h_input.dtype, maskwidth)
+
         # Obtain the 1D filters
-        filters = filters.astype(np.float32)
+        filters = workspace.filters(filters)
         h_filter_lo = filters[0, :]
         h_filter_hi = filters[1, :]
+        timing.mark('setup')
+
+        # Create 2D filters from 1D filters and transfer them to the device (only once per distinct filter stack)
+        def upload_2D_filters():
+            LL = create2Dfilter(h_filter_lo, h_filter_lo, maskwidth)
+            LH = create2Dfilter(h_filter_lo, h_filter_hi, maskwidth)
+            HL = create2Dfilter(h_filter_hi, h_filter_lo, maskwidth)
+            HH = create2Dfilter(h_filter_hi, h_filter_hi, maskwidth)
+            return gpuarray.to_gpu(LL), gpuarray.to_gpu(LH), gpuarray.to_gpu(HL), gpuarray.to_gpu(HH)
+        d_LL, d_LH, d_HL, d_HH = workspace.memo(('d_filters_2D', filters.tobytes()), upload_2D_filters)
+        timing.mark('transfer_in')
         
-        # Create 2D filters from 1D filters
-        LL = create2Dfilter(h_filter_lo, h_filter_lo, 10)
-        LH = create2Dfilter(h_filter_lo, h_filter_hi, 10)
-        HL = create2Dfilter(h_filter_hi, h_filter_lo, 10)
-        HH = create2Dfilter(h_filter_hi, h_filter_hi, 10)
-        
-        # Compute the size of the output of the wavelet transform
-        dim_R = int(np.ceil(((dim_M + maskwidth - 1)/2)))
-        dim_C = int(np.ceil(((dim_N + maskwidth - 1)/2)))
+        # Compute the size of the output of the wavelet transform (integer division, same as H_half and W_half in the
+        # kernels)
+        dim_R = (dim_M + maskwidth - 1)//2
+        dim_C = (dim_N + maskwidth - 1)//2
 
         # Calculate the number of blocks
         # Note that final output has shape (M, N)
         BLOCK_X = int(np.ceil(dim_C / float(BLOCK_WIDTH)))
         BLOCK_Y = int(np.ceil(dim_R / float(BLOCK_WIDTH)))
 
-        h_input = h_input.astype(np.float32)
-        h_cA = np.zeros(shape=(dim_R, dim_C), dtype=np.float32)
-        h_cH = np.zeros(shape=(dim_R, dim_C), dtype=np.float32)
-        h_cV = np.zeros(shape=(dim_R, dim_C), dtype=np.float32)
-        h_cD = np.zeros(shape=(dim_R, dim_C), dtype=np.float32)
+        # (no copy if the input is already a contiguous float32 array, e.g. cA of a previous level)
+        h_input = np.ascontiguousarray(h_input, dtype=np.float32)
+        timing.mark('setup')
+
+        # Obtain the device arrays from the workspace, every element of the outputs is written by the kernel so they
+        # are neither zeroed nor uploaded
+        d_input = workspace.get(key, 'd_input', (dim_M, dim_N), alloc=gpuarray.empty)
+        d_cA = workspace.get(key, 'd_cA', (dim_R, dim_C), alloc=gpuarray.empty)
+        d_cH = workspace.get(key, 'd_cH', (dim_R, dim_C), alloc=gpuarray.empty)
+        d_cV = workspace.get(key, 'd_cV', (dim_R, dim_C), alloc=gpuarray.empty)
+        d_cD = workspace.get(key, 'd_cD', (dim_R, dim_C), alloc=gpuarray.empty)
+        timing.mark('alloc')
 
         # Transfer data to device
-        d_input = gpuarray.to_gpu(h_input)
-        d_cA = gpuarray.to_gpu(h_cA)
-        d_cH = gpuarray.to_gpu(h_cH)
-        d_cV = gpuarray.to_gpu(h_cV)
-        d_cD = gpuarray.to_gpu(h_cD)
-        d_LL = gpuarray.to_gpu(LL)
-        d_LH = gpuarray.to_gpu(LH)
-        d_HL = gpuarray.to_gpu(HL)
-        d_HH = gpuarray.to_gpu(HH)
-
-        # Call kernel
-        dwt_forward_optimized_kernel = self.dwt_forward_opt % {
-            'M': maskwidth,
-            'H': dim_M,
-            'W': dim_N
-        }
+        d_input.set(h_input)
+        timing.mark('transfer_in')
 
-        # Call kernel function
-        prg_dwt_forward_optimized = compiler.SourceModule(dwt_forward_optimized_kernel)
+        # Obtain the compiled kernels from the module cache (only compiled once per maskwidth and tile width)
+        prg_dwt_forward_optimized = self.module_cache.get_module(self.dwt_forward_opt, maskwidth)
         dwt_forward_optimized = prg_dwt_forward_optimized.get_function("w_kern_forward")
-        tic = cuda.Event()
-        toc = cuda.Event()
+        timing.mark('compile')
 
-        tic.record()
-        dwt_forward_optimized(d_input, d_cA, d_cH, d_cV, d_cD, d_LL, d_LH, d_HL, d_HH,
+        dwt_forward_optimized(d_input, d_cA, d_cH, d_cV, d_cD, d_LL, d_LH, d_HL, d_HH, np.int32(dim_M), np.int32(dim_N),
                            block=(BLOCK_WIDTH, BLOCK_WIDTH, 1), grid=(BLOCK_X, BLOCK_Y, 1))
-        toc.record()
-        toc.synchronize()
+        cuda.Context.synchronize()
+        timing.mark('compute')
+
+        if out is None:
+            h_cA = workspace.get(key, 'cA', (dim_R, dim_C))
+            h_cH = workspace.get(key, 'cH', (dim_R, dim_C))
+            h_cV = workspace.get(key, 'cV', (dim_R, dim_C))
+            h_cD = workspace.get(key, 'cD', (dim_R, dim_C))
+        else:
+            h_cA, h_cH, h_cV, h_cD = out
+        timing.mark('alloc')
+
+        # Read the outputs back directly into the host arrays
+        d_cA.get(ary=h_cA)
+        d_cH.get(ary=h_cH)
+        d_cV.get(ary=h_cV)
+        d_cD.get(ary=h_cD)
+        timing.mark('transfer_out')
 
-        kernel_time = tic.time_till(toc)*1e-3
-        h_cA = d_cA.get()
-        h_cH = d_cH.get()
-        h_cV = d_cV.get()
-        h_cD = d_cD.get()
+        timing.stop()
+        record(timing, h_input.size, (h_input,), (h_cA, h_cH, h_cV, h_cD),
+               forward_multiply_adds(dim_M, dim_R, dim_C, maskwidth, separable=False), workspace, counts)
 
-        return h_cA, h_cH, h_cV, h_cD, kernel_time
+        return h_cA, h_cH, h_cV, h_cD, timing
@@ -1,8 +1,12 @@
-import pywt
 import numpy as np
-import time 
+
+from dwt_metrics import forward_multiply_adds, record
+from dwt_timing import DWT_timing
 
 def gen_wavelet():
+    # pywavelets is only imported when the serial engine is used
+    import pywt
+
     # Define the coefficients for the CDF9/7 filters
     factor=1
 
@@ -42,25 +46,31 @@ def run_DWT(signal, wav, flag_print=0, mode='zero'):
     :param: mode: the padding scheme applied to the input (only supports zero-padding)
 
     :return: cA, cH, cV, cD: 2D DWT coefficients
-    :return: time_diff: runtime for the serial program
+    :return: timing: DWT_timing of the call, the pywavelets call is compute and the conversion of the coefficients
+             to float32 is transfer_out
     """
+    import pywt
+    timing = DWT_timing('serial')
 
     # Call the pywavelets 2D DWT function using the pywavelets function
-    tic = time.time()
     coeffs = pywt.dwt2(signal, wav, mode)
-    toc = time.time()
+    timing.mark('compute')
 
     cA, (cH, cV, cD) = coeffs
     cA = cA.astype(np.float32)
     cH = cH.astype(np.float32)
     cV = cV.astype(np.float32)
     cD = cD.astype(np.float32)
+    timing.mark('transfer_out')
+    timing.stop()
+    signal = np.asarray(signal)
+    record(timing, signal.size, (signal,), (cA, cH, cV, cD),
+           forward_multiply_adds(signal.shape[0], cA.shape[0], cA.shape[1], wav.dec_len))
 
-    time_diff = toc - tic
     if flag_print:
         print("approx: {} \n detail: {} \n{}\n{}\n".format(cA, cH, cV, cD))
 
-    return cA, cH, cV, cD, time_diff
+    return cA, cH, cV, cD, timing
 
 
 def run_iDWT(wav, cA, cH, cV, cD, mode='zero'):
@@ -74,6 +84,7 @@ def run_iDWT(wav, cA, cH, cV, cD, mode='zero'):
     :return: rec_sig: reconstructed image
 
     """
+    import pywt
     coeffs = cA, (cH, cV, cD)
     rec_sig = pywt.idwt2(coeffs, wav, mode)
 
@@ -0,0 +1,160 @@
+import numpy as np
+import os
+
+from dwt_metrics import forward_multiply_adds, record, workspace_counts
+from dwt_tiled_cpu import tile_buffer_dtypes, tile_buffer_sizes, transform_tile
+from dwt_timing import DWT_timing
+from dwt_vectorized_separable import dwt_coeff_len, input_scale
+from dwt_workspace import DWT_workspace, workspace_key
+
+# Default budget of the buffers held by the streaming engine
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def open_raw_image(path, shape, dtype=np.float32, offset=0):
+    """
+    Map a raw image file (row major, no header) read-only, without reading it into memory
+
+    :param: path: path of the raw file
+    :param: shape: shape (M, N) of the image
+    :param: dtype: dtype of the pixels
+    :param: offset: number of bytes before the first pixel
+
+    :return: np.memmap of shape (M, N)
+    """
+    return np.memmap(path, dtype=dtype, mode='r', shape=tuple(shape), offset=offset)
+
+
+def open_output_memmaps(out_dir, shape, maskwidth):
+    """
+    Create the four memory-mapped subband files cA.npy, cH.npy, cV.npy and cD.npy (readable with np.load)
+
+    :param: out_dir: directory the subbands are written to, created if needed
+    :param: shape: shape (M, N) of the input image
+    :param: maskwidth: length of the filter (10 for CDF9/7)
+
+    :return: (cA, cH, cV, cD) float32 memmaps of shape ((M + maskwidth - 1)//2, (N + maskwidth - 1)//2)
+    """
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    out_shape = (dwt_coeff_len(shape[0], maskwidth), dwt_coeff_len(shape[1], maskwidth))
+    return tuple(np.lib.format.open_memmap(os.path.join(out_dir, name + '.npy'), mode='w+', dtype=np.float32,
+                                           shape=out_shape)
+                 for name in ('cA', 'cH', 'cV', 'cD'))
+
+
+def band_bytes(band_rows, dim_C, maskwidth, dtype=np.float32):
+    """
+    Bytes of the buffers used to transform a band of band_rows output rows of an input of this dtype, outputs of the
+    band included
+    """
+    sizes = tile_buffer_sizes(band_rows, dim_C, maskwidth)
+    buffer_bytes = sum(size * dt.itemsize for size, dt in zip(sizes, tile_buffer_dtypes(dtype)))
+    return buffer_bytes + 4 * 4 * band_rows * dim_C
+
+
+class DWT_streaming:
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        Out-of-core separable 2D DWT that streams the image in bands of rows
+
+        Each band of output rows reads its input rows and the vertical halo straight from the (memory-mapped) input,
+        is transformed into band-sized buffers and written into the outputs, which are typically memory-mapped files
+        as well. The band height is chosen so that the buffers fit in max_bytes, whatever the size of the image. The
+        pages of the mapped files are owned by the page cache, the outputs are flushed after every band so that the
+        OS can drop them
+
+        :param: max_bytes: budget of the buffers allocated by the engine
+        """
+        self.max_bytes = max_bytes
+
+    def band_rows(self, dim_C, maskwidth, dtype=np.float32):
+        """
+        :return: number of output rows of a band of an input of this dtype that fits in the budget
+        """
+        base = band_bytes(0, dim_C, maskwidth, dtype)
+        per_row = band_bytes(1, dim_C, maskwidth, dtype) - base
+        rows = (self.max_bytes - base) // per_row
+        if rows < 1:
+            raise ValueError('A budget of {} bytes is too small for rows of {} coefficients, at least {} bytes are '
+                             'needed'.format(self.max_bytes, dim_C, base + per_row))
+        return rows
+
+    def dwt_cpu_streaming(self, h_input, filters, BLOCK_WIDTH=None, out=None, out_dir=None, workspace=None,
+                          scale=None):
+        """
+        Streaming separable 2D DWT, same output as dwt_cpu_vectorized_separable
+
+        :param: h_input: input image of shape (M, N), e.g. a np.memmap from open_raw_image or np.load(mmap_mode='r').
+                Any dtype, the bands are converted to float32 as they are read
+        :param: filters: filter stack of shape (4, maskwidth) (an_lo, an_hi, syn_lo, syn_hi)
+        :param: BLOCK_WIDTH: unused, kept so that the call signature matches the CUDA kernels
+        :param: out: optional tuple of four arrays (cA, cH, cV, cD) the coefficients are written into
+        :param: out_dir: directory the subbands are written to as memory-mapped .npy files if out is not given. If
+                neither is given the outputs are in-memory arrays
+        :param: workspace: optional DWT_workspace the band buffers are taken from
+        :param: scale: factor applied to the input in the row pass, see input_scale (uint8 and uint16 images are
+                normalized to [0, 1] by default)
+
+        :return: h_cA, h_cH, h_cV, h_cD: 2D DWT coefficients of shape ((M + maskwidth - 1)//2,
+                 (N + maskwidth - 1)//2)
+        :return: timing: DWT_timing of the call, the reads of the input are part of compute (they are done by the row
+                 pass) and the copies of the bands to the outputs (and their flushes) are transfer_out
+        """
+        timing = DWT_timing('streaming')
+        if h_input.ndim != 2:
+            raise ValueError('Expected an image of shape (M, N), got shape {}'.format(h_input.shape))
+
+        # Obtain the shape of the input matrix
+        dim_M, dim_N = h_input.shape
+        maskwidth = filters[0].shape[0]
+
+        # Without a workspace every buffer is allocated for this call only
+        if workspace is None:
+            workspace = DWT_workspace()
+        counts = workspace_counts(workspace)
+        key = workspace_key(h_input.shape, h_input.dtype, maskwidth)
+
+        # Obtain the filters for DWT
+        filters = workspace.filters(filters)
+        h_filter_lo = filters[0, :]
+        h_filter_hi = filters[1, :]
+        scale = input_scale(h_input.dtype, scale)
+
+        # Compute the size of the output of the wavelet transform
+        dim_R = dwt_coeff_len(dim_M, maskwidth)
+        dim_C = dwt_coeff_len(dim_N, maskwidth)
+        timing.mark('setup')
+
+        if out is None and out_dir is not None:
+            out = open_output_memmaps(out_dir, h_input.shape, maskwidth)
+        elif out is None:
+            out = tuple(np.empty(shape=(dim_R, dim_C), dtype=np.float32) for _ in range(4))
+
+        # Band buffers, the only memory held by the engine
+        band_rows = min(self.band_rows(dim_C, maskwidth, h_input.dtype), dim_R)
+        buffers = [workspace.get(key, 'band_buf{}'.format(i), (size,), dtype=dtype)
+                   for i, (size, dtype) in enumerate(zip(tile_buffer_sizes(band_rows, dim_C, maskwidth),
+                                                         tile_buffer_dtypes(h_input.dtype)))]
+        band_outs = [workspace.get(key, 'band_' + name, (band_rows, dim_C)) for name in ('cA', 'cH', 'cV', 'cD')]
+        timing.mark('alloc')
+
+        for row_start in range(0, dim_R, band_rows):
+            row_stop = min(row_start + band_rows, dim_R)
+
+            # The row pass reads the input rows of the band and its halo from the input, only the band is resident
+            transform_tile(h_input, h_filter_lo, h_filter_hi, band_outs, row_start, row_stop, 0, dim_C, buffers,
+                           out_origin=(row_start, 0), scale=scale)
+            timing.mark('compute')
+
+            for dst, src in zip(out, band_outs):
+                dst[row_start:row_stop] = src[:row_stop - row_start]
+                if isinstance(dst, np.memmap):
+                    dst.flush()
+            timing.mark('transfer_out')
+
+        timing.stop()
+        record(timing, h_input.size, (h_input,), out,
+               forward_multiply_adds(dim_M, dim_R, dim_C, maskwidth), workspace, counts)
+
+        return out[0], out[1], out[2], out[3], timing
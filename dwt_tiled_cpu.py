@@ -0,0 +1,267 @@
+import numpy as np
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from dwt_autotune import tuned_params
+from dwt_metrics import forward_multiply_adds, record, workspace_counts
+from dwt_timing import DWT_timing
+from dwt_trace import span
+from dwt_vectorized_separable import DIRECT_INPUT_DTYPES, analysis_pass, as_pass_input, dwt_coeff_len, input_scale
+from dwt_workspace import DWT_workspace, workspace_key
+
+# Target size of the working set of one tile (input tile, both intermediate subbands, phases and scratch), about the
+# size of a per-core L2 cache
+TILE_BYTES = 1 << 20
+
+# Widest row strip (in input columns) before the strips are also split into column blocks
+MAX_STRIP_WIDTH = 2048
+
+# Number of output columns of a column block when the image is wider than MAX_STRIP_WIDTH
+BLOCK_COLS = 512
+
+# Smallest number of output rows of a tile, so that the halo rows stay a small part of the work
+MIN_TILE_ROWS = 16
+
+
+def tile_input_range(c_start, c_stop, maskwidth, dim):
+    """
+    Range of input samples read along an axis by the outputs c_start ... c_stop - 1, halo included
+
+    Output c reads the inputs c * 2 - (maskwidth - 2) ... c * 2 + 1, the part of the halo that falls outside of the
+    image is dropped since it is zero
+
+    :param: c_start: first output index of the tile
+    :param: c_stop: one past the last output index of the tile
+    :param: maskwidth: length of the filter (10 for CDF9/7)
+    :param: dim: length of the input along the axis
+
+    :return: x_start, x_stop: first and one past the last input index of the tile
+    """
+    return max(0, c_start * 2 - (maskwidth - 2)), min(dim, c_stop * 2)
+
+
+def transform_tile(h_input, filter_lo, filter_hi, outs, row_start, row_stop, col_start, col_stop, buffers,
+                   out_origin=(0, 0), scale=1):
+    """
+    Compute the outputs [row_start, row_stop) x [col_start, col_stop) of the four subbands
+
+    The input tile with its halo is transformed along the rows into two tile-local subbands (the CPU counterpart of the
+    shared memory of w_kernel_forward1 in DWT_tiled_separable), which are then transformed along the columns straight
+    into the output arrays. Every tile runs the same taps in the same order as DWT_vectorized_separable, so the result
+    is bit-identical to it
+
+    :param: h_input: input image of shape (M, N), float32, uint8 or uint16 or any array the row pass can read, e.g. a
+            np.memmap, read in its own dtype
+    :param: filter_lo: LPF coefficients of shape (maskwidth,), float32
+    :param: filter_hi: HPF coefficients of shape (maskwidth,), float32
+    :param: outs: (cA, cH, cV, cD) arrays of shape (R, C), or smaller arrays holding the tile if out_origin is given
+    :param: row_start, row_stop: output rows of the tile
+    :param: col_start, col_stop: output columns of the tile
+    :param: buffers: flat buffers (tmp_lo, tmp_hi, row_scratch, col_scratch, phase0, phase1) of the dtypes of
+            tile_buffer_dtypes, at least as large as tile_buffer_sizes of the largest tile
+    :param: out_origin: (row, column) of the whole output held by outs[k][0, 0]
+    :param: scale: factor applied to the input, folded into the filters of the row pass
+    """
+    maskwidth = filter_lo.shape[0]
+    h_cA, h_cH, h_cV, h_cD = outs
+    tmp_lo, tmp_hi, row_scratch, col_scratch, phase0, phase1 = buffers
+
+    x_row_start, x_row_stop = tile_input_range(row_start, row_stop, maskwidth, h_input.shape[0])
+    x_col_start, x_col_stop = tile_input_range(col_start, col_stop, maskwidth, h_input.shape[1])
+    x = h_input[x_row_start:x_row_stop, x_col_start:x_col_stop]
+
+    rows = x_row_stop - x_row_start
+    tmp_shape = (rows, col_stop - col_start)
+    phase_shape = (rows, (x_col_stop - x_col_start + 1) // 2)
+    out_shape = (row_stop - row_start, col_stop - col_start)
+
+    def view(buf, shape):
+        return buf[:shape[0] * shape[1]].reshape(shape)
+
+    h_tmp_a1 = view(tmp_lo, tmp_shape)
+    h_tmp_a2 = view(tmp_hi, tmp_shape)
+    phases = [view(phase0, phase_shape), view(phase1, phase_shape)]
+
+    # Row pass over the input tile and its halo
+    row_filter_lo = filter_lo * scale if scale != 1 else filter_lo
+    row_filter_hi = filter_hi * scale if scale != 1 else filter_hi
+    analysis_pass(x, row_filter_lo, row_filter_hi, 1, h_tmp_a1, h_tmp_a2, view(row_scratch, tmp_shape), phases,
+                  c_start=col_start, x_start=x_col_start)
+
+    # Column pass of both tile-local subbands into the output tile
+    tile = (slice(row_start - out_origin[0], row_stop - out_origin[0]),
+            slice(col_start - out_origin[1], col_stop - out_origin[1]))
+    scratch = view(col_scratch, out_shape)
+    analysis_pass(h_tmp_a1, filter_lo, filter_hi, 0, h_cA[tile], h_cH[tile], scratch, c_start=row_start,
+                  x_start=x_row_start)
+    analysis_pass(h_tmp_a2, filter_lo, filter_hi, 0, h_cV[tile], h_cD[tile], scratch, c_start=row_start,
+                  x_start=x_row_start)
+
+
+def tile_buffer_sizes(tile_rows, tile_cols, maskwidth):
+    """
+    Sizes of the flat buffers used by transform_tile for tiles of at most tile_rows x tile_cols outputs
+
+    :return: sizes of (tmp_lo, tmp_hi, row_scratch, col_scratch, phase0, phase1)
+    """
+    rows = tile_rows * 2 + maskwidth - 2
+    cols = tile_cols * 2 + maskwidth - 2
+    tmp = rows * tile_cols
+    phase = rows * ((cols + 1) // 2)
+    return tmp, tmp, tmp, tile_rows * tile_cols, phase, phase
+
+
+def tile_buffer_dtypes(dtype):
+    """
+    Dtypes of the flat buffers used by transform_tile for an input of this dtype, the phases hold input samples and
+    keep its dtype, so that a uint8 tile is copied at its own size and only converted by the multiplies of the row pass
+
+    :return: dtypes of (tmp_lo, tmp_hi, row_scratch, col_scratch, phase0, phase1)
+    """
+    dtype = np.dtype(dtype) if np.dtype(dtype) in DIRECT_INPUT_DTYPES else np.dtype(np.float32)
+    return (np.dtype(np.float32),) * 4 + (dtype, dtype)
+
+
+class DWT_tiled_cpu:
+    def __init__(self, tile_rows=None, tile_cols=None, n_threads=None):
+        """
+        Cache-blocked separable 2D DWT on the CPU, the tiles are spread across a thread pool
+
+        The output is split into row strips (and column blocks for wide images) of tile_rows x tile_cols outputs.
+        Each tile computes the row pass of its own input rows with the (maskwidth - 2) halo, so a tile never waits for
+        another one and its intermediate subbands stay in cache. The numpy calls release the GIL, so the tiles run in
+        parallel
+
+        The parameters not given are taken from the tuning file of dwt_autotune for the shape and dtype of each input
+        when it has an entry for them
+
+        :param: tile_rows: output rows per tile (tuned, or sized from TILE_BYTES, if not given)
+        :param: tile_cols: output columns per tile (tuned, or whole rows up to MAX_STRIP_WIDTH input columns and
+                BLOCK_COLS otherwise, if not given)
+        :param: n_threads: number of threads (tuned, or the number of CPUs, if not given)
+        """
+        # Tuned thread counts can only lower the size of the pool
+        self.tuned_threads = n_threads is None
+        if n_threads is None:
+            n_threads = os.cpu_count() or 1
+        self.tile_rows = tile_rows
+        self.tile_cols = tile_cols
+        self.n_threads = n_threads
+        self.pool = ThreadPoolExecutor(max_workers=n_threads) if n_threads > 1 else None
+
+    def tile_shape(self, dim_N, dim_R, dim_C, tuned=None, itemsize=4):
+        """
+        :param: tuned: optional tuned parameters of the input (from tuned_params), used for the sizes not given to
+                the engine
+        :param: itemsize: bytes per sample of the input, which the input tile and its phases are read in
+
+        :return: tile_rows, tile_cols: number of output rows and columns of a tile for an input of width dim_N with
+                 outputs of shape (dim_R, dim_C)
+        """
+        if tuned is None:
+            tuned = {}
+        tile_cols = self.tile_cols
+        if tile_cols is None:
+            tile_cols = tuned.get('tile_cols')
+        if tile_cols is None:
+            tile_cols = dim_C if dim_N <= MAX_STRIP_WIDTH else BLOCK_COLS
+        tile_cols = max(1, min(tile_cols, dim_C))
+
+        tile_rows = self.tile_rows
+        if tile_rows is None:
+            tile_rows = tuned.get('tile_rows')
+        if tile_rows is None:
+            # Per input sample of the tile: the input and its phases in the input dtype, about 2 float32 values of
+            # intermediate subbands and scratch
+            tile_rows = max(MIN_TILE_ROWS, TILE_BYTES // ((2 * itemsize + 2 * 4) * 2 * (2 * tile_cols)))
+        tile_rows = max(1, min(tile_rows, dim_R))
+
+        return tile_rows, tile_cols
+
+    def _tiles(self, h_input, h_filter_lo, h_filter_hi, outs, tiles, buffers, scale):
+        """
+        Transform a list of tiles with one set of buffers, run by one thread
+        """
+        with span('tiles', 'tiled_cpu', n_tiles=len(tiles)):
+            for row_start, row_stop, col_start, col_stop in tiles:
+                transform_tile(h_input, h_filter_lo, h_filter_hi, outs, row_start, row_stop, col_start, col_stop,
+                               buffers, scale=scale)
+
+    def dwt_cpu_tiled(self, h_input, filters, BLOCK_WIDTH=None, out=None, workspace=None, scale=None):
+        """
+        Tiled separable 2D DWT on the CPU, same output as dwt_cpu_vectorized_separable
+
+        :param: h_input: input image of shape (M, N)
+        :param: filters: filter stack of shape (4, maskwidth) (an_lo, an_hi, syn_lo, syn_hi)
+        :param: BLOCK_WIDTH: unused, kept so that the call signature matches the CUDA kernels
+        :param: out: optional tuple of four float32 arrays (cA, cH, cV, cD) the coefficients are written into
+        :param: workspace: optional DWT_workspace the tile and output buffers are taken from
+        :param: scale: factor applied to the input in the row pass, see input_scale (uint8 and uint16 images are read
+                without a float32 copy and normalized to [0, 1] by default)
+
+        :return: h_cA, h_cH, h_cV, h_cD: 2D DWT coefficients of shape ((M + maskwidth - 1)//2,
+                 (N + maskwidth - 1)//2)
+        :return: timing: DWT_timing of the call (setup, alloc and compute)
+        """
+        timing = DWT_timing('tiled_cpu')
+        if h_input.ndim != 2:
+            raise ValueError('Expected an image of shape (M, N), got shape {}'.format(h_input.shape))
+
+        # Obtain the shape of the input matrix
+        dim_M, dim_N = h_input.shape
+        maskwidth = filters[0].shape[0]
+
+        # Without a workspace every buffer is allocated for this call only
+        if workspace is None:
+            workspace = DWT_workspace()
+        counts = workspace_counts(workspace)
+        key = workspace_key(h_input.shape, h_input.dtype, maskwidth)
+
+        # Obtain the filters for DWT
+        filters = workspace.filters(filters)
+        h_filter_lo = filters[0, :]
+        h_filter_hi = filters[1, :]
+
+        # Compute the size of the output of the wavelet transform
+        dim_R = dwt_coeff_len(dim_M, maskwidth)
+        dim_C = dwt_coeff_len(dim_N, maskwidth)
+
+        scale = input_scale(h_input.dtype, scale)
+        h_input = as_pass_input(h_input)
+        timing.mark('setup')
+        if out is None:
+            outs = tuple(workspace.get(key, name, (dim_R, dim_C)) for name in ('cA', 'cH', 'cV', 'cD'))
+        else:
+            outs = tuple(out)
+
+        # Split the outputs into tiles and deal them out to the threads, each with its own set of buffers
+        tuned = tuned_params('tiled', h_input.shape, h_input.dtype)
+        tile_rows, tile_cols = self.tile_shape(dim_N, dim_R, dim_C, tuned, h_input.dtype.itemsize)
+        tiles = [(row_start, min(row_start + tile_rows, dim_R), col_start, min(col_start + tile_cols, dim_C))
+                 for row_start in range(0, dim_R, tile_rows) for col_start in range(0, dim_C, tile_cols)]
+        n_threads = self.n_threads
+        if self.tuned_threads:
+            n_threads = min(n_threads, tuned.get('n_threads', n_threads))
+        n_workers = min(n_threads, len(tiles))
+        sizes = tile_buffer_sizes(tile_rows, tile_cols, maskwidth)
+        dtypes = tile_buffer_dtypes(h_input.dtype)
+        buffers = [[workspace.get(key, 'tile{}_buf{}'.format(w, i), (size,), dtype=dtype)
+                    for i, (size, dtype) in enumerate(zip(sizes, dtypes))]
+                   for w in range(n_workers)]
+        timing.mark('alloc')
+
+        if self.pool is None or n_workers == 1:
+            self._tiles(h_input, h_filter_lo, h_filter_hi, outs, tiles, buffers[0], scale)
+        else:
+            futures = [self.pool.submit(self._tiles, h_input, h_filter_lo, h_filter_hi, outs, tiles[w::n_workers],
+                                        buffers[w], scale)
+                       for w in range(n_workers)]
+            for future in futures:
+                future.result()
+        timing.mark('compute')
+
+        timing.stop()
+        record(timing, h_input.size, (h_input,), outs,
+               forward_multiply_adds(dim_M, dim_R, dim_C, maskwidth), workspace, counts)
+
+        return outs[0], outs[1], outs[2], outs[3], timing
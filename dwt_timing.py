@@ -0,0 +1,104 @@
+import time
+
+import dwt_trace
+
+# Phases of a call of an engine, in the order they usually happen
+PHASES = ('setup', 'alloc', 'compile', 'transfer_in', 'compute', 'transfer_out')
+
+
+class DWT_timing:
+    def __init__(self, name='dwt'):
+        """
+        Time spent by one call of an engine in each phase, measured with time.perf_counter_ns
+
+        The clock starts when the record is created. mark(phase) charges the time since the previous mark to the phase
+        and stop() sets the total, so the phases add up to the total up to the few instructions between marks. Phases
+        that do not apply to an engine stay at 0:
+            setup: checks, shapes, filters and conversion of the input on the host
+            alloc: buffers taken from the workspace (or allocated), host and device
+            compile: CUDA modules obtained from the module cache
+            transfer_in: copies of the input to the device, shared memory or a work buffer
+            compute: the transform itself (kernels and their synchronization on the GPU)
+            transfer_out: copies of the coefficients back to the host or to the output arrays
+
+        While tracing is on (see dwt_trace) every mark and the whole call are also recorded as trace events
+
+        :param: name: name of the engine, the category of its trace events
+        """
+        self.name = name
+        self.ns = dict.fromkeys(PHASES, 0)
+        self.total_ns = 0
+        self._start = self._last = time.perf_counter_ns()
+
+    def mark(self, phase):
+        """
+        Charge the time elapsed since the previous mark (or the creation of the record) to phase
+        """
+        now = time.perf_counter_ns()
+        self.ns[phase] += now - self._last
+        if dwt_trace.tracer is not None:
+            dwt_trace.tracer.add(phase, self.name, self._last, now)
+        self._last = now
+
+    def stop(self):
+        """
+        Set the total time of the call
+
+        :return: the record itself
+        """
+        now = time.perf_counter_ns()
+        self.total_ns = now - self._start
+        if dwt_trace.tracer is not None:
+            dwt_trace.tracer.add(self.name, 'engine', self._start, now)
+        return self
+
+    def seconds(self, phase='total'):
+        """
+        :param: phase: one of PHASES, or 'total'
+        :return: time spent in phase in seconds
+        """
+        return (self.total_ns if phase == 'total' else self.ns[phase]) * 1e-9
+
+    @property
+    def compute_time(self):
+        """
+        Time of the compute phase in seconds, the number the engines used to return
+        """
+        return self.seconds('compute')
+
+    @property
+    def total_time(self):
+        """
+        Total time of the call in seconds
+        """
+        return self.seconds('total')
+
+    def as_dict(self):
+        """
+        :return: {phase: nanoseconds} for every phase and 'total'
+        """
+        res = dict(self.ns)
+        res['total'] = self.total_ns
+        return res
+
+    def __add__(self, other):
+        """
+        Record summing the phases of two records, e.g. of the three channels of an image (0 is accepted so that
+        sum() works)
+        """
+        if not isinstance(other, DWT_timing):
+            if other != 0:
+                return NotImplemented
+            other = DWT_timing()
+        res = DWT_timing(self.name)
+        for phase in PHASES:
+            res.ns[phase] = self.ns[phase] + other.ns[phase]
+        res.total_ns = self.total_ns + other.total_ns
+        return res
+
+    __radd__ = __add__
+
+    def __repr__(self):
+        return 'DWT_timing({}, total={:.3f} ms)'.format(
+            ', '.join('{}={:.3f} ms'.format(phase, self.ns[phase] * 1e-6) for phase in PHASES if self.ns[phase]),
+            self.total_ns * 1e-6)
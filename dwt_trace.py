@@ -0,0 +1,150 @@
+import atexit
+import json
+import multiprocessing
+import os
+import threading
+import time
+
+# Tracer receiving the events, None while tracing is off so that every hook is a single test
+tracer = None
+
+
+class DWT_tracer:
+    def __init__(self):
+        """
+        Collector of Chrome trace events (chrome://tracing, Perfetto)
+
+        Every event is a complete ('X') event on the lane of the process and thread it ran on, timed with
+        time.perf_counter_ns. The clock is system wide on Linux, so events recorded by the worker processes of an engine
+        line up with those of the parent
+        """
+        self.events = []
+        self.thread_names = {}
+
+    def add(self, name, cat, start_ns, stop_ns, args=None):
+        """
+        Record an event of the calling thread
+
+        :param: name: name of the event
+        :param: cat: category, e.g. the engine or the stage of the pipeline
+        :param: start_ns: start as returned by time.perf_counter_ns
+        :param: stop_ns: end as returned by time.perf_counter_ns
+        :param: args: optional dictionary shown with the event
+        """
+        tid = threading.get_ident()
+        if tid not in self.thread_names:
+            self.thread_names[tid] = (os.getpid(), threading.current_thread().name)
+        event = {'name': name, 'cat': cat, 'ph': 'X', 'ts': start_ns / 1e3, 'dur': (stop_ns - start_ns) / 1e3,
+                 'pid': os.getpid(), 'tid': tid}
+        if args:
+            event['args'] = args
+        # list.append is atomic, so the threads of an engine can record concurrently
+        self.events.append(event)
+
+    def merge(self, other):
+        """
+        Add the events of another tracer, e.g. one sent back by a worker process
+        """
+        self.events.extend(other.events)
+        self.thread_names.update(other.thread_names)
+
+    def trace_events(self):
+        """
+        :return: the events, preceded by the metadata naming each process and thread lane
+        """
+        meta = []
+        for pid in sorted({pid for pid, _ in self.thread_names.values()}):
+            meta.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0,
+                         'args': {'name': 'main' if pid == os.getpid() else 'worker {}'.format(pid)}})
+        for tid, (pid, name) in self.thread_names.items():
+            meta.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}})
+        return meta + sorted(self.events, key=lambda event: event['ts'])
+
+    def save(self, path):
+        """
+        Write the trace as Chrome trace-event JSON
+        """
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': self.trace_events(), 'displayTimeUnit': 'ms'}, f)
+
+
+class _Span:
+    __slots__ = ('name', 'cat', 'args', 'start_ns')
+
+    def __init__(self, name, cat, args):
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        # The tracer may have been stopped inside the span
+        if tracer is not None:
+            tracer.add(self.name, self.cat, self.start_ns, time.perf_counter_ns(), self.args)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name, cat='dwt', **args):
+    """
+    Context manager recording the time spent in its block as an event, a shared no-op object while tracing is off
+
+    :param: name: name of the event
+    :param: cat: category of the event
+    :param: args: values shown with the event, e.g. the shape of the image
+    """
+    if tracer is None:
+        return _NULL_SPAN
+    return _Span(name, cat, args)
+
+
+def start_tracing(path=None):
+    """
+    Turn tracing on, the events recorded so far are kept if it already is
+
+    :param: path: optional file the trace is written to when the interpreter exits
+
+    :return: the tracer
+    """
+    global tracer
+    if tracer is None:
+        tracer = DWT_tracer()
+    if path is not None:
+        atexit.register(tracer.save, path)
+    return tracer
+
+
+def stop_tracing(path=None):
+    """
+    Turn tracing off
+
+    :param: path: optional file the trace is written to
+
+    :return: the tracer holding the events (None if tracing was off)
+    """
+    global tracer
+    res, tracer = tracer, None
+    if res is not None and path is not None:
+        res.save(path)
+    return res
+
+
+# Tracing can be turned on for a whole run without changing the scripts: DWT_TRACE=trace.json python ... (worker
+# processes send their events back to the parent instead)
+if os.environ.get('DWT_TRACE') and multiprocessing.parent_process() is None:
+    start_tracing(os.environ['DWT_TRACE'])
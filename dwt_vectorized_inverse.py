@@ -0,0 +1,210 @@
+import numpy as np
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from dwt_metrics import inverse_multiply_adds, record, workspace_counts
+from dwt_timing import DWT_timing
+from dwt_trace import span
+from dwt_vectorized_separable import _axis_slice, phase_shape, uses_phases
+from dwt_workspace import DWT_workspace, workspace_key
+
+# Smallest number of output rows handed to one thread
+MIN_BAND_ROWS = 16
+
+# Number of output samples per band, so that the intermediate rows of a band stay in the L2 cache
+BAND_ELEMS = 1 << 16
+
+
+def idwt_rec_len(dim, maskwidth):
+    """
+    Number of samples reconstructed along an axis from dim coefficients (zero-padding mode, same as pywt.idwt)
+
+    :param: dim: number of coefficients along the axis
+    :param: maskwidth: length of the filter (10 for CDF9/7)
+    """
+    return 2 * dim - maskwidth + 2
+
+
+def synthesis_pass(lo, hi, filter_lo, filter_hi, axis, out, n_start=0, scratch=None, phases=None):
+    """
+    Upsampling by 2 followed by the convolution with both synthesis filters along axis (polyphase form)
+
+    Output sample n receives lo[k] * filter_lo[n + maskwidth - 2 - 2k] + hi[k] * filter_hi[n + maskwidth - 2 - 2k],
+    so each filter tap only touches every other output sample and no zero-stuffed signal is ever built
+
+    :param: lo: approximation coefficients along axis, float32
+    :param: hi: detail coefficients along axis, same shape as lo
+    :param: filter_lo: synthesis LPF of shape (maskwidth,), float32
+    :param: filter_hi: synthesis HPF of shape (maskwidth,), float32
+    :param: axis: axis along which the synthesis is performed
+    :param: out: output array, holds the reconstructed samples n_start ... n_start + out.shape[axis] - 1
+    :param: n_start: index of the first reconstructed sample held by out
+    :param: scratch: optional float32 buffer of shape phase_shape(out.shape, axis) (allocated if not given)
+    :param: phases: optional pair of float32 buffers of shape phase_shape(out.shape, axis) (allocated if not given
+            and needed)
+    """
+    maskwidth = filter_lo.shape[0]
+    dim_in = lo.shape[axis]
+    dim_out = out.shape[axis]
+    n_stop = n_start + dim_out
+
+    # Along the fastest varying axis the even and odd output samples are accumulated in two contiguous phase
+    # buffers that are interleaved into out once, instead of every tap writing with a stride of 2
+    use_phases = uses_phases(out, axis)
+    if use_phases:
+        if phases is None:
+            phases = [np.empty(phase_shape(out.shape, axis), dtype=np.float32) for _ in (0, 1)]
+        for p in (0, 1):
+            phases[p].fill(0)
+    else:
+        out.fill(0)
+
+    # Scratch buffer holding the product of one tap so that no temporary is allocated per tap
+    if scratch is None:
+        scratch = np.empty(phase_shape(out.shape, axis), dtype=np.float32)
+
+    for t in range(maskwidth):
+        coef_lo = filter_lo[t]
+        coef_hi = filter_hi[t]
+        if coef_lo == 0 and coef_hi == 0:
+            continue
+
+        # Coefficient k lands on output sample k * 2 + offset
+        offset = t - (maskwidth - 2)
+        k_lo = max(0, (n_start - offset + 1) // 2)
+        k_hi = min(dim_in, (n_stop - 1 - offset) // 2 + 1)
+        if k_hi <= k_lo:
+            continue
+
+        count = k_hi - k_lo
+        first = k_lo * 2 + offset - n_start
+        src = _axis_slice(lo.ndim, axis, slice(k_lo, k_hi))
+        if use_phases:
+            dst_arr = phases[first % 2]
+            dst = _axis_slice(out.ndim, axis, slice(first // 2, first // 2 + count))
+        else:
+            dst_arr = out
+            dst = _axis_slice(out.ndim, axis, slice(first, first + 2 * count - 1, 2))
+
+        prod = scratch[_axis_slice(out.ndim, axis, slice(0, count))]
+        if coef_lo != 0:
+            np.multiply(lo[src], coef_lo, out=prod)
+            np.add(dst_arr[dst], prod, out=dst_arr[dst])
+        if coef_hi != 0:
+            np.multiply(hi[src], coef_hi, out=prod)
+            np.add(dst_arr[dst], prod, out=dst_arr[dst])
+
+    if use_phases:
+        for p in (0, 1):
+            count = (dim_out - p + 1) // 2
+            out[_axis_slice(out.ndim, axis, slice(p, None, 2))] = phases[p][_axis_slice(out.ndim, axis, slice(0, count))]
+
+
+class DWT_vectorized_inverse:
+    def __init__(self, n_threads=None):
+        """
+        :param: n_threads: number of threads the row bands are spread across (defaults to the number of CPUs)
+        """
+        if n_threads is None:
+            n_threads = os.cpu_count() or 1
+        self.n_threads = n_threads
+        self.pool = ThreadPoolExecutor(max_workers=n_threads) if n_threads > 1 else None
+
+    def _band_buffers(self, workspace, key, band, rows, dim_C, dim_N):
+        """
+        Intermediate buffers of one band, taken from the workspace before the bands are dispatched to the threads
+
+        :return: tmp_lo, tmp_hi, col_scratch, row_scratch, row_phases
+        """
+        name = 'band{}_'.format(band)
+        tmp_lo = workspace.get(key, name + 'tmp_lo', (rows, dim_C))
+        tmp_hi = workspace.get(key, name + 'tmp_hi', (rows, dim_C))
+        col_scratch = workspace.get(key, name + 'col_scratch', phase_shape((rows, dim_C), 0))
+        row_scratch = workspace.get(key, name + 'row_scratch', phase_shape((rows, dim_N), 1))
+        row_phases = [workspace.get(key, name + 'row_phase{}'.format(p), phase_shape((rows, dim_N), 1))
+                      for p in (0, 1)]
+        return tmp_lo, tmp_hi, col_scratch, row_scratch, row_phases
+
+    def _band(self, h_cA, h_cH, h_cV, h_cD, syn_lo, syn_hi, rec_sig, row_start, row_stop, buffers):
+        """
+        Reconstruct the output rows row_start ... row_stop - 1
+
+        The vertical synthesis only reads the coefficient rows that reach the band, then the horizontal synthesis
+        is run on the band while it is still in cache
+        """
+        tmp_lo, tmp_hi, col_scratch, row_scratch, row_phases = buffers
+
+        with span('band', 'vectorized_inverse', rows=[int(row_start), int(row_stop)]):
+            # Vertical synthesis: (cA, cH) give the lowpass along the rows, (cV, cD) the highpass along the rows
+            synthesis_pass(h_cA, h_cH, syn_lo, syn_hi, 0, tmp_lo, row_start, col_scratch)
+            synthesis_pass(h_cV, h_cD, syn_lo, syn_hi, 0, tmp_hi, row_start, col_scratch)
+
+            # Horizontal synthesis
+            synthesis_pass(tmp_lo, tmp_hi, syn_lo, syn_hi, 1, rec_sig[row_start:row_stop], 0, row_scratch,
+                           row_phases)
+
+    def idwt_cpu_vectorized(self, h_cA, h_cH, h_cV, h_cD, filters, out=None, workspace=None):
+        """
+        Inverse 2D DWT on the CPU in float32, same output as run_iDWT in zero-padding mode
+
+        :params: h_cA, h_cH, h_cV, h_cD: 2D DWT coefficients of shape (R, C)
+        :param: filters: filter stack of shape (4, maskwidth) (an_lo, an_hi, syn_lo, syn_hi)
+        :param: out: optional float32 array of shape (2R - maskwidth + 2, 2C - maskwidth + 2) for the reconstruction
+        :param: workspace: optional DWT_workspace the intermediate and output buffers are taken from
+
+        :return: rec_sig: reconstructed image of shape (2R - maskwidth + 2, 2C - maskwidth + 2)
+        :return: timing: DWT_timing of the call (setup, alloc and compute)
+        """
+        timing = DWT_timing('vectorized_inverse')
+        maskwidth = filters[0].shape[0]
+
+        # Without a workspace every buffer is allocated for this call only
+        if workspace is None:
+            workspace = DWT_workspace()
+        counts = workspace_counts(workspace)
+        key = workspace_key(h_cA.shape, h_cA.dtype, maskwidth)
+
+        # Obtain the synthesis filters
+        filters = workspace.filters(filters)
+        h_syn_lo = filters[2, :]
+        h_syn_hi = filters[3, :]
+
+        coeffs = [np.asarray(c, dtype=np.float32) for c in (h_cA, h_cH, h_cV, h_cD)]
+
+        # Compute the size of the reconstructed image
+        dim_M = idwt_rec_len(h_cA.shape[0], maskwidth)
+        dim_N = idwt_rec_len(h_cA.shape[1], maskwidth)
+        if dim_M < 1 or dim_N < 1:
+            raise ValueError('Coefficients of shape {} are too small for a filter of length {}'.format(
+                h_cA.shape, maskwidth))
+        timing.mark('setup')
+        if out is None:
+            rec_sig = workspace.get(key, 'rec', (dim_M, dim_N))
+        else:
+            rec_sig = out
+
+        # Split the output rows into cache sized bands, at least a few per thread so that uneven bands balance out
+        band_rows = max(MIN_BAND_ROWS, min(BAND_ELEMS // dim_N, dim_M // (4 * self.n_threads)))
+        n_bands = max(1, dim_M // band_rows)
+        bounds = np.linspace(0, dim_M, n_bands + 1).astype(int)
+        bands = [(row_start, row_stop, self._band_buffers(workspace, key, band, row_stop - row_start, h_cA.shape[1],
+                                                          dim_N))
+                 for band, (row_start, row_stop) in enumerate(zip(bounds[:-1], bounds[1:]))]
+        timing.mark('alloc')
+
+        if self.pool is None or n_bands == 1:
+            for row_start, row_stop, buffers in bands:
+                self._band(*(coeffs + [h_syn_lo, h_syn_hi, rec_sig, row_start, row_stop, buffers]))
+        else:
+            futures = [self.pool.submit(self._band, *(coeffs + [h_syn_lo, h_syn_hi, rec_sig, row_start, row_stop,
+                                                               buffers]))
+                       for row_start, row_stop, buffers in bands]
+            for future in futures:
+                future.result()
+        timing.mark('compute')
+
+        timing.stop()
+        record(timing, rec_sig.size, coeffs, (rec_sig,),
+               inverse_multiply_adds(h_cA.shape[0], h_cA.shape[1], dim_M, dim_N, maskwidth), workspace, counts)
+
+        return rec_sig, timing
@@ -0,0 +1,449 @@
+import numpy as np
+
+from dwt_metrics import forward_multiply_adds, record, workspace_counts
+from dwt_timing import DWT_timing
+from dwt_workspace import DWT_workspace, workspace_key
+
+
+# Dtypes the passes read without a float32 copy of the input, the conversion happens as the row pass reads them
+DIRECT_INPUT_DTYPES = (np.dtype(np.float32), np.dtype(np.uint8), np.dtype(np.uint16))
+
+# Size of a cache line, the downsampling reads every other sample along an axis and wastes part of every line when
+# consecutive samples are closer than that
+CACHE_LINE_BYTES = 64
+
+# Boundary modes of the CPU engines, with the same extension of the signal as the pywt modes of the same name
+MODES = ('zero', 'symmetric', 'reflect', 'periodization')
+
+
+def dwt_coeff_len(dim, maskwidth, mode='zero'):
+    """
+    Number of coefficients produced along an axis of length dim by the separable kernels
+
+    :param: dim: length of the input along the axis
+    :param: maskwidth: length of the filter (10 for CDF9/7)
+    :param: mode: boundary mode, one of MODES
+
+    :return: length of the decimated output, equals to W_half / H_half in the CUDA kernels (zero-padding mode) and to
+             pywt.dwt_coeff_len
+    """
+    if mode == 'periodization':
+        return (dim + 1) // 2
+    return (dim + maskwidth - 1) // 2
+
+
+def input_scale(dtype, scale=None):
+    """
+    Factor the input is multiplied by, folded into the filters of the row pass so that it costs no extra pass
+
+    :param: dtype: dtype of the input
+    :param: scale: explicit factor. If not given, unsigned integer images are normalized to [0, 1] (1/255 for uint8,
+            1/65535 for uint16) and other images are left as they are
+
+    :return: the factor as a float32
+    """
+    if scale is None:
+        dtype = np.dtype(dtype)
+        scale = 1.0 / np.iinfo(dtype).max if dtype.kind == 'u' else 1.0
+    return np.float32(scale)
+
+
+def as_pass_input(h_input):
+    """
+    Input as read by the row pass: float32, uint8 and uint16 arrays are used as they are and converted while the row
+    pass reads them, other dtypes are converted to float32 once
+    """
+    if h_input.dtype in DIRECT_INPUT_DTYPES:
+        return h_input
+    return np.asarray(h_input, dtype=np.float32)
+
+
+def extend_index(idx, dim, mode):
+    """
+    Map input indices outside of [0, dim) back into the signal, as pywt extends it in the given boundary mode
+
+    :param: idx: integer array of input indices
+    :param: dim: length of the input along the axis
+    :param: mode: 'symmetric' (x[-1] = x[0]), 'reflect' (x[-1] = x[1]) or 'periodization' (odd lengths are extended
+            with a copy of the last sample, then wrapped around)
+
+    :return: integer array of indices in [0, dim)
+    """
+    if mode == 'symmetric':
+        idx = np.mod(idx, 2 * dim)
+        return np.where(idx < dim, idx, 2 * dim - 1 - idx)
+    if mode == 'reflect':
+        idx = np.mod(idx, 2 * dim - 2)
+        return np.where(idx < dim, idx, 2 * dim - 2 - idx)
+    if mode == 'periodization':
+        return np.minimum(np.mod(idx, dim + dim % 2), dim - 1)
+    raise ValueError("Unknown mode '{}', expected one of {}".format(mode, MODES))
+
+
+def _axis_slice(ndim, axis, sl):
+    """
+    Build an index tuple that applies the slice sl along axis and keeps every other axis whole
+    """
+    idx = [slice(None)] * ndim
+    idx[axis] = sl
+    return tuple(idx)
+
+
+def _tap_range(j, maskwidth, dim_in, dim_out, shift=0):
+    """
+    Range of output indices for which filter tap j reads a valid input sample
+
+    Output index c reads the input index c * 2 - (maskwidth - 2) + j (same as N_start_col + j in w_kernel_forward1),
+    so instead of checking (curCol > -1) && (curCol < W) per element, the outputs whose input falls into the zero
+    halo are dropped from the slice
+
+    :param: shift: 2 * c_start - x_start when the output and input only hold a tile of the whole axis (see
+            analysis_pass)
+
+    :return: c_lo, c_hi: first and one past last output index updated by the tap
+    :return: start: input index read by output c_lo
+    """
+    offset = j - (maskwidth - 2) + shift
+    c_lo = max(0, (1 - offset) // 2)
+    c_hi = min(dim_out, (dim_in - 1 - offset) // 2 + 1)
+    return c_lo, c_hi, c_lo * 2 + offset
+
+
+def phase_shape(shape, axis):
+    """
+    Shape of the buffer holding one polyphase component (even or odd samples) of an array along axis
+    """
+    res = list(shape)
+    res[axis] = (shape[axis] + 1) // 2
+    return tuple(res)
+
+
+def with_dim(shape, axis, dim):
+    """
+    Shape with the length along axis replaced by dim
+    """
+    res = list(shape)
+    res[axis] = dim
+    return tuple(res)
+
+
+def uses_phases(x, axis):
+    """
+    Whether analysis_pass splits x into its polyphase components, i.e. whether two samples along axis share a cache
+    line: the fastest varying axis, or the pixel axis of an interleaved (M, N, C) image
+    """
+    return x.ndim > 1 and 2 * abs(x.strides[axis]) < CACHE_LINE_BYTES
+
+
+def fold_taps(filt):
+    """
+    Pair up the taps of a symmetric or antisymmetric filter so that the mirrored samples are added (or subtracted)
+    before the single multiply
+
+    The symmetry is checked on the nonzero support of the filter, the CDF9/7 filters are stored with zero padding and
+    are not centered in the array
+
+    :param: filt: filter coefficients of shape (maskwidth,)
+
+    :return: list of (coef, j, k, sign) with the input taps j and k (k is None for the center tap) of
+             coef * (x_j + sign * x_k), or None if the filter has no symmetry
+    """
+    maskwidth = filt.shape[0]
+    support = np.flatnonzero(filt)
+    if support.size == 0:
+        return []
+    first, last = int(support[0]), int(support[-1])
+    taps = filt[first:last + 1]
+    if np.array_equal(taps, taps[::-1]):
+        sign = 1
+    elif np.array_equal(taps, -taps[::-1]):
+        sign = -1
+    else:
+        return None
+
+    folded = []
+    for i in range(first, (first + last) // 2 + 1):
+        mirror = first + last - i
+        if filt[i] == 0:
+            continue
+        # flip the kernel: coefficient i is applied to input tap maskwidth - 1 - i
+        folded.append((filt[i], maskwidth - 1 - i, None if mirror == i else maskwidth - 1 - mirror, sign))
+    return folded
+
+
+def analysis_pass(x, filter_lo, filter_hi, axis, out_lo, out_hi, scratch=None, phases=None, c_start=0, x_start=0,
+                  mode='zero'):
+    """
+    1D convolution of x with both analysis filters along axis followed by downsampling by 2 (polyphase form)
+
+    Each tap of the filter updates a strided slice of the output in a single vectorized operation. Symmetric and
+    antisymmetric filters (see fold_taps) add the two mirrored slices first and multiply once, which halves the
+    multiplies, other filters are accumulated tap by tap in the order of the kerIdx loop of the CUDA kernels.
+
+    The slices only cover the outputs whose input samples are all inside x, so the interior runs without any bounds
+    check. In the other boundary modes the few outputs of each tap that fall into the halo are then gathered from the
+    indices remapped by extend_index, and no padded copy of x is built
+
+    :param: x: input array of any dimension, float32, uint8 or uint16 (see as_pass_input)
+    :param: filter_lo: LPF coefficients of shape (maskwidth,), float32
+    :param: filter_hi: HPF coefficients of shape (maskwidth,), float32
+    :param: axis: axis along which the convolution is performed
+    :param: out_lo: output of the LPF, same shape as x except dwt_coeff_len(x.shape[axis], maskwidth) along axis
+    :param: out_hi: output of the HPF, same shape as out_lo
+    :param: scratch: optional float32 buffer with the shape of out_lo (allocated if not given)
+    :param: phases: optional pair of buffers of shape phase_shape(x.shape, axis), in the dtype of x or float32
+            (allocated in the dtype of x if not given and needed)
+    :param: c_start: index along axis of the first output held by out_lo and out_hi, when only a tile is computed
+    :param: x_start: index along axis of the first input sample held by x. Inputs outside of x are treated as zero,
+            so x must hold every valid sample the tile reads
+    :param: mode: boundary mode, one of MODES. Modes other than 'zero' need the whole axis (c_start = x_start = 0)
+    """
+    maskwidth = filter_lo.shape[0]
+    dim_in = x.shape[axis]
+    dim_out = out_lo.shape[axis]
+
+    if mode not in MODES:
+        raise ValueError("Unknown mode '{}', expected one of {}".format(mode, MODES))
+    if mode != 'zero' and (c_start != 0 or x_start != 0):
+        raise ValueError("Mode '{}' needs the whole axis, tiles are only supported in zero mode".format(mode))
+    if mode == 'reflect' and dim_in < 2:
+        raise ValueError('Reflect mode needs at least 2 samples along the transformed axis')
+
+    # In periodization mode output c is centered on input c * 2 + 1 instead of starting there
+    shift = 2 * c_start - x_start
+    if mode == 'periodization':
+        shift += (maskwidth - 1) // 2
+
+    # Scratch buffer holding the product of one tap so that no temporary is allocated per tap
+    if scratch is None:
+        scratch = np.empty(out_lo.shape, dtype=np.float32)
+
+    # Along the fastest varying axis a stride of 2 wastes half of every cache line, so the input is split into its
+    # even and odd phases once and every tap then reads a contiguous slice of one phase. The phases keep the dtype of
+    # x, the multiply of each tap converts the samples to float32
+    if uses_phases(x, axis):
+        if phases is None:
+            phases = [np.empty(phase_shape(x.shape, axis), dtype=x.dtype) for _ in (0, 1)]
+        for p in (0, 1):
+            np.copyto(phases[p][_axis_slice(x.ndim, axis, slice(0, (dim_in - p + 1) // 2))],
+                      x[_axis_slice(x.ndim, axis, slice(p, None, 2))])
+    else:
+        phases = None
+
+    ranges = [_tap_range(j, maskwidth, dim_in, dim_out, shift) for j in range(maskwidth)]
+
+    def source(j, c_lo, c_hi):
+        # Input samples read by tap j for the outputs c_lo ... c_hi - 1, with a stride of 2 due to downsampling
+        start = ranges[j][2] + 2 * (c_lo - ranges[j][0])
+        if phases is None:
+            return x[_axis_slice(x.ndim, axis, slice(start, start + 2 * (c_hi - c_lo) - 1, 2))]
+        return phases[start % 2][_axis_slice(x.ndim, axis, slice(start // 2, start // 2 + c_hi - c_lo))]
+
+    def accumulate(res, coef, j, c_lo, c_hi):
+        if c_hi <= c_lo:
+            return
+        dst = _axis_slice(res.ndim, axis, slice(c_lo, c_hi))
+        prod = scratch[dst]
+        np.multiply(source(j, c_lo, c_hi), coef, out=prod)
+        np.add(res[dst], prod, out=res[dst])
+
+    for res, filt in ((out_lo, filter_lo), (out_hi, filter_hi)):
+        res.fill(0)
+        taps = fold_taps(filt)
+        if taps is None:
+            # flip the kernel
+            taps = [(filt[maskwidth - j - 1], j, None, 1) for j in range(maskwidth) if filt[maskwidth - j - 1] != 0]
+
+        for coef, j, k, sign in taps:
+            if k is None:
+                accumulate(res, coef, j, ranges[j][0], ranges[j][1])
+                continue
+
+            # Outputs for which both mirrored taps read a valid sample get a single multiply, the outputs near the
+            # edges where only one of them does are accumulated tap by tap
+            c_lo = max(ranges[j][0], ranges[k][0])
+            c_hi = min(ranges[j][1], ranges[k][1])
+            if c_hi <= c_lo:
+                c_lo = c_hi = ranges[j][1]
+            else:
+                dst = _axis_slice(res.ndim, axis, slice(c_lo, c_hi))
+                prod = scratch[dst]
+                (np.add if sign > 0 else np.subtract)(source(j, c_lo, c_hi), source(k, c_lo, c_hi), out=prod,
+                                                      dtype=np.float32)
+                np.multiply(prod, coef, out=prod)
+                np.add(res[dst], prod, out=res[dst])
+            for tap, tap_coef in ((j, coef), (k, sign * coef)):
+                accumulate(res, tap_coef, tap, ranges[tap][0], min(ranges[tap][1], c_lo))
+                accumulate(res, tap_coef, tap, max(ranges[tap][0], c_hi), ranges[tap][1])
+
+        if mode == 'zero':
+            continue
+
+        # Halo of every tap: the outputs before and after its valid range read remapped input samples
+        for j in range(maskwidth):
+            coef = filt[maskwidth - j - 1]
+            c_lo, c_hi, _ = ranges[j]
+            if coef == 0:
+                continue
+            if c_hi <= c_lo:
+                c_lo = c_hi = dim_out
+            for h_lo, h_hi in ((0, c_lo), (c_hi, dim_out)):
+                if h_hi <= h_lo:
+                    continue
+                idx = extend_index(2 * np.arange(h_lo, h_hi) + j - (maskwidth - 2) + shift, dim_in, mode)
+                dst = _axis_slice(res.ndim, axis, slice(h_lo, h_hi))
+                prod = scratch[dst]
+                np.multiply(np.take(x, idx, axis=axis), coef, out=prod)
+                np.add(res[dst], prod, out=res[dst])
+
+
+class DWT_vectorized_separable:
+    def __init__(self):
+        # Both passes are the numpy counterparts of w_kernel_forward1 (convolution along each row) and
+        # w_kernel_forward2 (convolution along each column) of DWT_naive_separable. The axes are counted from the end
+        # so that stacks of planes of shape (P, M, N) are transformed by the same passes
+        self.row_axis = -1
+        self.col_axis = -2
+
+    def _forward(self, h_input, filters, out, workspace, mode='zero', scale=None, row_axis=None, col_axis=None):
+        """
+        Run both passes on an array of shape (..., M, N), every leading axis is a separate plane. With row_axis=-2 and
+        col_axis=-3 the array is an (M, N, C) image instead, and every vectorized operation covers all of its channels
+
+        :return: h_cA, h_cH, h_cV, h_cD: coefficients of shape (..., (M + maskwidth - 1)//2, (N + maskwidth - 1)//2),
+                 or ((M + maskwidth - 1)//2, (N + maskwidth - 1)//2, C)
+        :return: timing: DWT_timing of the call (setup, alloc and compute)
+        """
+        timing = DWT_timing('vectorized')
+        if mode not in MODES:
+            raise ValueError("Unknown mode '{}', expected one of {}".format(mode, MODES))
+        if row_axis is None:
+            row_axis = self.row_axis
+        if col_axis is None:
+            col_axis = self.col_axis
+
+        # Obtain the shape of the input matrix
+        dim_M = h_input.shape[col_axis]
+        dim_N = h_input.shape[row_axis]
+        maskwidth = filters[0].shape[0]
+
+        # Without a workspace every buffer is allocated for this call only
+        if workspace is None:
+            workspace = DWT_workspace()
+        counts = workspace_counts(workspace)
+        key = workspace_key(h_input.shape, h_input.dtype, maskwidth, mode)
+
+        # Obtain the filters for DWT
+        filters = workspace.filters(filters)
+        h_filter_lo = filters[0, :]
+        h_filter_hi = filters[1, :]
+
+        # The scale of the input is folded into the filters of the row pass
+        scale = input_scale(h_input.dtype, scale)
+        row_filter_lo = h_filter_lo * scale if scale != 1 else h_filter_lo
+        row_filter_hi = h_filter_hi * scale if scale != 1 else h_filter_hi
+
+        # Compute the size of the output of the wavelet transform
+        dim_R = dwt_coeff_len(dim_M, maskwidth, mode)
+        dim_C = dwt_coeff_len(dim_N, maskwidth, mode)
+
+        # Obtain the intermediate and output arrays (no copy of the input if it is float32, uint8 or uint16, whatever
+        # its strides)
+        h_input = as_pass_input(h_input)
+        tmp_shape = with_dim(h_input.shape, row_axis, dim_C)
+        out_shape = with_dim(tmp_shape, col_axis, dim_R)
+        timing.mark('setup')
+        h_tmp_a1 = workspace.get(key, 'tmp_a1', tmp_shape)
+        h_tmp_a2 = workspace.get(key, 'tmp_a2', tmp_shape)
+        row_scratch = workspace.get(key, 'row_scratch', tmp_shape)
+        col_scratch = workspace.get(key, 'col_scratch', out_shape)
+        row_phases = None
+        if uses_phases(h_input, row_axis):
+            # In the dtype of the input, so that a uint8 image is never copied to float32
+            row_phases = [workspace.get(key, 'row_phase{}'.format(p), phase_shape(h_input.shape, row_axis),
+                                        dtype=h_input.dtype)
+                          for p in (0, 1)]
+
+        if out is None:
+            h_cA = workspace.get(key, 'cA', out_shape)
+            h_cH = workspace.get(key, 'cH', out_shape)
+            h_cV = workspace.get(key, 'cV', out_shape)
+            h_cD = workspace.get(key, 'cD', out_shape)
+        else:
+            h_cA, h_cH, h_cV, h_cD = out
+        timing.mark('alloc')
+
+        # First pass: convolution along each row, output is of shape (..., M, (N + maskwidth - 1)//2)
+        analysis_pass(h_input, row_filter_lo, row_filter_hi, row_axis, h_tmp_a1, h_tmp_a2, row_scratch, row_phases,
+                      mode=mode)
+
+        # Second pass: convolution along each column of both subbands
+        analysis_pass(h_tmp_a1, h_filter_lo, h_filter_hi, col_axis, h_cA, h_cH, col_scratch, mode=mode)
+        analysis_pass(h_tmp_a2, h_filter_lo, h_filter_hi, col_axis, h_cV, h_cD, col_scratch, mode=mode)
+        timing.mark('compute')
+
+        timing.stop()
+        planes = h_input.size // (dim_M * dim_N)
+        record(timing, h_input.size, (h_input,), (h_cA, h_cH, h_cV, h_cD),
+               forward_multiply_adds(dim_M, dim_R, dim_C, maskwidth, planes), workspace, counts)
+
+        return h_cA, h_cH, h_cV, h_cD, timing
+
+    def dwt_cpu_vectorized_separable(self, h_input, filters, BLOCK_WIDTH=None, out=None, workspace=None, mode='zero',
+                                     scale=None):
+        """
+        Separable 2D DWT on the CPU using numpy, drop-in replacement for dwt_gpu_naive_separable
+
+        :param: h_input: input image of shape (M, N), uint8 and uint16 images and strided views such as one channel
+                of an (M, N, 3) image are read without a copy
+        :param: filters: filter stack of shape (4, maskwidth) (an_lo, an_hi, syn_lo, syn_hi)
+        :param: BLOCK_WIDTH: unused, kept so that the call signature matches the CUDA kernels
+        :param: out: optional tuple of four float32 arrays (cA, cH, cV, cD) the coefficients are written into
+        :param: workspace: optional DWT_workspace the intermediate and output buffers are taken from
+        :param: mode: boundary mode, one of MODES, the coefficients match pywt.dwt2 in the same mode
+        :param: scale: factor applied to the input in the row pass, see input_scale (uint8 and uint16 images are
+                normalized to [0, 1] by default)
+
+        :return: h_cA, h_cH, h_cV, h_cD: 2D DWT coefficients of shape ((M + maskwidth - 1)//2,
+                 (N + maskwidth - 1)//2), or ((M + 1)//2, (N + 1)//2) in periodization mode
+        :return: timing: DWT_timing of the call (setup, alloc and compute)
+        """
+        if h_input.ndim != 2:
+            raise ValueError('Expected an image of shape (M, N), got shape {}'.format(h_input.shape))
+
+        return self._forward(h_input, filters, out, workspace, mode, scale)
+
+    def dwt_cpu_batched(self, h_stack, filters, layout='NHW', out=None, workspace=None, mode='zero', scale=None):
+        """
+        Separable 2D DWT of a stack of same-shape planes in one vectorized pass, e.g. the channels of an RGB image
+
+        :param: h_stack: stack of planes of shape (P, M, N) for layout 'NHW', or image of shape (M, N, P) for 'HWC'.
+                Any strides, the interleaved channels of an 'HWC' image are read in place
+        :param: filters: filter stack of shape (4, maskwidth) (an_lo, an_hi, syn_lo, syn_hi)
+        :param: layout: 'NHW' (planes first) or 'HWC' (channels last)
+        :param: out: optional tuple of four float32 arrays (cA, cH, cV, cD) of shape (P, R, C)
+        :param: workspace: optional DWT_workspace the intermediate and output buffers are taken from
+        :param: mode: boundary mode, one of MODES
+        :param: scale: factor applied to the input in the row pass, see input_scale
+
+        :return: h_cA, h_cH, h_cV, h_cD: 2D DWT coefficients of shape (P, (M + maskwidth - 1)//2,
+                 (N + maskwidth - 1)//2), or (P, (M + 1)//2, (N + 1)//2) in periodization mode. For 'HWC' they are
+                 channels-first views of (R, C, P) buffers
+        :return: timing: DWT_timing of the call (setup, alloc and compute)
+        """
+        if h_stack.ndim != 3:
+            raise ValueError('Expected a stack of planes with 3 dimensions, got shape {}'.format(h_stack.shape))
+
+        if layout == 'NHW':
+            return self._forward(h_stack, filters, out, workspace, mode, scale)
+        if layout != 'HWC':
+            raise ValueError("Unknown layout '{}', expected 'NHW' or 'HWC'".format(layout))
+
+        # The passes run on the interleaved image itself, along its second (rows) and first (columns) axes, so the
+        # channels are neither split nor copied and every tap updates all of them at once
+        if out is not None:
+            out = tuple(np.moveaxis(res, 0, -1) for res in out)
+        h_cA, h_cH, h_cV, h_cD, timing = self._forward(h_stack, filters, out, workspace, mode, scale, row_axis=-2,
+                                                       col_axis=-3)
+        return (np.moveaxis(h_cA, -1, 0), np.moveaxis(h_cH, -1, 0), np.moveaxis(h_cV, -1, 0),
+                np.moveaxis(h_cD, -1, 0), timing)
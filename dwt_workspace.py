@@ -0,0 +1,120 @@
+import numpy as np
+from collections import OrderedDict
+
+# Default byte budget of a workspace
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# Number of small memoized objects (converted filters, device copies of the filters) kept by a workspace
+MAX_MEMOS = 64
+
+
+def workspace_key(shape, dtype, maskwidth, mode='zero'):
+    """
+    Key of the buffers used to transform an input of the given shape and dtype with a filter of length maskwidth and
+    a boundary mode
+    """
+    return tuple(shape), np.dtype(dtype).str, maskwidth, mode
+
+
+class DWT_workspace:
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        Pool of preallocated intermediate and output buffers that is reused across calls of the engines
+
+        Buffers are grouped by workspace_key(shape, dtype, maskwidth) and looked up by name inside a group, so a steady
+        stream of same-sized images does not allocate anything after the first call. Groups are evicted in least
+        recently used order once the buffers exceed max_bytes. The outputs returned by an engine that was given a
+        workspace are owned by the workspace and overwritten by the next call with the same key, and a workspace must
+        not be shared by calls running concurrently
+
+        :param: max_bytes: byte budget of the buffers held by the workspace
+        """
+        self.max_bytes = max_bytes
+        self.groups = OrderedDict()
+        self.memos = OrderedDict()
+        self.nbytes = 0
+
+        # hits: buffer reused, allocations: buffer allocated, evictions: groups dropped to stay within the budget
+        self.hits = 0
+        self.allocations = 0
+        self.evictions = 0
+
+    def stats(self):
+        """
+        :return: dictionary with the number of bytes held and the hit, allocation and eviction counts
+        """
+        return {'nbytes': self.nbytes, 'hits': self.hits, 'allocations': self.allocations,
+                'evictions': self.evictions}
+
+    def get(self, key, name, shape, dtype=np.float32, alloc=np.empty):
+        """
+        Return the buffer called name in the group key, allocating it on first use
+
+        :param: key: group key from workspace_key
+        :param: name: name of the buffer inside the group
+        :param: shape: shape of the buffer
+        :param: dtype: dtype of the buffer
+        :param: alloc: allocation function called as alloc(shape, dtype), e.g. np.empty or pycuda.gpuarray.empty
+
+        :return: buffer of the requested shape and dtype
+        """
+        group = self.groups.get(key)
+        if group is None:
+            group = self.groups[key] = {}
+        else:
+            self.groups.move_to_end(key)
+
+        buf = group.get(name)
+        shape = tuple(shape)
+        if buf is not None and tuple(buf.shape) == shape and buf.dtype == np.dtype(dtype):
+            self.hits += 1
+            return buf
+
+        if buf is not None:
+            self.nbytes -= buf.nbytes
+        buf = alloc(shape, dtype)
+        group[name] = buf
+        self.nbytes += buf.nbytes
+        self.allocations += 1
+        self._evict(key)
+
+        return buf
+
+    def memo(self, key, factory):
+        """
+        Return the object memoized under key, calling factory() to create it on first use
+
+        Used for small objects that depend on values rather than shapes, such as the float32 filters
+        """
+        if key in self.memos:
+            self.memos.move_to_end(key)
+            self.hits += 1
+            return self.memos[key]
+
+        value = self.memos[key] = factory()
+        self.allocations += 1
+        if len(self.memos) > MAX_MEMOS:
+            self.memos.popitem(last=False)
+        return value
+
+    def filters(self, filters):
+        """
+        :param: filters: filter stack of shape (4, maskwidth)
+        :return: the filters as a float32 array, converted once per distinct filter stack
+        """
+        filters = np.asarray(filters)
+        key = ('filters', filters.dtype.str, filters.shape, filters.tobytes())
+        return self.memo(key, lambda: np.ascontiguousarray(filters, dtype=np.float32))
+
+    def _evict(self, keep):
+        """
+        Drop least recently used groups (except keep) until the buffers fit in the byte budget
+        """
+        while self.nbytes > self.max_bytes and len(self.groups) > 1:
+            key = next(iter(self.groups))
+            if key == keep:
+                self.groups.move_to_end(key)
+                key = next(iter(self.groups))
+            group = self.groups.pop(key)
+            self.nbytes -= sum(buf.nbytes for buf in group.values())
+            self.evictions += 1
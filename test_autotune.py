@@ -0,0 +1,45 @@
+#File to check the autotuner and the pick up of the tuned parameters by the CPU engines (no GPU required).
+
+import os
+import tempfile
+import numpy as np
+from dwt_autotune import *
+from dwt_multiprocess_cpu import *
+from dwt_serial import *
+from dwt_tiled_cpu import *
+from dwt_vectorized_separable import *
+from dwt_workspace import *
+
+signal = np.random.rand(300, 200).astype(np.float32)
+filters = np.array(gen_wavelet().filter_bank, dtype=np.float32)
+ref = DWT_vectorized_separable().dwt_cpu_vectorized_separable(signal, filters)[:4]
+
+print('shape buckets: {}'.format(shape_bucket((1080, 1920)) == (1024, 2048) and
+                                 tuning_key('tiled', (300, 200), np.float32) == 'tiled:256x256:float32'))
+
+with tempfile.TemporaryDirectory() as tmpdir:
+    path = os.path.join(tmpdir, 'tuning.json')
+    set_default_tuning(DWT_tuning(path))
+    print('nothing tuned without a file: {}'.format(tuned_params('tiled', signal.shape, signal.dtype) == {}))
+
+    # The winner is one of the candidates and is saved for the whole bucket
+    best, results = autotune('tiled', signal.shape, 'float32', filters, warmup=0, trials=1)
+    print('autotune picks a candidate: {}'.format(best in candidates('tiled', signal.shape) and
+                                                  len(results) == len(candidates('tiled', signal.shape))))
+    saved = DWT_tuning(path)
+    print('tuning saved: {}'.format(saved.lookup('tiled', (280, 230), np.float32) == best and
+                                    saved.lookup('tiled', signal.shape, np.uint8) == {}))
+
+    # The engines take the tuned parameters they are not given
+    default_tuning().store('tiled', signal.shape, 'float32', {'tile_rows': 24, 'n_threads': 1}, 0.0)
+    default_tuning().store('multiprocess', signal.shape, 'float32', {'strip_rows': 40}, 0.0)
+    dwt_tiled = DWT_tiled_cpu()
+    tuned = tuned_params('tiled', signal.shape, signal.dtype)
+    print('tuned tile picked up: {}'.format(dwt_tiled.tile_shape(200, 154, 104, tuned)[0] == 24 and
+                                            DWT_tiled_cpu(tile_rows=8).tile_shape(200, 154, 104, tuned)[0] == 8))
+    out = dwt_tiled.dwt_cpu_tiled(signal, filters)[:4]
+    print('tuned tiled output: {}'.format(all(np.allclose(a, b, atol=1e-5) for a, b in zip(out, ref))))
+    with DWT_multiprocess_cpu(n_processes=1) as dwt_multiprocess:
+        out = dwt_multiprocess.dwt_cpu_multiprocess(signal, filters)[:4]
+    print('tuned multiprocess output: {}'.format(all(np.allclose(a, b, atol=1e-5) for a, b in zip(out, ref))))
+    set_default_tuning(None)
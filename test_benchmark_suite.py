@@ -0,0 +1,48 @@
+#File to check the benchmark runner and its regression comparison on small images (no GPU required).
+
+import copy
+import os
+import shutil
+import tempfile
+from benchmark_suite import *
+
+tmpdir = tempfile.mkdtemp()
+results = run_suite(engines=('vectorized', 'tiled'), shapes=((64, 48),), dtypes=('float32', 'uint8'), threads=(1, 2),
+                    warmup=1, trials=3, verbose=False)
+print('one result per case: {}'.format(len(results['results']) == 2 + 4))
+print('statistics ordered: {}'.format(all(r['min_s'] <= r['median_s'] <= r['p95_s'] for r in results['results'])))
+print('throughput from median: {}'.format(all(
+    abs(r['mpix_per_s'] - 64 * 48 / r['median_s'] * 1e-6) < 1e-9 for r in results['results'])))
+
+# Round trip through JSON
+path = os.path.join(tmpdir, 'baseline.json')
+save_results(results, path)
+loaded = load_results(path)
+print('results saved and loaded: {}'.format(loaded['results'] == results['results']))
+
+# A run compared with itself has no regression, a baseline twice as fast flags every case
+print('no regression against itself: {}'.format(
+    all(row[4] == 'ok' for row in compare_results(loaded, loaded))))
+faster = copy.deepcopy(loaded)
+for r in faster['results']:
+    r['median_s'] /= 2
+print('slower run flagged: {}'.format(all(row[4] == 'regression' for row in compare_results(faster, loaded))))
+print('faster run flagged: {}'.format(all(row[4] == 'improvement' for row in compare_results(loaded, faster))))
+
+# Cases only in one of the files are reported, not compared
+partial = copy.deepcopy(loaded)
+partial['results'] = partial['results'][1:]
+print('missing and new cases: {}'.format(
+    [row[4] for row in compare_results(loaded, partial)].count('missing') == 1 and
+    [row[4] for row in compare_results(partial, loaded)].count('new') == 1))
+
+# The compare command fails on regressions
+save_results(faster, os.path.join(tmpdir, 'faster.json'))
+print('compare command exit codes: {}'.format(main(['compare', path, path]) == 0 and
+                                              main(['compare', os.path.join(tmpdir, 'faster.json'), path]) == 1))
+
+# Importing the engines loads none of the optional dependencies
+imports = measure_imports(trials=1)
+print('lazy imports: {}'.format(imports['loaded'] == [] and 0 < imports['seconds'] < DEFAULT_IMPORT_BUDGET))
+
+shutil.rmtree(tmpdir)
@@ -0,0 +1,261 @@
+#File to run the CPU engines on a random 2D signal and compare the coefficients with the serial implementation.
+
+import numpy as np
+import os
+import pywt
+import tempfile
+from dwt_serial import *
+from dwt_vectorized_separable import *
+from dwt_lifting import *
+from dwt_multilevel import *
+from dwt_vectorized_inverse import *
+from dwt_workspace import *
+from dwt_tiled_cpu import *
+from dwt_multiprocess_cpu import *
+from dwt_streaming import *
+from dwt_nonseparable_cpu import *
+from dwt_fft import *
+
+"""
+1. Test serial with some random array
+"""
+signal = np.random.rand(1000, 1000).astype(np.float32)
+
+wav = gen_wavelet()
+cA, cH, cV, cD, serial_time = run_DWT(signal, wav, False, mode='zero')
+
+# Define the coefficients for the CDF9/7 filters
+factor = 1
+
+# Forward Decomposition filter: lowpass
+cdf97_an_lo = factor * np.array([0, 0.026748757411, -0.016864118443, -0.078223266529, 0.266864118443,
+                                 0.602949018236, 0.266864118443, -0.078223266529, -0.016864118443,
+                                 0.026748757411])
+
+# Forward Decomposition filter: highpass
+cdf97_an_hi = factor * np.array([0, 0.091271763114, -0.057543526229, -0.591271763114, 1.11508705,
+                                 -0.591271763114, -0.057543526229, 0.091271763114, 0, 0])
+
+# Inverse Reconstruction filter: lowpass
+cdf97_syn_lo = factor * np.array([0, -0.091271763114, -0.057543526229, 0.591271763114, 1.11508705,
+                                  0.591271763114, -0.057543526229, -0.091271763114, 0, 0])
+
+# Inverse Reconstruction filter: highpass
+cdf97_syn_hi = factor * np.array([0, 0.026748757411, 0.016864118443, -0.078223266529, -0.266864118443,
+                                  0.602949018236, -0.266864118443, -0.078223266529, 0.016864118443,
+                                  0.026748757411])
+filters = np.vstack((cdf97_an_lo, cdf97_an_hi, cdf97_syn_lo, cdf97_syn_hi)).astype(np.float32)
+
+"""
+2. Test vectorized separable engine with some random array
+"""
+dwt_vectorized = DWT_vectorized_separable()
+v_cA, v_cH, v_cV, v_cD, vectorized_time = dwt_vectorized.dwt_cpu_vectorized_separable(signal, filters)
+
+print('vectorized same as serial c_A: {}'.format(np.allclose(cA, v_cA, atol=5e-7)))
+print('vectorized same as serial c_H: {}'.format(np.allclose(cH, v_cH, atol=5e-7)))
+print('vectorized same as serial c_V: {}'.format(np.allclose(cV, v_cV, atol=5e-7)))
+print('vectorized same as serial c_D: {}'.format(np.allclose(cD, v_cD, atol=5e-7)))
+
+# uint8 input is read directly, the 1/255 normalization is folded into the row pass
+u8_signal = (signal * 255).astype(np.uint8)
+u8_workspace = DWT_workspace()
+u8_coeffs = dwt_vectorized.dwt_cpu_vectorized_separable(u8_signal, filters, workspace=u8_workspace)[:4]
+f32_coeffs = DWT_vectorized_separable().dwt_cpu_vectorized_separable(u8_signal.astype(np.float32) / 255, filters)[:4]
+print('vectorized uint8 same as float32 / 255: {}'.format(
+    all(np.allclose(a, b, atol=5e-6) for a, b in zip(f32_coeffs, u8_coeffs))))
+print('vectorized uint8 phases stay uint8: {}'.format(
+    all(buf.dtype == np.uint8 for group in u8_workspace.groups.values() for name, buf in group.items()
+        if name.startswith('row_phase'))))
+
+# Boundary modes other than zero padding, on an odd-sized array so that the periodization extension is exercised
+odd_signal = np.random.rand(101, 77).astype(np.float32)
+for mode in ('symmetric', 'reflect', 'periodization'):
+    p_cA, p_cH, p_cV, p_cD, _ = run_DWT(odd_signal, wav, False, mode=mode)
+    m_coeffs = dwt_vectorized.dwt_cpu_vectorized_separable(odd_signal, filters, mode=mode)[:4]
+    print('vectorized same as serial in {} mode: {}'.format(mode, all(
+        a.shape == b.shape and np.allclose(a, b, atol=5e-6) for a, b in zip((p_cA, p_cH, p_cV, p_cD), m_coeffs))))
+
+"""
+3. Test batched vectorized engine with a random RGB image
+"""
+rgb_signal = np.random.rand(300, 200, 3).astype(np.float32)
+b_cA, b_cH, b_cV, b_cD, batched_time = dwt_vectorized.dwt_cpu_batched(rgb_signal, filters, layout='HWC')
+
+for c in range(3):
+    c_cA, c_cH, c_cV, c_cD, _ = run_DWT(rgb_signal[:, :, c], wav, False, mode='zero')
+    print('batched same as serial channel {}: {}'.format(c, all(np.allclose(a, b[c], atol=5e-7) for a, b in
+                                                                zip((c_cA, c_cH, c_cV, c_cD), (b_cA, b_cH, b_cV, b_cD)))))
+
+# Interleaved uint8 image read in place, and one of its channels as a strided view
+u8_rgb = (rgb_signal * 255).astype(np.uint8)
+u8_batched = dwt_vectorized.dwt_cpu_batched(u8_rgb, filters, layout='HWC')[:4]
+planar_batched = DWT_vectorized_separable().dwt_cpu_batched(
+    np.moveaxis(u8_rgb, -1, 0).astype(np.float32) / 255, filters)[:4]
+print('batched uint8 HWC same as float32 planes: {}'.format(
+    all(np.allclose(a, b, atol=5e-6) for a, b in zip(planar_batched, u8_batched))))
+strided_coeffs = DWT_tiled_cpu(n_threads=1).dwt_cpu_tiled(u8_rgb[:, :, 1], filters)[:4]
+print('tiled strided channel same as batched: {}'.format(
+    all(np.allclose(a[1], b, atol=5e-6) for a, b in zip(planar_batched, strided_coeffs))))
+
+"""
+3b. Test tiled engine, bit-identical to the vectorized engine whatever the tile shape and thread count
+"""
+for dwt_tiled_cpu in (DWT_tiled_cpu(tile_rows=7, tile_cols=45, n_threads=3), DWT_tiled_cpu()):
+    t_cA, t_cH, t_cV, t_cD, tiled_time = dwt_tiled_cpu.dwt_cpu_tiled(signal, filters)
+    print('tiled ({}, {}) same as vectorized: {}'.format(
+        dwt_tiled_cpu.tile_rows, dwt_tiled_cpu.n_threads,
+        all(np.array_equal(a, b) for a, b in zip((v_cA, v_cH, v_cV, v_cD), (t_cA, t_cH, t_cV, t_cD)))))
+
+# uint8 tiles are read and split into phases in their own dtype
+u8_tiled_workspace = DWT_workspace()
+u8_tiled_coeffs = DWT_tiled_cpu(tile_rows=7, tile_cols=45, n_threads=3).dwt_cpu_tiled(
+    u8_signal, filters, workspace=u8_tiled_workspace)[:4]
+print('tiled uint8 same as vectorized uint8: {}'.format(
+    all(np.array_equal(a, b) for a, b in zip(u8_coeffs, u8_tiled_coeffs))))
+print('tiled uint8 phases stay uint8: {}'.format(
+    all(buf.dtype == (np.uint8 if name.endswith(('buf4', 'buf5')) else np.float32)
+        for group in u8_tiled_workspace.groups.values() for name, buf in group.items() if name.startswith('tile'))))
+
+"""
+3c. Test multiprocess engine, bit-identical to the vectorized engine
+"""
+with DWT_multiprocess_cpu(n_processes=2) as dwt_multiprocess:
+    for i in range(2):
+        m_cA, m_cH, m_cV, m_cD, multiprocess_time = dwt_multiprocess.dwt_cpu_multiprocess(signal, filters)
+        print('multiprocess call {} same as vectorized: {}'.format(
+            i, all(np.array_equal(a, b) for a, b in zip((v_cA, v_cH, v_cV, v_cD), (m_cA, m_cH, m_cV, m_cD)))))
+
+"""
+3d. Test streaming engine on a memory-mapped file with a budget far below the size of the image
+"""
+with tempfile.TemporaryDirectory() as tmpdir:
+    signal.tofile(os.path.join(tmpdir, 'signal.raw'))
+    mapped_signal = open_raw_image(os.path.join(tmpdir, 'signal.raw'), signal.shape)
+    s_cA, s_cH, s_cV, s_cD, streaming_time = DWT_streaming(max_bytes=1 << 20).dwt_cpu_streaming(
+        mapped_signal, filters, out_dir=os.path.join(tmpdir, 'out'))
+    print('streaming same as vectorized: {}'.format(
+        all(np.array_equal(a, b) for a, b in zip((v_cA, v_cH, v_cV, v_cD), (s_cA, s_cH, s_cV, s_cD)))))
+    del mapped_signal, s_cA, s_cH, s_cV, s_cD
+
+"""
+3e. Test non-separable engine: separable banks are routed to the vectorized engine, other banks are compared with a
+direct evaluation of the 2D convolution on a small array
+"""
+dwt_nonseparable_cpu = DWT_nonseparable_cpu()
+n_cA, n_cH, n_cV, n_cD, nonseparable_time = dwt_nonseparable_cpu.dwt_cpu_nonseparable(signal, filter_bank(filters))
+print('non-separable rank-1 bank same as vectorized: {}'.format(
+    all(np.allclose(a, b, atol=5e-7) for a, b in zip((v_cA, v_cH, v_cV, v_cD), (n_cA, n_cH, n_cV, n_cD)))))
+
+small_signal = np.random.rand(40, 33).astype(np.float32)
+bank = filter_bank(filters) + 0.01 * np.random.rand(4, 10, 10).astype(np.float32)
+padded = np.zeros((40 + 20, 33 + 20))
+padded[8:48, 8:41] = small_signal
+windows = np.lib.stride_tricks.sliding_window_view(padded, (10, 10))[::2, ::2][:24, :21]
+n_coeffs = dwt_nonseparable_cpu.dwt_cpu_nonseparable(small_signal, bank)[:4]
+print('non-separable bank same as direct 2D convolution: {}'.format(
+    separable_filters(bank) is None and
+    all(np.allclose(np.einsum('rcyx,yx->rc', windows, f[::-1, ::-1]), c, atol=5e-6) for f, c in zip(bank, n_coeffs))))
+
+"""
+3f. Test FFT engine: the overlap-add path against the serial implementation, and a long filter against the direct path
+"""
+dwt_fft_separable = DWT_fft_separable()
+f_cA, f_cH, f_cV, f_cD, fft_time = dwt_fft_separable.dwt_cpu_fft(signal, filters, method='fft')
+print('fft same as serial: {}'.format(
+    all(np.allclose(a, b, atol=5e-6) for a, b in zip((cA, cH, cV, cD), (f_cA, f_cH, f_cV, f_cD)))))
+
+long_filters = np.random.rand(4, 48).astype(np.float32)
+direct_coeffs = dwt_fft_separable.dwt_cpu_fft(small_signal, long_filters, method='direct')[:4]
+fft_coeffs = dwt_fft_separable.dwt_cpu_fft(small_signal, long_filters, method='fft')[:4]
+print('fft long filter same as direct: {}'.format(
+    all(np.allclose(a, b, rtol=1e-5, atol=1e-5) for a, b in zip(direct_coeffs, fft_coeffs))))
+# Antisymmetric filters go through the folded taps of analysis_pass, checked against the independent FFT path
+antisym_filters = np.array([[0, 1, -3, 0, 3, -1], [1, -2, 0, 2, -1, 0]] * 2, dtype=np.float32)
+folded_coeffs = dwt_fft_separable.dwt_cpu_fft(small_signal, antisym_filters, method='direct')[:4]
+fft_coeffs = dwt_fft_separable.dwt_cpu_fft(small_signal, antisym_filters, method='fft')[:4]
+print('folded antisymmetric filter same as fft: {}'.format(
+    fold_taps(antisym_filters[0]) is not None and
+    all(np.allclose(a, b, atol=1e-5) for a, b in zip(folded_coeffs, fft_coeffs))))
+print('fft selector: {}'.format(not use_fft(10, 1000) and use_fft(64, 1000) and not use_fft(64, 16)))
+
+"""
+4. Test lifting engine with some random array
+"""
+# The lifting steps round differently from the 10-tap convolution, so a slightly larger tolerance is used
+dwt_lift = DWT_lifting()
+l_cA, l_cH, l_cV, l_cD, lifting_time = dwt_lift.dwt_cpu_lifting(signal, filters)
+
+print('\nlifting same as serial c_A: {}'.format(np.allclose(cA, l_cA, atol=5e-6)))
+print('lifting same as serial c_H: {}'.format(np.allclose(cH, l_cH, atol=5e-6)))
+print('lifting same as serial c_V: {}'.format(np.allclose(cV, l_cV, atol=5e-6)))
+print('lifting same as serial c_D: {}'.format(np.allclose(cD, l_cD, atol=5e-6)))
+
+rec_sig = run_iDWT(wav, cA, cH, cV, cD, mode='zero')
+l_rec_sig, lifting_inv_time = dwt_lift.idwt_cpu_lifting(cA, cH, cV, cD)
+print('lifting inverse same as serial: {}'.format(np.allclose(rec_sig, l_rec_sig, atol=5e-6)))
+
+"""
+5. Test vectorized inverse engine with the serial coefficients
+"""
+dwt_inverse = DWT_vectorized_inverse()
+v_rec_sig, inverse_time = dwt_inverse.idwt_cpu_vectorized(cA, cH, cV, cD, filters)
+print('vectorized inverse same as serial: {}'.format(np.allclose(rec_sig, v_rec_sig, atol=5e-6)))
+
+"""
+6. Test multi-level decomposition with some random array
+"""
+level = 4
+ref_coeffs = pywt.wavedec2(signal, wav, mode='zero', level=level)
+ml_coeffs, level_times = DWT_multilevel().wavedec2(signal, filters, level)
+
+print('\nmulti-level same as serial c_A: {}'.format(np.allclose(ref_coeffs[0], ml_coeffs[0], atol=5e-6)))
+for i in range(1, level + 1):
+    print('multi-level same as serial level {} details: {}'.format(
+        level + 1 - i, all(np.allclose(a, b, atol=5e-6) for a, b in zip(ref_coeffs[i], ml_coeffs[i]))))
+
+ml_rec_sig, inv_level_times = DWT_multilevel().waverec2(ml_coeffs, filters)
+print('multi-level inverse same as serial: {}'.format(
+    np.allclose(pywt.waverec2(ref_coeffs, wav, mode='zero'), ml_rec_sig, atol=5e-6)))
+
+"""
+7. Test that a workspace is reused by every CPU engine, repeated calls with the same shape allocate nothing
+"""
+workspace = DWT_workspace()
+for i in range(2):
+    w_cA, w_cH, w_cV, w_cD, _ = dwt_vectorized.dwt_cpu_vectorized_separable(signal, filters, workspace=workspace)
+    dwt_lift.dwt_cpu_lifting(signal, filters, workspace=workspace)
+    dwt_lift.idwt_cpu_lifting(cA, cH, cV, cD, workspace=workspace)
+    w_rec_sig, _ = dwt_inverse.idwt_cpu_vectorized(cA, cH, cV, cD, filters, workspace=workspace)
+    DWT_multilevel().wavedec2(signal, filters, level, workspace=workspace)
+    if i == 0:
+        first_allocations = workspace.stats()['allocations']
+
+print('\nworkspace same as serial c_A: {}'.format(np.allclose(cA, w_cA, atol=5e-7)))
+print('workspace inverse same as serial: {}'.format(np.allclose(rec_sig, w_rec_sig, atol=5e-6)))
+print('workspace no allocation on reuse: {}'.format(workspace.stats()['allocations'] == first_allocations))
+
+"""
+8. Test the timing records returned by the engines, the phases add up to at most the total of the call
+"""
+print('\ntiming phases within total: {}'.format(all(
+    sum(timing.ns.values()) <= timing.total_ns for timing in (vectorized_time, multiprocess_time, streaming_time,
+                                                             lifting_time, lifting_inv_time, serial_time))))
+print('timing compute charged: {}'.format(
+    vectorized_time.compute_time > 0 and streaming_time.seconds('transfer_out') > 0))
+print('timing sum of channels: {}'.format(
+    (tiled_time + fft_time).total_ns == tiled_time.total_ns + fft_time.total_ns and sum([tiled_time]).total_ns ==
+    tiled_time.total_ns))
+
+print('\nSerial time: {}'.format(serial_time.total_time))
+print('Vectorized time: {}'.format(vectorized_time.total_time))
+print('Batched RGB time: {}'.format(batched_time.total_time))
+print('Tiled time: {}'.format(tiled_time.total_time))
+print('Multiprocess time: {}'.format(multiprocess_time.total_time))
+print('Streaming time: {}'.format(streaming_time.total_time))
+print('FFT time: {}'.format(fft_time.total_time))
+print('Lifting time: {}'.format(lifting_time.total_time))
+print('Lifting inverse time: {}'.format(lifting_inv_time.total_time))
+print('Vectorized inverse time: {}'.format(inverse_time.total_time))
+print('Multi-level time per level: {}'.format([timing.total_time for timing in level_times]))
+print('Multi-level inverse time per level: {}'.format([timing.total_time for timing in inv_level_times]))
@@ -0,0 +1,52 @@
+#File to check the decoded data set store on a copy of the smallest square images (no GPU required).
+
+import os
+import shutil
+import tempfile
+import numpy as np
+from dwt_dataset_store import *
+from dwt_image_loader import *
+
+tmpdir = tempfile.mkdtemp()
+root = os.path.join(tmpdir, 'images')
+cache_dir = os.path.join(tmpdir, 'cache')
+shutil.copytree(os.path.join('images', 'square', 'square100'), os.path.join(root, 'square', 'square100'))
+
+# First open decodes the images, the second one only maps the store
+store = DatasetStore(root, cache_dir=cache_dir)
+print('first open builds the store: {}'.format(store.rebuilt))
+store = DatasetStore(root, cache_dir=cache_dir)
+print('second open reuses the store: {}'.format(not store.rebuilt))
+
+# The views of the store hold the same pixels as the decoded files, without copying
+same = [a[:3] == b[:3] and np.array_equal(a[3], b[3]) for a, b in zip(store.iter_images(), iter_images(root))]
+print('store same as decoded images: {}'.format(len(same) == len(store.entries) and all(same)))
+print('images are views of the store: {}'.format(np.shares_memory(store.image(store.entries[0]), store.data)))
+print('select by size: {}'.format(len(store.select('square', 100)) == len(store.entries) and
+                                  len(store.select(size=200)) == 0))
+
+# Modifying a source file rebuilds the store
+path = os.path.join(root, 'square', 'square100', store.entries[0]['filename'])
+st = os.stat(path)
+os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1))
+rebuilt = DatasetStore(root, cache_dir=cache_dir)
+print('changed source rebuilds the store: {}'.format(rebuilt.rebuilt))
+print('rebuild leaves only the indexed data file: {}'.format(
+    [f for f in os.listdir(cache_dir) if f.endswith('.u8')] == [os.path.basename(rebuilt.data_path)]))
+
+# A build failing on an image leaves the previous store and no temporary file
+import dwt_dataset_store
+def failing_iter_images(*args, **kwargs):
+    raise OSError('corrupt image')
+dwt_dataset_store.iter_images, loader_iter_images = failing_iter_images, dwt_dataset_store.iter_images
+os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 2))
+try:
+    DatasetStore(root, cache_dir=cache_dir)
+    failed = False
+except OSError:
+    failed = True
+dwt_dataset_store.iter_images = loader_iter_images
+print('failed build removes its temporary files: {}'.format(
+    failed and not [f for f in os.listdir(cache_dir) if f.endswith('.tmp')] and os.path.exists(rebuilt.data_path)))
+
+shutil.rmtree(tmpdir)
@@ -0,0 +1,56 @@
+#File to check that every CPU backend of dwt2 returns the pywavelets coefficients and the cost model (no GPU required).
+
+import os
+import tempfile
+import numpy as np
+from dwt_autotune import *
+from dwt_dispatch import *
+from dwt_serial import *
+
+wav = gen_wavelet()
+signal = np.random.rand(100, 120).astype(np.float32)
+ref = run_DWT(signal, wav)[:4]
+backends = [backend for backend in available_backends() if backend != 'cuda']
+
+# Same coefficients whatever the backend and the form of the wavelet
+for backend in backends:
+    for wavelet in (wav, np.array(wav.filter_bank, dtype=np.float32)):
+        out = dwt2(signal, wavelet, backend)
+        print('{} same as serial: {}'.format(backend, all(np.allclose(a, b, atol=5e-6) for a, b in zip(out[:4], ref))))
+
+rgb_signal = (np.random.rand(64, 80, 3) * 255).astype(np.uint8)
+outs = {backend: dwt2(rgb_signal, 'db2', backend) for backend in backends}
+for backend in backends:
+    print('{} color image: {}'.format(backend, outs[backend][0].shape == (3, 33, 41) and all(
+        np.allclose(a, b, atol=5e-6) for a, b in zip(outs[backend][:4], outs['pywt'][:4]))))
+
+# Small tiles stay in process, other modes only go to the backends supporting them
+print('small tile in process: {}'.format(choose_backend((100, 100)) in ('pywt', 'vectorized')))
+print('symmetric mode: {}'.format(choose_backend((4096, 4096), mode='symmetric') in MODE_BACKENDS))
+
+# A CUDA device that fails to open is dropped and the next cheapest backend is used
+import dwt_dispatch
+
+
+def failing_context():
+    raise RuntimeError('cuInit failed')
+
+
+saved = dwt_dispatch._cuda_available, dwt_dispatch.cuda_context
+dwt_dispatch.cuda_context = failing_context
+dwt_dispatch._cuda_available = True
+big_signal = np.random.rand(512, 512).astype(np.float32)
+picked = choose_backend(big_signal.shape)
+out = dwt2(big_signal, wav)
+print('failed CUDA context falls back: {}'.format(picked == 'cuda' and out[4].name != 'gpu_tiled' and
+                                                  'cuda' not in available_backends()))
+dwt_dispatch._cuda_available, dwt_dispatch.cuda_context = saved
+
+# Calibrated costs replace the defaults
+with tempfile.TemporaryDirectory() as tmpdir:
+    set_default_tuning(DWT_tuning(os.path.join(tmpdir, 'tuning.json')))
+    costs = calibrate(['pywt', 'vectorized'], shapes=((32, 32), (256, 256)), warmup=0, trials=1)
+    print('calibrated costs: {}'.format(backend_costs('vectorized') == costs['vectorized'] and
+                                        DWT_tuning(default_tuning().path).lookup('dwt2:pywt', None, None) ==
+                                        costs['pywt']))
+    set_default_tuning(None)
@@ -0,0 +1,57 @@
+#File to check the metrics registry updated by the CPU engines (no GPU required).
+
+import json
+import os
+import tempfile
+import numpy as np
+from dwt_metrics import *
+from dwt_serial import *
+from dwt_vectorized_separable import *
+from dwt_vectorized_inverse import *
+from dwt_nonseparable_cpu import *
+from dwt_workspace import *
+
+signal = np.random.rand(120, 90).astype(np.float32)
+filters = np.array(gen_wavelet().filter_bank, dtype=np.float32)
+registry.reset()
+
+# Three calls with one workspace: the first allocates, the next two only reuse the buffers
+workspace = DWT_workspace()
+for i in range(3):
+    cA, cH, cV, cD, timing = DWT_vectorized_separable().dwt_cpu_vectorized_separable(signal, filters,
+                                                                                    workspace=workspace)
+totals = registry.snapshot()['vectorized']
+print('calls counted: {}'.format(totals['calls'] == 3))
+print('pixels and bytes counted: {}'.format(totals['pixels'] == 3 * signal.size and
+                                            totals['bytes_read'] == 3 * signal.nbytes and
+                                            totals['bytes_written'] == 3 * 4 * cA.nbytes))
+print('multiply-adds estimated: {}'.format(
+    totals['multiply_adds'] == 3 * forward_multiply_adds(120, cA.shape[0], cA.shape[1], filters.shape[1])))
+print('allocations then cache hits: {}'.format(totals['allocations'] == workspace.allocations and
+                                                totals['cache_hits'] == workspace.hits > 0))
+
+# A separable bank is counted once, under the engine it is routed to
+DWT_nonseparable_cpu().dwt_cpu_nonseparable(signal, filter_bank(filters))
+run_DWT(signal, gen_wavelet())
+DWT_vectorized_inverse().idwt_cpu_vectorized(cA, cH, cV, cD, filters)
+snapshot = registry.snapshot()
+print('engines counted separately: {}'.format(
+    snapshot['vectorized']['calls'] == 4 and 'nonseparable_cpu' not in snapshot and
+    snapshot['serial']['calls'] == 1 and snapshot['vectorized_inverse']['calls'] == 1))
+
+# The lifting engine counts its predict and update steps, fewer than the taps of the convolution
+from dwt_lifting import *
+l_cA = DWT_lifting().dwt_cpu_lifting(signal, filters)[0]
+lifting_totals = registry.snapshot()['lifting']
+print('lifting multiply-adds estimated: {}'.format(
+    lifting_totals['multiply_adds'] == lifting_multiply_adds(120, l_cA.shape[0], l_cA.shape[1], 4) <
+    forward_multiply_adds(120, l_cA.shape[0], l_cA.shape[1], filters.shape[1])))
+snapshot = registry.snapshot()
+# Dumps in both formats
+with tempfile.TemporaryDirectory() as tmpdir:
+    registry.dump(os.path.join(tmpdir, 'metrics.json'))
+    registry.dump(os.path.join(tmpdir, 'metrics.prom'))
+    with open(os.path.join(tmpdir, 'metrics.json')) as f:
+        print('JSON dump: {}'.format(json.load(f) == snapshot))
+    with open(os.path.join(tmpdir, 'metrics.prom')) as f:
+        print('Prometheus dump: {}'.format('dwt_calls_total{engine="vectorized"} 4\n' in f.read()))
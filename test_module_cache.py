@@ -0,0 +1,60 @@
+#File to check the compiled-module cache of the CUDA engines with a fake compiler (no GPU required).
+
+import shutil
+import tempfile
+from dwt_module_cache import *
+
+
+class FakeCompiler:
+    # Stands in for nvcc: the "binary" is the formatted source, and loading returns it unchanged
+    def __init__(self):
+        self.n_compiled = 0
+
+    def target(self):
+        return 'fake'
+
+    def compile(self, source):
+        self.n_compiled += 1
+        return source.encode('utf-8')
+
+    def load(self, cubin):
+        return cubin.decode('utf-8')
+
+
+source = """
+__global__ void w_kernel(float* input, int H, int W){
+    #define O_TILE_WIDTH %(T)s
+    #define maskwidth %(M)s
+}
+"""
+
+cache_dir = tempfile.mkdtemp()
+try:
+    """
+    1. Repeated calls with the same maskwidth and tile width only compile once
+    """
+    compiler = FakeCompiler()
+    cache = KernelModuleCache(compiler, cache_dir)
+    for _ in range(5):
+        module = cache.get_module(source, 10, 12)
+    print('module formatted with maskwidth and tile width: {}'.format('maskwidth 10' in module and
+                                                                      'O_TILE_WIDTH 12' in module))
+    print('steady-state calls never compile: {}'.format(cache.stats() == {'hits': 4, 'disk_hits': 0, 'misses': 1}))
+
+    """
+    2. A different tile width is a different module
+    """
+    cache.get_module(source, 10, 4)
+    print('new tile width compiles: {}'.format(compiler.n_compiled == 2))
+
+    """
+    3. A new cache (e.g. a new process) loads the binaries from disk instead of compiling
+    """
+    compiler_2 = FakeCompiler()
+    cache_2 = KernelModuleCache(compiler_2, cache_dir)
+    cache_2.get_module(source, 10, 12)
+    cache_2.get_module(source, 10, 4)
+    print('disk cache hit without compiling: {}'.format(compiler_2.n_compiled == 0 and
+                                                        cache_2.stats()['disk_hits'] == 2))
+finally:
+    shutil.rmtree(cache_dir)
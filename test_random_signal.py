@@ -7,6 +7,7 @@ from dwt_serial import *
 from dwt_naive_separable_parallel import *
 from dwt_tiled_separable_parallel import *
 from dwt_nonseparable_parallel import *
+from dwt_tiled_cpu import *
 
 
 BLOCK_WIDTH = 32
@@ -64,6 +65,13 @@ Test nonseparable parallel kernel with some random array
 dwt_nonseparable = DWT_nonseparable()
 h_cAo, h_cHo, h_cVo, h_cDo, kernel_time_o = dwt_nonseparable.dwt_gpu_nonseparable(signal, filters, BLOCK_WIDTH)
 
+"""
+Test tiled CPU engine with some random array
+"""
+# Cache-blocked CPU counterpart of the tiled kernel, with the tiles spread across all cores
+dwt_tiled_cpu = DWT_tiled_cpu()
+h_cA_cpu, h_cH_cpu, h_cV_cpu, h_cD_cpu, cpu_time_tiled = dwt_tiled_cpu.dwt_cpu_tiled(signal, filters)
+
 print('naive same as serial c_A: {}'.format(np.allclose(cA, h_cA, atol=5e-7)))
 print('naive same as serial c_H: {}'.format(np.allclose(cH, h_cH, atol=5e-7)))
 print('naive same as serial c_V: {}'.format(np.allclose(cV, h_cV, atol=5e-7)))
@@ -74,12 +82,18 @@ print('tiled same as serial c_H: {}'.format(np.allclose(cH, h_cH_tiled, atol=5e-
 print('tiled same as serial c_V: {}'.format(np.allclose(cV, h_cV_tiled, atol=5e-7)))
 print('tiled same as serial c_D: {}'.format(np.allclose(cD, h_cD_tiled, atol=5e-7)))
 
+print('\ntiled CPU same as serial c_A: {}'.format(np.allclose(cA, h_cA_cpu, atol=5e-7)))
+print('tiled CPU same as serial c_H: {}'.format(np.allclose(cH, h_cH_cpu, atol=5e-7)))
+print('tiled CPU same as serial c_V: {}'.format(np.allclose(cV, h_cV_cpu, atol=5e-7)))
+print('tiled CPU same as serial c_D: {}'.format(np.allclose(cD, h_cD_cpu, atol=5e-7)))
+
 print('\nNon-separable same as serial c_A: {}'.format(np.allclose(cA, h_cAo, atol=5e-7)))
 print('Non-separable same as serial c_H: {}'.format(np.allclose(cH, h_cHo, atol=5e-7)))
 print('Non-separable same as serial c_V: {}'.format(np.allclose(cV, h_cVo, atol=5e-7)))
 print('Non-separable same as serial c_D: {}'.format(np.allclose(cD, h_cDo, atol=5e-7)))
 
-print('\nSerial time: {}'.format(serial_time))
-print('Parallel time: {}'.format(kernel_time))
-print('Tiled parallel time: {}'.format(kernel_time_tiled))
-print('Non-separable parallel time: {}'.format(kernel_time_o))
+print('\nSerial time: {}'.format(serial_time.total_time))
+print('Parallel time: {}'.format(kernel_time.total_time))
+print('Tiled parallel time: {}'.format(kernel_time_tiled.total_time))
+print('Non-separable parallel time: {}'.format(kernel_time_o.total_time))
+print('Tiled CPU time ({} threads): {}'.format(dwt_tiled_cpu.n_threads, cpu_time_tiled.total_time))
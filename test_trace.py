@@ -0,0 +1,46 @@
+#File to check the Chrome trace hooks of the engines on a random 2D signal (no GPU required).
+
+import json
+import os
+import tempfile
+import numpy as np
+import dwt_trace
+from dwt_serial import *
+from dwt_vectorized_separable import *
+from dwt_tiled_cpu import *
+from dwt_multiprocess_cpu import *
+
+signal = np.random.rand(600, 500).astype(np.float32)
+filters = np.array(gen_wavelet().filter_bank, dtype=np.float32)
+
+# Tracing is off by default and the hooks record nothing
+DWT_vectorized_separable().dwt_cpu_vectorized_separable(signal, filters)
+print('tracing off by default: {}'.format(dwt_trace.tracer is None and
+                                           dwt_trace.span('x') is dwt_trace.span('y')))
+
+tracer = dwt_trace.start_tracing()
+DWT_vectorized_separable().dwt_cpu_vectorized_separable(signal, filters)
+DWT_tiled_cpu(tile_rows=32, n_threads=2).dwt_cpu_tiled(signal, filters)
+with DWT_multiprocess_cpu(n_processes=2) as dwt_multiprocess:
+    dwt_multiprocess.dwt_cpu_multiprocess(signal, filters)
+with tempfile.TemporaryDirectory() as tmpdir:
+    path = os.path.join(tmpdir, 'trace.json')
+    dwt_trace.stop_tracing(path)
+    with open(path) as f:
+        events = json.load(f)['traceEvents']
+
+# The phases of a call are nested inside the event of the call
+call = [e for e in events if e['name'] == 'vectorized'][0]
+phases = [e for e in events if e.get('cat') == 'vectorized']
+print('engine phases traced: {}'.format(
+    {e['name'] for e in phases} == {'setup', 'alloc', 'compute'} and
+    all(call['ts'] <= e['ts'] and e['ts'] + e['dur'] <= call['ts'] + call['dur'] + 1 for e in phases)))
+
+# The threads of the tiled engine and the processes of the multiprocess engine get their own lanes
+main_tid = call['tid']
+print('tiled threads on separate lanes: {}'.format(
+    all(e['tid'] != main_tid for e in events if e['name'] == 'tiles')))
+print('worker processes on separate lanes: {}'.format(
+    all(e['pid'] != os.getpid() for e in events if e['name'] == 'strip') and
+    len([e for e in events if e['name'] == 'strip']) > 0))
+print('tracing off after stop: {}'.format(dwt_trace.tracer is None))